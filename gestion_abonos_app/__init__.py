@@ -2,18 +2,16 @@ from __future__ import annotations
 
 from datetime import timedelta
 
-import os
 import secrets
-import threading
-import time
 
-from flask import Flask, g, session
+from flask import Flask, g
 
-from . import config, db, filters, utils
+from . import cli, config, db, filters, instrumentation, metrics, utils
 from .blueprints.home import home_bp
+from .blueprints.metrics import metrics_bp
 from .blueprints.resources import resources_bp
-from .auth import auth_bp, init_auth_hooks
-from .services.matches import sync_upcoming_matches
+from .auth import auth_bp, csrf_token, init_auth_hooks
+from .services import scheduler
 
 
 def create_app() -> Flask:
@@ -33,29 +31,19 @@ def create_app() -> Flask:
     )
 
     db.init_db()
+    db.init_app(app)
+    cli.init_app(app)
+    instrumentation.init_app(app)
+    metrics.init_app(app)
     filters.register_filters(app)
 
     app.register_blueprint(home_bp)
     app.register_blueprint(resources_bp)
     app.register_blueprint(auth_bp)
+    app.register_blueprint(metrics_bp)
     init_auth_hooks(app)
 
-    if config.ENABLE_BG_SYNC:
-        def _sync_loop():
-            try:
-                sync_upcoming_matches(force=True)
-            except Exception:
-                pass
-            while True:
-                try:
-                    sync_upcoming_matches(force=False)
-                except Exception:
-                    pass
-                time.sleep(config.SYNC_INTERVAL_MINUTES * 60)
-
-        if not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-            thread = threading.Thread(target=_sync_loop, daemon=True)
-            thread.start()
+    scheduler.init_app(app)
 
     @app.context_processor
     def inject_globals():
@@ -65,7 +53,7 @@ def create_app() -> Flask:
             "format_parking": utils.format_parking,
             "competition_theme": utils.competition_theme,
             "current_user": getattr(g, "current_user", None),
-            "csrf_token": lambda: getattr(g, "csrf_token", None) or session.get("csrf_token"),
+            "csrf_token": csrf_token,
         }
 
     return app
@@ -1,3 +1,3 @@
-from .routes import auth_bp, init_auth_hooks
+from .routes import auth_bp, csrf_token, init_auth_hooks
 
-__all__ = ["auth_bp", "init_auth_hooks"]
+__all__ = ["auth_bp", "csrf_token", "init_auth_hooks"]
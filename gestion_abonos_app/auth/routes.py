@@ -19,19 +19,25 @@ from flask import (
     url_for,
 )
 
-from .. import config, db
-from .security import hash_password, verify_password
+from .. import cache, config, db, metrics, ratelimit
+from .security import HasherBusy, hash_password, needs_rehash, verify_password
 
 auth_bp = Blueprint("auth", __name__)
 
 LOGIN_EXEMPT = {
     "auth.login",
     "auth.logout",
+    "metrics.metrics_endpoint",
     "static",
 }
 
-_login_attempts = {}
-_post_attempts = {}
+_login_limiter = ratelimit.RateLimiter("login", config.MAX_LOGIN_ATTEMPTS, config.LOGIN_WINDOW_SECONDS)
+_post_limiter = ratelimit.RateLimiter(
+    "post", config.POST_RATE_LIMIT_COUNT, config.POST_RATE_LIMIT_WINDOW_SECONDS
+)
+
+# Usuario de la sesión por proceso; las escrituras en usuarios invalidan "usuarios:<username>".
+_USER_CACHE = cache.LRUCache("usuarios", max_entries=256, ttl=config.USER_CACHE_TTL_SECONDS)
 
 
 def _is_safe_url(target: str) -> bool:
@@ -43,14 +49,21 @@ def _is_safe_url(target: str) -> bool:
 
 
 def _get_user_by(value):
-    conn = db.get_connection()
+    conn = db.get_db()
     user = conn.execute(
         "SELECT * FROM usuarios WHERE username = ?", (value,)
     ).fetchone()
-    conn.close()
     return user
 
 
+def _get_cached_user(username):
+    return _USER_CACHE.get_or_set(
+        username,
+        lambda: _get_user_by(username),
+        tags=(cache.scoped_tag("usuarios", username),),
+    )
+
+
 def _require_admin():
     user = g.get("current_user")
     if not user or user["role"] != "admin":
@@ -65,34 +78,11 @@ def _ensure_login():
 
 
 def _check_rate_limit():
-    ip = request.remote_addr or "unknown"
-    now = time.time()
-    bucket = _login_attempts.setdefault(ip, [])
-    bucket[:] = [ts for ts in bucket if now - ts < config.LOGIN_WINDOW_SECONDS]
-    if len(bucket) >= config.MAX_LOGIN_ATTEMPTS:
-        wait = max(0, int(config.LOGIN_WINDOW_SECONDS - (now - bucket[0])))
-        return False, wait
-    bucket.append(now)
-    return True, None
+    return _login_limiter.hit(request.remote_addr or "unknown")
 
 
 def _check_post_rate_limit():
-    ip = request.remote_addr or "unknown"
-    now = time.time()
-    bucket = _post_attempts.setdefault(ip, [])
-    bucket[:] = [
-        ts
-        for ts in bucket
-        if now - ts < config.POST_RATE_LIMIT_WINDOW_SECONDS
-    ]
-    if len(bucket) >= config.POST_RATE_LIMIT_COUNT:
-        wait = max(
-            0,
-            int(config.POST_RATE_LIMIT_WINDOW_SECONDS - (now - bucket[0])),
-        )
-        return False, wait
-    bucket.append(now)
-    return True, None
+    return _post_limiter.hit(request.remote_addr or "unknown")
 
 
 def _generate_csrf():
@@ -119,6 +109,7 @@ def login():
     if request.method == "POST":
         allowed, wait_seconds = _check_rate_limit()
         if not allowed:
+            metrics.RATE_LIMIT_REJECTIONS.inc(limiter="login")
             flash("Demasiados intentos. Espera unos minutos e intentalo de nuevo.", "danger")
             return render_template("login.html", wait_seconds=wait_seconds)
         username = request.form.get("username", "").strip()
@@ -127,6 +118,8 @@ def login():
         if not user or not verify_password(password, user["password_hash"], user["salt"]):
             flash("Credenciales invalidas.", "danger")
         else:
+            if needs_rehash(user["password_hash"]):
+                _rehash(user["username"], password)
             session.clear()
             session["username"] = user["username"]
             session["role"] = user["role"]
@@ -142,6 +135,38 @@ def login():
     return render_template("login.html", wait_seconds=wait_seconds)
 
 
+def _rehash(username: str, password: str) -> None:
+    # Migra hashes antiguos o con otras iteraciones aprovechando que tenemos la contraseña.
+    try:
+        password_hash, salt = hash_password(password)
+    except HasherBusy:
+        return
+    conn = db.get_db()
+    conn.execute(
+        "UPDATE usuarios SET password_hash = ?, salt = ? WHERE username = ?",
+        (password_hash, salt, username),
+    )
+    conn.commit()
+
+
+_BUSY_TEMPLATES = {
+    "auth.login": "login.html",
+    "auth.insertar_usuario": "insertar_usuario.html",
+    "auth.cambiar_contrasena": "cambiar_contrasena.html",
+}
+
+
+@auth_bp.app_errorhandler(HasherBusy)
+def hasher_busy(_exc):
+    metrics.RATE_LIMIT_REJECTIONS.inc(limiter="password_hash")
+    flash("El servidor está ocupado. Inténtalo de nuevo en unos segundos.", "warning")
+    template = _BUSY_TEMPLATES.get(request.endpoint)
+    body = render_template(template, wait_seconds=None) if template else "Servidor ocupado"
+    response = make_response(body, 503)
+    response.headers["Retry-After"] = "2"
+    return response
+
+
 @auth_bp.route("/logout", methods=["POST"])
 def logout():
     _validate_csrf()
@@ -167,7 +192,7 @@ def insertar_usuario():
             flash("Ya existe un usuario con ese nombre.", "warning")
         else:
             password_hash, salt = hash_password(password)
-            conn = db.get_connection()
+            conn = db.get_db()
             conn.execute(
                 """
                 INSERT INTO usuarios (username, password_hash, salt, role)
@@ -176,7 +201,6 @@ def insertar_usuario():
                 (username, password_hash, salt, role),
             )
             conn.commit()
-            conn.close()
             flash("Usuario creado correctamente.", "success")
             return redirect(url_for("home.home_page"))
 
@@ -201,85 +225,99 @@ def cambiar_contrasena():
             flash("La nueva contraseña debe tener al menos 8 caracteres.", "warning")
         else:
             nuevo_hash, nuevo_salt = hash_password(nueva)
-            conn = db.get_connection()
+            conn = db.get_db()
             conn.execute(
                 "UPDATE usuarios SET password_hash = ?, salt = ? WHERE username = ?",
                 (nuevo_hash, nuevo_salt, user["username"]),
             )
             conn.commit()
-            conn.close()
             flash("Contraseña actualizada correctamente.", "success")
             return redirect(url_for("home.home_page"))
 
     return render_template("cambiar_contrasena.html")
 
 
-def init_auth_hooks(app):
-    @app.before_request
-    def enforce_post_rate_limit():
-        if request.method != "POST":
-            return
-        endpoint = request.endpoint or ""
-        if endpoint.startswith("static"):
-            return
-        allowed, wait = _check_post_rate_limit()
-        if allowed:
-            return
-        flash(
-            f"Demasiadas peticiones. Intentalo en {wait} segundos.",
-            "warning",
+# Clasificación de endpoints para el middleware de autenticación.
+_SKIP = "skip"  # estáticos y métricas: ni sesión ni base de datos
+_LOGIN = "login"  # sin usuario ni CSRF, pero con límite de POST
+_PUBLIC = "public"  # usuario cargado si lo hay, sin exigir sesión
+_PROTECTED = "protected"
+
+_SKIP_ENDPOINTS = {"static", "metrics.metrics_endpoint"}
+
+
+def _classify(endpoint):
+    if endpoint is None or endpoint in _SKIP_ENDPOINTS or endpoint.endswith(".static"):
+        return _SKIP
+    if endpoint == "auth.login":
+        return _LOGIN
+    if endpoint in LOGIN_EXEMPT:
+        return _PUBLIC
+    return _PROTECTED
+
+
+def _reject_post(endpoint, wait):
+    metrics.RATE_LIMIT_REJECTIONS.inc(limiter="post")
+    flash(
+        f"Demasiadas peticiones. Intentalo en {wait} segundos.",
+        "warning",
+    )
+    if endpoint == "auth.login":
+        return make_response(
+            render_template("login.html", wait_seconds=wait),
+            429,
         )
-        if endpoint == "auth.login":
-            return make_response(
-                render_template("login.html", wait_seconds=wait),
-                429,
-            )
-        target = request.referrer or url_for("home.home_page")
-        return make_response(redirect(target), 429)
+    target = request.referrer or url_for("home.home_page")
+    return make_response(redirect(target), 429)
 
-    @app.before_request
-    def load_logged_in_user():
-        endpoint = request.endpoint or ""
-        if endpoint.startswith("static"):
-            g.current_user = None
-            return
-        if endpoint == "auth.login":
-            g.current_user = None
-            return
-        instance_id = current_app.config.get("SERVER_INSTANCE_ID")
-        if session.get("server_instance") != instance_id:
+
+def _load_session_user():
+    # Solo se escribe en la sesión si algo cambia; si no, la respuesta no lleva Set-Cookie.
+    instance_id = current_app.config.get("SERVER_INSTANCE_ID")
+    if session.get("server_instance") != instance_id:
+        if session:
             session.clear()
-            g.current_user = None
-            return
-        username = session.get("username")
-        role = session.get("role")
-        login_ts = session.get("login_ts")
-        if login_ts is not None:
-            if time.time() - login_ts > config.SESSION_MAX_AGE_SECONDS:
-                session.clear()
-                g.current_user = None
-                return
-        g.current_user = _get_user_by(username) if username else None
-        if g.current_user:
-            session["role"] = g.current_user["role"]
+        return None
+    username = session.get("username")
+    if not username:
+        return None
+    login_ts = session.get("login_ts")
+    if login_ts is not None and time.time() - login_ts > config.SESSION_MAX_AGE_SECONDS:
+        session.clear()
+        return None
+    user = _get_cached_user(username)
+    if user and session.get("role") != user["role"]:
+        session["role"] = user["role"]
+    return user
 
-    @app.before_request
-    def enforce_csrf():
-        _generate_csrf()
-        if request.method == "POST":
-            if (request.endpoint or "").startswith("static"):
-                return
-            if (request.endpoint or "") == "auth.login":
-                return
-            _validate_csrf()
+
+def csrf_token():
+    """Token CSRF para las plantillas; se crea la primera vez que un formulario lo pide."""
+    return _generate_csrf()
+
+
+def init_auth_hooks(app):
+    # Con la caducidad controlada por login_ts no hace falta reenviar la cookie en cada respuesta.
+    app.config["SESSION_REFRESH_EACH_REQUEST"] = False
 
     @app.before_request
-    def enforce_login():
-        endpoint = request.endpoint or ""
-        if endpoint.startswith("static"):
-            return
-        if endpoint in LOGIN_EXEMPT:
-            return
-        if g.get("current_user") is None:
+    def authenticate():
+        endpoint = request.endpoint
+        kind = _classify(endpoint)
+        g.current_user = None
+        if kind == _SKIP:
+            return None
+
+        if request.method == "POST":
+            allowed, wait = _check_post_rate_limit()
+            if not allowed:
+                return _reject_post(endpoint, wait)
+        if kind == _LOGIN:
+            return None
+
+        g.current_user = _load_session_user()
+        _validate_csrf()
+        if kind == _PROTECTED and g.current_user is None:
             next_param = request.url if request.method == "GET" else None
             return redirect(url_for("auth.login", next=next_param))
+        return None
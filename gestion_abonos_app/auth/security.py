@@ -1,45 +1,141 @@
 from __future__ import annotations
 
 import base64
+import hmac
+import logging
+import multiprocessing
 import os
-from typing import Tuple
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
 
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
-PBKDF2_ITERATIONS = 600000
+from .. import config
 
+logger = logging.getLogger(__name__)
 
-def _derive(password: str, salt: bytes) -> bytes:
+# Hashes antiguos: solo la clave en base64, siempre con estas iteraciones.
+LEGACY_ITERATIONS = 600000
+PBKDF2_ITERATIONS = config.PASSWORD_HASH_ITERATIONS
+_SCHEME = "pbkdf2_sha256"
+
+
+class HasherBusy(RuntimeError):
+    """El pool de hashing está saturado; la petición debe reintentarse más tarde."""
+
+
+def _derive(password: str, salt: bytes, iterations: int) -> bytes:
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
         salt=salt,
-        iterations=PBKDF2_ITERATIONS,
+        iterations=iterations,
     )
     return kdf.derive(password.encode("utf-8"))
 
 
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(
+    max(config.PASSWORD_HASH_WORKERS, 1) + config.PASSWORD_HASH_QUEUE
+)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # "spawn": el proceso web tiene hilos y un fork podría heredar locks tomados.
+            _pool = ProcessPoolExecutor(
+                max_workers=config.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit_derive(password: str, salt: bytes, iterations: int) -> bytes:
+    if not _slots.acquire(blocking=False):
+        raise HasherBusy("Demasiadas operaciones de contraseña en curso")
+    pool = _get_pool()
+    try:
+        future = pool.submit(_derive, password, salt, iterations)
+    except BrokenProcessPool:
+        _slots.release()
+        _discard_pool(pool)
+        raise
+    except BaseException:
+        _slots.release()
+        raise
+    # El hueco se libera cuando el trabajo termina (o se cancela de verdad), no al dejar de
+    # esperarlo: un PBKDF2 abandonado sigue ocupando un proceso del pool.
+    future.add_done_callback(lambda _future: _slots.release())
+    try:
+        return future.result(timeout=config.PASSWORD_HASH_TIMEOUT_SECONDS)
+    except FutureTimeoutError as exc:
+        future.cancel()
+        raise HasherBusy("El cálculo de la contraseña ha tardado demasiado") from exc
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+
+
+def _run_derive(password: str, salt: bytes, iterations: int) -> bytes:
+    if config.PASSWORD_HASH_WORKERS <= 0:
+        return _derive(password, salt, iterations)
+    try:
+        return _submit_derive(password, salt, iterations)
+    except BrokenProcessPool:
+        # Un proceso del pool ha muerto (OOM, señal): se reintenta una vez con un pool nuevo.
+        logger.warning("Pool de hashing roto; se crea uno nuevo")
+    try:
+        return _submit_derive(password, salt, iterations)
+    except BrokenProcessPool as exc:
+        raise HasherBusy("El pool de hashing no está disponible") from exc
+
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("utf-8")
+
+
+def _parse(password_hash: str) -> Tuple[int, str]:
+    if password_hash.startswith(f"{_SCHEME}$"):
+        _scheme, iterations, key = password_hash.split("$", 2)
+        return int(iterations), key
+    return LEGACY_ITERATIONS, password_hash
+
+
 def hash_password(password: str) -> Tuple[str, str]:
     salt = os.urandom(16)
-    key = _derive(password, salt)
-    return (
-        base64.urlsafe_b64encode(key).decode("utf-8"),
-        base64.urlsafe_b64encode(salt).decode("utf-8"),
-    )
+    key = _run_derive(password, salt, PBKDF2_ITERATIONS)
+    return f"{_SCHEME}${PBKDF2_ITERATIONS}${_encode(key)}", _encode(salt)
 
 
 def verify_password(password: str, password_hash: str, salt: str) -> bool:
     try:
+        iterations, key = _parse(password_hash)
         salt_bytes = base64.urlsafe_b64decode(salt)
-        expected_hash = base64.urlsafe_b64decode(password_hash)
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt_bytes,
-            iterations=PBKDF2_ITERATIONS,
-        )
-        kdf.verify(password.encode("utf-8"), expected_hash)
-        return True
-    except Exception:
+        expected_hash = base64.urlsafe_b64decode(key)
+    except (ValueError, TypeError):
         return False
+    return hmac.compare_digest(_run_derive(password, salt_bytes, iterations), expected_hash)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    if not password_hash.startswith(f"{_SCHEME}$"):
+        return True
+    try:
+        iterations, _key = _parse(password_hash)
+    except ValueError:
+        return True
+    return iterations != PBKDF2_ITERATIONS
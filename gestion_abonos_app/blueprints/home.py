@@ -1,10 +1,9 @@
 from __future__ import annotations
 
-import time
-
 from flask import (
     Blueprint,
     abort,
+    current_app,
     flash,
     g,
     make_response,
@@ -15,86 +14,92 @@ from flask import (
 )
 from sqlalchemy.exc import IntegrityError
 
-from .. import config, db
+from .. import conditional, config, db
 from .. import cache
-from ..services.matches import sync_upcoming_matches
-
-_HOME_MATCHES_CACHE = {"ts": 0.0, "rows": [], "version": -1}
-_HOME_MATCHES_TTL = 30.0
-_PARTIDO_DETALLE_CACHE = {"items": {}, "version": -1}
-_PARTIDO_DETALLE_TTL = 15.0
-_CLIENTES_OPTIONS_CACHE = {"ts": 0.0, "rows": [], "version": -1}
-_CLIENTES_OPTIONS_TTL = 60.0
-_PARTIDO_CACHE = {"items": {}, "version": -1}
-_PARTIDO_TTL = 60.0
-_ASIGNAR_CACHE = {"items": {}, "version": -1}
-_ASIGNAR_TTL = 15.0
+from ..services import availability, occupancy
 from ..utils import format_abono, format_parking, normalize_text
 
+_HOME_MATCHES_CACHE = cache.LRUCache("home_matches", max_entries=1, ttl=30.0)
+_PARTIDO_DETALLE_CACHE = cache.LRUCache("partido_detalle", max_entries=64, ttl=15.0)
+_CLIENTES_OPTIONS_CACHE = cache.LRUCache("home_clientes_options", max_entries=1, ttl=60.0)
+_PARTIDO_CACHE = cache.LRUCache("partido", max_entries=256, ttl=60.0)
+_ASIGNAR_CACHE = cache.LRUCache("asignar", max_entries=512, ttl=15.0)
+_HOME_MATCHES_TAGS = ("partidos", "disponibilidad_partidos", "totales_recursos")
+
 home_bp = Blueprint("home", __name__)
 
 
+def _in_app_context(loader):
+    # Los refrescos en segundo plano necesitan su propio contexto (y su propia conexión).
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            return loader()
+
+    return run
+
+
 def _partido_or_404(partido_id: int):
-    now_ts = time.time()
-    cache_version = cache.cache_version("partidos")
-    if _PARTIDO_CACHE["version"] != cache_version:
-        _PARTIDO_CACHE["items"].clear()
-        _PARTIDO_CACHE["version"] = cache_version
-    entry = _PARTIDO_CACHE["items"].get(partido_id)
-    if entry and now_ts - entry["ts"] <= _PARTIDO_TTL:
-        return entry["row"]
-
-    conn = db.get_connection()
+    return _PARTIDO_CACHE.get_or_set(
+        partido_id,
+        lambda: _load_partido(partido_id),
+        tags=(cache.scoped_tag("partidos", partido_id),),
+    )
+
+
+def _load_partido(partido_id: int):
+    conn = db.get_db()
     partido = conn.execute(
         "SELECT * FROM partidos WHERE id = ?", (partido_id,)
     ).fetchone()
-    conn.close()
     if partido is None:
         abort(404)
-    _PARTIDO_CACHE["items"][partido_id] = {"ts": now_ts, "row": partido}
     return partido
 
 
 def _clientes_options():
-    now_ts = time.time()
-    if (
-        cache.cache_version("clientes") != _CLIENTES_OPTIONS_CACHE["version"]
-        or now_ts - _CLIENTES_OPTIONS_CACHE["ts"] > _CLIENTES_OPTIONS_TTL
-    ):
-        conn = db.get_connection()
-        clientes = conn.execute(
-            "SELECT id, nombre FROM clientes ORDER BY nombre"
-        ).fetchall()
-        conn.close()
-        _CLIENTES_OPTIONS_CACHE["rows"] = clientes
-        _CLIENTES_OPTIONS_CACHE["ts"] = now_ts
-        _CLIENTES_OPTIONS_CACHE["version"] = cache.cache_version("clientes")
-    return _CLIENTES_OPTIONS_CACHE["rows"]
+    return _CLIENTES_OPTIONS_CACHE.get_or_set(
+        "all", _load_clientes_options, tags=("clientes",)
+    )
+
+
+def _load_clientes_options():
+    conn = db.get_db()
+    clientes = conn.execute(
+        "SELECT id, nombre FROM clientes ORDER BY nombre"
+    ).fetchall()
+    return clientes
+
+
+def _partido_tags(partido_id: int):
+    return (
+        cache.scoped_tag("partidos", partido_id),
+        cache.scoped_tag("asignaciones_abonos", partido_id),
+        cache.scoped_tag("asignaciones_parkings", partido_id),
+    )
+
+
+def _partido_detalle_tags(partido_id: int):
+    return _partido_tags(partido_id) + ("abonos", "parkings", "clientes")
 
 
 def _partido_detalle_data(partido_id: int):
-    now_ts = time.time()
-    cache_version = cache.cache_version(
-        "partidos",
-        "asignaciones_abonos",
-        "asignaciones_parkings",
-        "abonos",
-        "parkings",
-        "clientes",
+    return _PARTIDO_DETALLE_CACHE.get_or_set(
+        partido_id,
+        lambda: _load_partido_detalle(partido_id),
+        tags=_partido_detalle_tags(partido_id),
+        stale_while_revalidate=config.CACHE_STALE_WHILE_REVALIDATE,
+        refresh=_in_app_context(lambda: _load_partido_detalle(partido_id)),
     )
-    if _PARTIDO_DETALLE_CACHE["version"] != cache_version:
-        _PARTIDO_DETALLE_CACHE["items"].clear()
-        _PARTIDO_DETALLE_CACHE["version"] = cache_version
-    entry = _PARTIDO_DETALLE_CACHE["items"].get(partido_id)
-    if entry and now_ts - entry["ts"] <= _PARTIDO_DETALLE_TTL:
-        return entry["data"]
-
-    conn = db.get_connection()
+
+
+def _load_partido_detalle(partido_id: int):
+    conn = db.get_db()
     partido = conn.execute(
         "SELECT * FROM partidos WHERE id = ?", (partido_id,)
     ).fetchone()
     if partido is None:
-        conn.close()
         abort(404)
 
     abonos_asignados = conn.execute(
@@ -126,38 +131,41 @@ def _partido_detalle_data(partido_id: int):
 
     abonos_disponibles = conn.execute(
         """
-        SELECT id, sector, puerta, fila, asiento
-        FROM abonos
-        WHERE id NOT IN (
-            SELECT abono_id FROM asignaciones_abonos WHERE id_partido = ?
+        SELECT a.id, a.sector, a.puerta, a.fila, a.asiento
+        FROM abonos a
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM asignaciones_abonos aa
+            WHERE aa.id_partido = ?
+              AND aa.abono_id = a.id
         )
-        ORDER BY puerta, sector, fila, asiento
+        ORDER BY a.puerta, a.sector, a.fila, a.asiento
         """,
         (partido_id,),
     ).fetchall()
 
     parkings_disponibles = conn.execute(
         """
-        SELECT id, nombre
-        FROM parkings
-        WHERE id NOT IN (
-            SELECT parking_id FROM asignaciones_parkings WHERE id_partido = ?
+        SELECT pk.id, pk.nombre
+        FROM parkings pk
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM asignaciones_parkings ap
+            WHERE ap.id_partido = ?
+              AND ap.parking_id = pk.id
         )
-        ORDER BY nombre
+        ORDER BY pk.nombre
         """,
         (partido_id,),
     ).fetchall()
-    conn.close()
 
-    data = {
+    return {
         "partido": partido,
         "abonos_asignados": abonos_asignados,
         "abonos_disponibles": abonos_disponibles,
         "parkings_asignados": parkings_asignados,
         "parkings_disponibles": parkings_disponibles,
     }
-    _PARTIDO_DETALLE_CACHE["items"][partido_id] = {"ts": now_ts, "data": data}
-    return data
 
 
 def _asignar_cache_key(tipo: str, partido_id: int, recurso_id: int) -> str:
@@ -165,29 +173,20 @@ def _asignar_cache_key(tipo: str, partido_id: int, recurso_id: int) -> str:
 
 
 def _asignar_context(tipo: str, partido_id: int, recurso_id: int):
-    now_ts = time.time()
-    cache_version = cache.cache_version(
-        "partidos",
-        "asignaciones_abonos",
-        "asignaciones_parkings",
-        "abonos",
-        "parkings",
-        "clientes",
+    return _ASIGNAR_CACHE.get_or_set(
+        _asignar_cache_key(tipo, partido_id, recurso_id),
+        lambda: _load_asignar_context(tipo, partido_id, recurso_id),
+        tags=_partido_tags(partido_id)
+        + (cache.scoped_tag(f"{tipo}s", recurso_id), "clientes"),
     )
-    if _ASIGNAR_CACHE["version"] != cache_version:
-        _ASIGNAR_CACHE["items"].clear()
-        _ASIGNAR_CACHE["version"] = cache_version
-    key = _asignar_cache_key(tipo, partido_id, recurso_id)
-    entry = _ASIGNAR_CACHE["items"].get(key)
-    if entry and now_ts - entry["ts"] <= _ASIGNAR_TTL:
-        return entry["data"]
-
-    conn = db.get_connection()
+
+
+def _load_asignar_context(tipo: str, partido_id: int, recurso_id: int):
+    conn = db.get_db()
     partido = conn.execute(
         "SELECT * FROM partidos WHERE id = ?", (partido_id,)
     ).fetchone()
     if partido is None:
-        conn.close()
         abort(404)
 
     if tipo == "abono":
@@ -207,69 +206,51 @@ def _asignar_context(tipo: str, partido_id: int, recurso_id: int):
             "SELECT * FROM parkings WHERE id = ?", (recurso_id,)
         ).fetchone()
 
-    conn.close()
     if recurso is None:
         abort(404)
 
-    data = {
+    return {
         "partido": partido,
         "recurso": recurso,
         "already_assigned": bool(already_assigned),
         "clientes": _clientes_options(),
     }
-    _ASIGNAR_CACHE["items"][key] = {"ts": now_ts, "data": data}
-    return data
+
+
+def _load_home_matches():
+    conn = db.get_db()
+    rows = conn.execute(
+        """
+        SELECT p.*,
+               COALESCE(d.abonos_asignados, 0) AS asignados_abonos,
+               COALESCE(d.parkings_asignados, 0) AS asignados_parkings,
+               t.total_abonos,
+               t.total_parkings
+        FROM partidos p
+        LEFT JOIN disponibilidad_partidos d ON d.id_partido = p.id
+        CROSS JOIN (
+            SELECT COALESCE(max(total) FILTER (WHERE recurso = 'abonos'), 0) AS total_abonos,
+                   COALESCE(max(total) FILTER (WHERE recurso = 'parkings'), 0) AS total_parkings
+            FROM totales_recursos
+        ) AS t
+        WHERE p.fecha IS NOT NULL
+          AND p.fecha >= now()
+        ORDER BY p.fecha
+        """
+    ).fetchall()
+    return rows
 
 
 @home_bp.route("/")
+@conditional.etag("index.html", _HOME_MATCHES_TAGS, time_dependent=True)
 def home_page():
-    sync_upcoming_matches()
-    conn = db.get_connection()
-    now_ts = time.time()
-    if (
-        cache.cache_version(
-            "partidos",
-            "asignaciones_abonos",
-            "asignaciones_parkings",
-            "abonos",
-            "parkings",
-        ) != _HOME_MATCHES_CACHE["version"]
-        or now_ts - _HOME_MATCHES_CACHE["ts"] > _HOME_MATCHES_TTL
-    ):
-        rows = conn.execute(
-            """
-            SELECT p.*,
-                   COALESCE(abonos.total_abonos, 0) AS asignados_abonos,
-                   COALESCE(parkings.total_parkings, 0) AS asignados_parkings,
-                   (SELECT COUNT(*) FROM abonos) AS total_abonos,
-                   (SELECT COUNT(*) FROM parkings) AS total_parkings
-            FROM partidos p
-            LEFT JOIN (
-                SELECT id_partido, COUNT(*) AS total_abonos
-                FROM asignaciones_abonos
-                GROUP BY id_partido
-            ) AS abonos ON abonos.id_partido = p.id
-            LEFT JOIN (
-                SELECT id_partido, COUNT(*) AS total_parkings
-                FROM asignaciones_parkings
-                GROUP BY id_partido
-            ) AS parkings ON parkings.id_partido = p.id
-            WHERE p.fecha IS NOT NULL
-              AND p.fecha::timestamp >= now()
-            ORDER BY p.fecha::timestamp
-            """
-        ).fetchall()
-        _HOME_MATCHES_CACHE["rows"] = rows
-        _HOME_MATCHES_CACHE["ts"] = now_ts
-        _HOME_MATCHES_CACHE["version"] = cache.cache_version(
-            "partidos",
-            "asignaciones_abonos",
-            "asignaciones_parkings",
-            "abonos",
-            "parkings",
-        )
-    rows = _HOME_MATCHES_CACHE["rows"]
-    conn.close()
+    rows = _HOME_MATCHES_CACHE.get_or_set(
+        "upcoming",
+        _load_home_matches,
+        tags=_HOME_MATCHES_TAGS,
+        stale_while_revalidate=config.CACHE_STALE_WHILE_REVALIDATE,
+        refresh=_in_app_context(_load_home_matches),
+    )
 
     partidos = []
     for row in rows:
@@ -287,6 +268,7 @@ def home_page():
 
 
 @home_bp.route("/partidos/<int:partido_id>")
+@conditional.etag("partido_detalle.html", _partido_detalle_tags)
 def partido_detalle(partido_id: int):
     data = _partido_detalle_data(partido_id)
     partido = data["partido"]
@@ -311,13 +293,14 @@ def partido_detalle(partido_id: int):
 @home_bp.post("/partidos/<int:partido_id>/abonos/<int:abono_id>/liberar")
 def liberar_abono(partido_id: int, abono_id: int):
     partido = _partido_or_404(partido_id)
-    conn = db.get_connection()
+    conn = db.get_db()
     deleted = conn.execute(
         "DELETE FROM asignaciones_abonos WHERE id_partido = ? AND abono_id = ?",
         (partido_id, abono_id),
     )
+    availability.registrar(conn, "abonos", {partido_id: -deleted.rowcount})
     conn.commit()
-    conn.close()
+    occupancy.record_release("abonos", partido_id, abono_id)
     if deleted.rowcount:
         flash("Abono liberado correctamente.", "success")
     else:
@@ -328,13 +311,14 @@ def liberar_abono(partido_id: int, abono_id: int):
 @home_bp.post("/partidos/<int:partido_id>/parkings/<int:parking_id>/liberar")
 def liberar_parking(partido_id: int, parking_id: int):
     partido = _partido_or_404(partido_id)
-    conn = db.get_connection()
+    conn = db.get_db()
     deleted = conn.execute(
         "DELETE FROM asignaciones_parkings WHERE id_partido = ? AND parking_id = ?",
         (partido_id, parking_id),
     )
+    availability.registrar(conn, "parkings", {partido_id: -deleted.rowcount})
     conn.commit()
-    conn.close()
+    occupancy.record_release("parkings", partido_id, parking_id)
     if deleted.rowcount:
         flash("Parking liberado correctamente.", "success")
     else:
@@ -379,18 +363,16 @@ def asignar_abono(partido_id: int, abono_id: int):
     if not _validar_partido_local(partido):
         return redirect(url_for("home.partido_detalle", partido_id=partido_id))
 
-    conn = db.get_connection()
+    conn = db.get_db()
     already_assigned = conn.execute(
         "SELECT 1 FROM asignaciones_abonos WHERE id_partido = ? AND abono_id = ?",
         (partido_id, abono_id),
     ).fetchone()
     if already_assigned:
-        conn.close()
         flash("Ese abono ya está asignado para este partido.", "warning")
         return redirect(url_for("home.partido_detalle", partido_id=partido_id))
     abono = conn.execute("SELECT * FROM abonos WHERE id = ?", (abono_id,)).fetchone()
     if abono is None:
-        conn.close()
         abort(404)
 
     clientes = _clientes_options()
@@ -414,7 +396,6 @@ def asignar_abono(partido_id: int, abono_id: int):
                     )
                     conn.commit()
                     flash("Cliente creado correctamente.", "success")
-                    conn.close()
                     return redirect(
                         url_for(
                             "home.asignar_abono",
@@ -440,17 +421,25 @@ def asignar_abono(partido_id: int, abono_id: int):
                         """,
                         (cliente_id, partido_id, abono_id, g.current_user["username"]),
                     )
+                    availability.registrar(conn, "abonos", {partido_id: 1})
                     conn.commit()
+                    occupancy.record_assignments(
+                        "abonos",
+                        partido_id,
+                        (abono_id,),
+                        cliente_id,
+                        cliente["nombre"],
+                        g.current_user["username"],
+                    )
                     flash(
                         f"{format_abono(abono)} asignado a {cliente['nombre']}.",
                         "success",
                     )
-                    conn.close()
                     return redirect(url_for("home.home_page"))
             except IntegrityError:
+                conn.rollback()
                 flash("El abono ya está reservado para este partido.", "danger")
 
-    conn.close()
     response = make_response(
         render_template(
             "seleccionar_cliente.html",
@@ -495,20 +484,18 @@ def asignar_parking(partido_id: int, parking_id: int):
     if not _validar_partido_local(partido):
         return redirect(url_for("home.partido_detalle", partido_id=partido_id))
 
-    conn = db.get_connection()
+    conn = db.get_db()
     already_assigned = conn.execute(
         "SELECT 1 FROM asignaciones_parkings WHERE id_partido = ? AND parking_id = ?",
         (partido_id, parking_id),
     ).fetchone()
     if already_assigned:
-        conn.close()
         flash("Ese parking ya está asignado para este partido.", "warning")
         return redirect(url_for("home.partido_detalle", partido_id=partido_id))
     parking = conn.execute(
         "SELECT * FROM parkings WHERE id = ?", (parking_id,)
     ).fetchone()
     if parking is None:
-        conn.close()
         abort(404)
 
     clientes = _clientes_options()
@@ -532,7 +519,6 @@ def asignar_parking(partido_id: int, parking_id: int):
                     )
                     conn.commit()
                     flash("Cliente creado correctamente.", "success")
-                    conn.close()
                     return redirect(
                         url_for(
                             "home.asignar_parking",
@@ -558,17 +544,25 @@ def asignar_parking(partido_id: int, parking_id: int):
                         """,
                         (cliente_id, partido_id, parking_id, g.current_user["username"]),
                     )
+                    availability.registrar(conn, "parkings", {partido_id: 1})
                     conn.commit()
+                    occupancy.record_assignments(
+                        "parkings",
+                        partido_id,
+                        (parking_id,),
+                        cliente_id,
+                        cliente["nombre"],
+                        g.current_user["username"],
+                    )
                     flash(
                         f"{format_parking(parking)} asignado a {cliente['nombre']}.",
                         "success",
                     )
-                    conn.close()
                     return redirect(url_for("home.home_page"))
             except IntegrityError:
+                conn.rollback()
                 flash("El parking ya está reservado para este partido.", "danger")
 
-    conn.close()
     response = make_response(
         render_template(
             "seleccionar_cliente.html",
@@ -598,7 +592,7 @@ def asignar_multiples(partido_id: int):
         flash("Selecciona al menos un abono o parking para asignar.", "warning")
         return redirect(url_for("home.partido_detalle", partido_id=partido_id))
 
-    conn = db.get_connection()
+    conn = db.get_db()
 
     if request.form.get("crear_cliente"):
         nuevo_nombre = normalize_text(request.form.get("nuevo_nombre"))
@@ -628,35 +622,46 @@ def asignar_multiples(partido_id: int):
             if not cliente:
                 flash("El cliente indicado no existe.", "danger")
             else:
-                asignados = 0
-                repetidos = 0
-                for abono_id in abono_ids:
-                    inserted = conn.execute(
-                        """
-                        INSERT INTO asignaciones_abonos (id_cliente, id_partido, abono_id, asignador)
-                        VALUES (?, ?, ?, ?)
-                        ON CONFLICT (id_partido, abono_id) DO NOTHING
-                        """,
-                        (cliente_id, partido_id, abono_id, g.current_user["username"]),
-                    )
-                    if inserted.rowcount:
-                        asignados += 1
-                    else:
-                        repetidos += 1
-                for parking_id in parking_ids:
-                    inserted = conn.execute(
-                        """
-                        INSERT INTO asignaciones_parkings (id_cliente, id_partido, parking_id, asignador)
-                        VALUES (?, ?, ?, ?)
-                        ON CONFLICT (id_partido, parking_id) DO NOTHING
-                        """,
-                        (cliente_id, partido_id, parking_id, g.current_user["username"]),
-                    )
-                    if inserted.rowcount:
-                        asignados += 1
-                    else:
-                        repetidos += 1
+                asignador = g.current_user["username"]
+                abonos_insertados = conn.execute_values(
+                    """
+                    INSERT INTO asignaciones_abonos (id_cliente, id_partido, abono_id, asignador)
+                    VALUES {values}
+                    ON CONFLICT (id_partido, abono_id) DO NOTHING
+                    RETURNING abono_id
+                    """,
+                    [(cliente_id, partido_id, abono_id, asignador) for abono_id in abono_ids],
+                )
+                parkings_insertados = conn.execute_values(
+                    """
+                    INSERT INTO asignaciones_parkings (id_cliente, id_partido, parking_id, asignador)
+                    VALUES {values}
+                    ON CONFLICT (id_partido, parking_id) DO NOTHING
+                    RETURNING parking_id
+                    """,
+                    [(cliente_id, partido_id, parking_id, asignador) for parking_id in parking_ids],
+                )
+                asignados = len(abonos_insertados.rows) + len(parkings_insertados.rows)
+                repetidos = len(abono_ids) + len(parking_ids) - asignados
+                availability.registrar(conn, "abonos", {partido_id: len(abonos_insertados.rows)})
+                availability.registrar(conn, "parkings", {partido_id: len(parkings_insertados.rows)})
                 conn.commit()
+                occupancy.record_assignments(
+                    "abonos",
+                    partido_id,
+                    [row["abono_id"] for row in abonos_insertados.rows],
+                    cliente_id,
+                    cliente["nombre"],
+                    asignador,
+                )
+                occupancy.record_assignments(
+                    "parkings",
+                    partido_id,
+                    [row["parking_id"] for row in parkings_insertados.rows],
+                    cliente_id,
+                    cliente["nombre"],
+                    asignador,
+                )
                 if asignados:
                     flash(
                         f"Asignados {asignados} recursos a {cliente['nombre']}.",
@@ -667,12 +672,11 @@ def asignar_multiples(partido_id: int):
                         f"{repetidos} recursos ya estaban asignados para este partido.",
                         "warning",
                     )
-                conn.close()
                 return redirect(url_for("home.home_page"))
         except IntegrityError:
+            conn.rollback()
             flash("Algunos recursos ya estaban asignados.", "warning")
 
-    conn.close()
     response = make_response(
         render_template(
             "seleccionar_cliente.html",
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import secrets
+
+from flask import Blueprint, Response, abort, request
+
+from .. import config, metrics
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics")
+def metrics_endpoint():
+    token = config.METRICS_TOKEN
+    if not token:
+        abort(404)
+    sent = request.headers.get("Authorization", "")
+    if not secrets.compare_digest(sent.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+        abort(401)
+    return Response(
+        metrics.registry.exposition(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
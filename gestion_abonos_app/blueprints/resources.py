@@ -1,11 +1,15 @@
 from __future__ import annotations
 
-from collections import defaultdict
-import time
+import base64
+import json
+from typing import Optional
 
 from flask import (
     Blueprint,
+    abort,
     flash,
+    g,
+    make_response,
     redirect,
     render_template,
     request,
@@ -13,35 +17,41 @@ from flask import (
 )
 from sqlalchemy.exc import IntegrityError
 
-from .. import cache, db
-from ..utils import format_abono, format_parking, normalize_text
+from .. import cache, conditional, config, db
+from ..services import availability, occupancy
+from ..services.scheduler import scheduler
+from ..utils import format_abono, format_parking, normalize_text, search_key
 
 resources_bp = Blueprint("resources", __name__)
 
-_CLIENTES_CACHE = {"ts": 0.0, "rows": [], "version": -1}
-_CLIENTES_TTL = 60.0
+_CLIENTES_CACHE = cache.LRUCache("clientes_options", max_entries=1, ttl=60.0)
+# Todo lo que aparece en la ficha de un cliente: sus recursos y los partidos asignados.
+_CLIENTES_PAGINA_TAGS = (
+    "clientes",
+    "abonos",
+    "parkings",
+    "asignaciones_abonos",
+    "asignaciones_parkings",
+    "partidos",
+)
 
 
 def _clientes_options():
-    now_ts = time.time()
-    if (
-        cache.cache_version("clientes") != _CLIENTES_CACHE["version"]
-        or now_ts - _CLIENTES_CACHE["ts"] > _CLIENTES_TTL
-    ):
-        conn = db.get_connection()
-        clientes = conn.execute(
-            "SELECT id, nombre FROM clientes ORDER BY nombre"
-        ).fetchall()
-        conn.close()
-        _CLIENTES_CACHE["rows"] = clientes
-        _CLIENTES_CACHE["ts"] = now_ts
-        _CLIENTES_CACHE["version"] = cache.cache_version("clientes")
-    return _CLIENTES_CACHE["rows"]
+    return _CLIENTES_CACHE.get_or_set("all", _load_clientes_options, tags=("clientes",))
+
+
+def _load_clientes_options():
+    conn = db.get_db()
+    clientes = conn.execute(
+        "SELECT id, nombre FROM clientes ORDER BY nombre"
+    ).fetchall()
+    return clientes
 
 
 @resources_bp.route("/abonos")
+@conditional.etag("abonos.html", ("abonos", "clientes", "asignaciones_abonos", "partidos"), time_dependent=True)
 def listar_abonos():
-    conn = db.get_connection()
+    conn = db.get_db()
     abonos = conn.execute(
         """
         SELECT a.*, c.nombre AS propietario
@@ -56,50 +66,29 @@ def listar_abonos():
         FROM partidos
         WHERE localia = 1
           AND fecha IS NOT NULL
-          AND fecha::timestamp >= now()
-        ORDER BY fecha::timestamp
-        """
-    ).fetchall()
-    asignaciones = conn.execute(
-        """
-        SELECT aa.abono_id,
-               p.id AS partido_id,
-               p.fecha,
-               p.competicion,
-               p.equipo_local,
-               p.equipo_visitante,
-               p.logo_local,
-               p.logo_visitante,
-               aa.asignador,
-               c.nombre AS cliente
-        FROM asignaciones_abonos aa
-        JOIN partidos p ON p.id = aa.id_partido
-        JOIN clientes c ON c.id = aa.id_cliente
-        WHERE p.fecha::timestamp >= now()
-        ORDER BY p.fecha::timestamp
+          AND fecha >= now()
+        ORDER BY fecha
         """
     ).fetchall()
-    conn.close()
-
-    agrupadas = defaultdict(dict)
-    for asignacion in asignaciones:
-        agrupadas[asignacion["abono_id"]][asignacion["partido_id"]] = asignacion
-
     return render_template(
         "abonos.html",
         abonos=abonos,
-        asignaciones=agrupadas,
+        ocupacion=occupancy.get_matrix("abonos"),
         home_matches=home_matches,
     )
 
 
 @resources_bp.post("/abonos/<int:abono_id>/eliminar")
 def eliminar_abono(abono_id: int):
-    conn = db.get_connection()
-    conn.execute("DELETE FROM asignaciones_abonos WHERE abono_id = ?", (abono_id,))
+    conn = db.get_db()
+    liberadas = conn.execute(
+        "DELETE FROM asignaciones_abonos WHERE abono_id = ? RETURNING id_partido", (abono_id,)
+    ).fetchall()
+    availability.registrar(conn, "abonos", availability.liberadas(liberadas))
     deleted = conn.execute("DELETE FROM abonos WHERE id = ?", (abono_id,))
+    if deleted.rowcount:
+        availability.ajustar_total(conn, "abonos", -1)
     conn.commit()
-    conn.close()
     if deleted.rowcount:
         flash("Abono eliminado junto con sus asignaciones.", "success")
     else:
@@ -108,8 +97,11 @@ def eliminar_abono(abono_id: int):
 
 
 @resources_bp.route("/parkings")
+@conditional.etag(
+    "parkings.html", ("parkings", "clientes", "asignaciones_parkings", "partidos"), time_dependent=True
+)
 def listar_parkings():
-    conn = db.get_connection()
+    conn = db.get_db()
     parkings = conn.execute(
         """
         SELECT p.*, c.nombre AS propietario
@@ -124,52 +116,30 @@ def listar_parkings():
         FROM partidos
         WHERE localia = 1
           AND fecha IS NOT NULL
-          AND fecha::timestamp >= now()
-        ORDER BY fecha::timestamp
+          AND fecha >= now()
+        ORDER BY fecha
         """
     ).fetchall()
-    asignaciones = conn.execute(
-        """
-        SELECT ap.parking_id,
-               p.id AS partido_id,
-               p.fecha,
-               p.competicion,
-               p.equipo_local,
-               p.equipo_visitante,
-               p.logo_local,
-               p.logo_visitante,
-               ap.asignador,
-               c.nombre AS cliente
-        FROM asignaciones_parkings ap
-        JOIN partidos p ON p.id = ap.id_partido
-        JOIN clientes c ON c.id = ap.id_cliente
-        WHERE p.fecha::timestamp >= now()
-        ORDER BY p.fecha::timestamp
-        """
-    ).fetchall()
-    conn.close()
-
-    agrupadas = defaultdict(dict)
-    for asignacion in asignaciones:
-        agrupadas[asignacion["parking_id"]][asignacion["partido_id"]] = asignacion
-
     return render_template(
         "parkings.html",
         parkings=parkings,
-        asignaciones=agrupadas,
+        ocupacion=occupancy.get_matrix("parkings"),
         home_matches=home_matches,
     )
 
 
 @resources_bp.post("/parkings/<int:parking_id>/eliminar")
 def eliminar_parking(parking_id: int):
-    conn = db.get_connection()
-    conn.execute(
-        "DELETE FROM asignaciones_parkings WHERE parking_id = ?", (parking_id,)
-    )
+    conn = db.get_db()
+    liberadas = conn.execute(
+        "DELETE FROM asignaciones_parkings WHERE parking_id = ? RETURNING id_partido",
+        (parking_id,),
+    ).fetchall()
+    availability.registrar(conn, "parkings", availability.liberadas(liberadas))
     deleted = conn.execute("DELETE FROM parkings WHERE id = ?", (parking_id,))
+    if deleted.rowcount:
+        availability.ajustar_total(conn, "parkings", -1)
     conn.commit()
-    conn.close()
     if deleted.rowcount:
         flash("Parking eliminado junto con sus asignaciones.", "success")
     else:
@@ -177,136 +147,176 @@ def eliminar_parking(parking_id: int):
     return redirect(url_for("resources.listar_parkings"))
 
 
-@resources_bp.route("/clientes")
-def listar_clientes():
-    conn = db.get_connection()
-    clientes = conn.execute(
-        "SELECT id, nombre FROM clientes ORDER BY nombre"
+def _encode_cursor(orden: str, cliente_id: int) -> str:
+    raw = json.dumps([orden, cliente_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    try:
+        orden, cliente_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(orden), int(cliente_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _clientes_pagina(busqueda: str, cursor: Optional[str]):
+    condiciones = []
+    params = []
+    if busqueda:
+        patron = search_key(busqueda).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        condiciones.append(f"{db.CLIENTE_ORDEN_SQL} LIKE ?")
+        params.append(f"%{patron}%")
+    posicion = _decode_cursor(cursor)
+    if posicion:
+        condiciones.append(f"({db.CLIENTE_ORDEN_SQL}, id) > (?, ?)")
+        params.extend(posicion)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    params.append(config.CLIENTES_PAGE_SIZE + 1)
+
+    # Cada cliente llega con sus próximos partidos y los abonos/parkings de cada uno ya agrupados.
+    clientes = db.get_db().execute(
+        f"""
+        WITH pagina AS (
+            SELECT id, nombre, {db.CLIENTE_ORDEN_SQL} AS orden
+            FROM clientes
+            {where}
+            ORDER BY {db.CLIENTE_ORDEN_SQL}, id
+            LIMIT ?
+        ),
+        recursos AS (
+            SELECT aa.id_cliente,
+                   aa.id_partido,
+                   aa.abono_id AS recurso_id,
+                   json_build_object(
+                       'sector', a.sector,
+                       'puerta', a.puerta,
+                       'fila', a.fila,
+                       'asiento', a.asiento
+                   ) AS abono,
+                   NULL::json AS parking
+            FROM asignaciones_abonos aa
+            JOIN pagina ON pagina.id = aa.id_cliente
+            JOIN abonos a ON a.id = aa.abono_id
+            UNION ALL
+            SELECT ap.id_cliente,
+                   ap.id_partido,
+                   ap.parking_id,
+                   NULL::json,
+                   json_build_object('nombre', pk.nombre)
+            FROM asignaciones_parkings ap
+            JOIN pagina ON pagina.id = ap.id_cliente
+            JOIN parkings pk ON pk.id = ap.parking_id
+        ),
+        por_partido AS (
+            SELECT r.id_cliente,
+                   p.fecha,
+                   json_build_object(
+                       'id', p.id,
+                       'fecha', p.fecha,
+                       'rival', p.rival,
+                       'localia', p.localia,
+                       'competicion', p.competicion,
+                       'equipo_local', p.equipo_local,
+                       'equipo_visitante', p.equipo_visitante,
+                       'logo_local', p.logo_local,
+                       'logo_visitante', p.logo_visitante,
+                       'abonos', COALESCE(
+                           json_agg(r.abono ORDER BY r.recurso_id) FILTER (WHERE r.abono IS NOT NULL),
+                           '[]'::json
+                       ),
+                       'parkings', COALESCE(
+                           json_agg(r.parking ORDER BY r.recurso_id) FILTER (WHERE r.parking IS NOT NULL),
+                           '[]'::json
+                       )
+                   ) AS partido
+            FROM recursos r
+            JOIN partidos p ON p.id = r.id_partido
+            WHERE p.fecha >= now()
+            GROUP BY r.id_cliente, p.id
+        )
+        SELECT pagina.id,
+               pagina.nombre,
+               pagina.orden,
+               COALESCE(
+                   json_agg(pp.partido ORDER BY pp.fecha) FILTER (WHERE pp.partido IS NOT NULL),
+                   '[]'::json
+               ) AS partidos
+        FROM pagina
+        LEFT JOIN por_partido pp ON pp.id_cliente = pagina.id
+        GROUP BY pagina.id, pagina.nombre, pagina.orden
+        ORDER BY pagina.orden, pagina.id
+        """,
+        params,
     ).fetchall()
+    siguiente = None
+    if len(clientes) > config.CLIENTES_PAGE_SIZE:
+        clientes = clientes[: config.CLIENTES_PAGE_SIZE]
+        siguiente = _encode_cursor(clientes[-1]["orden"], clientes[-1]["id"])
+    return clientes, siguiente
 
-    abonos_cliente = conn.execute(
-        """
-        SELECT aa.id_cliente,
-               aa.abono_id,
-               a.sector,
-               a.puerta,
-               a.fila,
-               a.asiento,
-               p.id AS partido_id,
-               p.fecha,
-               p.competicion,
-               p.equipo_local,
-               p.equipo_visitante,
-               p.logo_local,
-               p.logo_visitante
-        FROM asignaciones_abonos aa
-        JOIN abonos a ON a.id = aa.abono_id
-        JOIN partidos p ON p.id = aa.id_partido
-        WHERE p.fecha::timestamp >= now()
-        """
-    ).fetchall()
 
-    parkings_cliente = conn.execute(
-        """
-        SELECT ap.id_cliente,
-               ap.parking_id,
-               pk.nombre,
-               p.id AS partido_id,
-               p.fecha,
-               p.competicion,
-               p.equipo_local,
-               p.equipo_visitante,
-               p.logo_local,
-               p.logo_visitante
-        FROM asignaciones_parkings ap
-        JOIN parkings pk ON pk.id = ap.parking_id
-        JOIN partidos p ON p.id = ap.id_partido
-        WHERE p.fecha::timestamp >= now()
-        """
-    ).fetchall()
-    conn.close()
-
-    abonos_por_cliente = defaultdict(list)
-    for registro in abonos_cliente:
-        abonos_por_cliente[registro["id_cliente"]].append(registro)
-
-    parkings_por_cliente = defaultdict(list)
-    for registro in parkings_cliente:
-        parkings_por_cliente[registro["id_cliente"]].append(registro)
-
-    clientes_detalle = []
-    for cliente in clientes:
-        partidos_map: dict[int, dict] = {}
-        for abono in abonos_por_cliente.get(cliente["id"], []):
-            partido = partidos_map.setdefault(
-                abono["partido_id"],
-                {
-                    "fecha": abono["fecha"],
-                    "competicion": abono["competicion"],
-                    "equipo_local": abono["equipo_local"],
-                    "equipo_visitante": abono["equipo_visitante"],
-                    "logo_local": abono["logo_local"],
-                    "logo_visitante": abono["logo_visitante"],
-                    "abonos": [],
-                    "parkings": [],
-                },
-            )
-            partido["abonos"].append(abono)
-        for parking in parkings_por_cliente.get(cliente["id"], []):
-            partido = partidos_map.setdefault(
-                parking["partido_id"],
-                {
-                    "fecha": parking["fecha"],
-                    "competicion": parking["competicion"],
-                    "equipo_local": parking["equipo_local"],
-                    "equipo_visitante": parking["equipo_visitante"],
-                    "logo_local": parking["logo_local"],
-                    "logo_visitante": parking["logo_visitante"],
-                    "abonos": [],
-                    "parkings": [],
-                },
-            )
-            partido["parkings"].append(parking)
+@resources_bp.route("/clientes")
+@conditional.etag("clientes.html", _CLIENTES_PAGINA_TAGS, time_dependent=True)
+def listar_clientes():
+    busqueda = normalize_text(request.args.get("q"))
+    clientes, siguiente = _clientes_pagina(busqueda, None)
+    return render_template(
+        "clientes.html",
+        clientes=clientes,
+        busqueda=busqueda,
+        siguiente=siguiente,
+    )
 
-        partidos_ordenados = sorted(
-            partidos_map.values(),
-            key=lambda item: item["fecha"] or "",
-        )
-        clientes_detalle.append(
-            {
-                "cliente": cliente,
-                "partidos": partidos_ordenados,
-            }
-        )
 
-    return render_template("clientes.html", clientes=clientes_detalle)
+@resources_bp.route("/clientes/pagina")
+def clientes_pagina():
+    busqueda = normalize_text(request.args.get("q"))
+    clientes, siguiente = _clientes_pagina(busqueda, request.args.get("cursor"))
+    response = make_response(render_template("_clientes_items.html", clientes=clientes))
+    response.headers["X-Next-Cursor"] = siguiente or ""
+    return response
 
 
 @resources_bp.route("/partidos")
 def listar_partidos():
-    conn = db.get_connection()
+    conn = db.get_db()
     partidos = conn.execute(
         """
         SELECT * FROM partidos
         WHERE fecha IS NOT NULL
-          AND fecha::timestamp >= now() - interval '1 day'
-        ORDER BY fecha::timestamp
+          AND fecha >= now() - interval '1 day'
+        ORDER BY fecha
         """
     ).fetchall()
-    conn.close()
-    return render_template("partidos.html", partidos=partidos)
+    return render_template("partidos.html", partidos=partidos, sync=scheduler.status(conn))
+
+
+@resources_bp.post("/partidos/sincronizar")
+def sincronizar_partidos():
+    if g.current_user["role"] != "admin":
+        abort(403)
+    if scheduler.trigger(db.get_db()):
+        flash("Sincronización iniciada; los partidos se actualizarán en unos segundos.", "info")
+    else:
+        flash("Ya hay una sincronización en curso.", "warning")
+    return redirect(url_for("resources.listar_partidos"))
 
 
 @resources_bp.post("/partidos/<int:partido_id>/eliminar")
 def eliminar_partido(partido_id: int):
-    conn = db.get_connection()
+    conn = db.get_db()
     conn.execute("DELETE FROM asignaciones_abonos WHERE id_partido = ?", (partido_id,))
     conn.execute(
         "DELETE FROM asignaciones_parkings WHERE id_partido = ?", (partido_id,)
     )
+    conn.execute(
+        "DELETE FROM disponibilidad_partidos WHERE id_partido = ?", (partido_id,)
+    )
     deleted = conn.execute("DELETE FROM partidos WHERE id = ?", (partido_id,))
     conn.commit()
-    conn.close()
     if deleted.rowcount:
         flash("Partido eliminado.", "success")
     else:
@@ -316,15 +326,17 @@ def eliminar_partido(partido_id: int):
 
 @resources_bp.post("/clientes/<int:cliente_id>/eliminar")
 def eliminar_cliente(cliente_id: int):
-    conn = db.get_connection()
-    conn.execute(
-        "DELETE FROM asignaciones_abonos WHERE id_cliente = ?",
+    conn = db.get_db()
+    abonos_liberados = conn.execute(
+        "DELETE FROM asignaciones_abonos WHERE id_cliente = ? RETURNING id_partido",
         (cliente_id,),
-    )
-    conn.execute(
-        "DELETE FROM asignaciones_parkings WHERE id_cliente = ?",
+    ).fetchall()
+    parkings_liberados = conn.execute(
+        "DELETE FROM asignaciones_parkings WHERE id_cliente = ? RETURNING id_partido",
         (cliente_id,),
-    )
+    ).fetchall()
+    availability.registrar(conn, "abonos", availability.liberadas(abonos_liberados))
+    availability.registrar(conn, "parkings", availability.liberadas(parkings_liberados))
     conn.execute(
         "UPDATE abonos SET id_propietario = NULL WHERE id_propietario = ?",
         (cliente_id,),
@@ -335,7 +347,6 @@ def eliminar_cliente(cliente_id: int):
     )
     deleted = conn.execute("DELETE FROM clientes WHERE id = ?", (cliente_id,))
     conn.commit()
-    conn.close()
     if deleted.rowcount:
         flash("Cliente eliminado y asignaciones liberadas.", "success")
     else:
@@ -352,7 +363,7 @@ def insertar_cliente():
         elif len(nombre) > 128:
             flash("El nombre del cliente no puede exceder los 128 caracteres.", "danger")
         else:
-            conn = db.get_connection()
+            conn = db.get_db()
             try:
                 conn.execute(
                     "INSERT INTO clientes (nombre) VALUES (?)",
@@ -362,10 +373,8 @@ def insertar_cliente():
                 flash("Cliente creado correctamente.", "success")
                 return redirect(url_for("resources.listar_clientes"))
             except IntegrityError:
-                conn.conn.rollback()
+                conn.rollback()
                 flash("Ya existe un cliente con ese nombre.", "warning")
-            finally:
-                conn.close()
     return render_template("insertar_cliente.html")
 
 
@@ -402,7 +411,7 @@ def insertar_abono():
                 else:
                     valores[campo] = numero
             else:
-                conn = db.get_connection()
+                conn = db.get_db()
                 try:
                     conn.execute(
                         """
@@ -417,14 +426,13 @@ def insertar_abono():
                             propietario,
                         ),
                     )
+                    availability.ajustar_total(conn, "abonos", 1)
                     conn.commit()
                     flash("Abono registrado.", "success")
                     return redirect(url_for("resources.listar_abonos"))
                 except IntegrityError:
-                    conn.conn.rollback()
+                    conn.rollback()
                     flash("Ya existe un abono con esa combinación.", "warning")
-                finally:
-                    conn.close()
                 return render_template("insertar_abono.html", clientes=clientes)
 
     return render_template("insertar_abono.html", clientes=clientes)
@@ -451,20 +459,19 @@ def insertar_parking():
             if parking_id < 1 or parking_id > 999999:
                 flash("El ID del parking debe estar entre 1 y 999999.", "danger")
                 return render_template("insertar_parking.html", clientes=clientes)
-            conn = db.get_connection()
+            conn = db.get_db()
             try:
                 conn.execute(
                     "INSERT INTO parkings (id, nombre, id_propietario) VALUES (?, ?, ?)",
                     (parking_id, nombre, propietario),
                 )
+                availability.ajustar_total(conn, "parkings", 1)
                 conn.commit()
                 flash("Parking registrado.", "success")
                 return redirect(url_for("resources.listar_parkings"))
             except IntegrityError:
-                conn.conn.rollback()
+                conn.rollback()
                 flash("Ya existe un parking con ese ID.", "warning")
-            finally:
-                conn.close()
 
     return render_template("insertar_parking.html", clientes=clientes)
 
@@ -495,14 +502,14 @@ def insertar_partido():
             if elem and len(elem) > 128:
                 flash("Los campos no pueden exceder los 128 caracteres.", "danger")
                 break
-        from ..utils import normalize_datetime_value, build_team_names
+        from ..utils import parse_datetime_value, build_team_names
 
-        fecha = normalize_datetime_value(fecha_raw)
+        fecha = parse_datetime_value(fecha_raw)
         if not rival or not fecha:
             flash("Rival y fecha son obligatorios.", "danger")
         else:
             equipo_local, equipo_visitante = build_team_names(localia, rival)
-            conn = db.get_connection()
+            conn = db.get_db()
             conn.execute(
                 """
                 INSERT INTO partidos (
@@ -528,7 +535,6 @@ def insertar_partido():
                 ),
             )
             conn.commit()
-            conn.close()
             flash("Partido añadido al calendario.", "success")
             return redirect(url_for("home.home_page"))
 
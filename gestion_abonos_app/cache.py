@@ -1,25 +1,473 @@
 from __future__ import annotations
 
-from collections import defaultdict
-from typing import Iterable, Tuple
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, Optional, Tuple
 
-_GLOBAL_VERSION = 0
-_TAG_VERSIONS = defaultdict(int)
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from . import config
+
+_GLOBAL_TAG = "*"
+
+logger = logging.getLogger(__name__)
+
+
+class LocalVersionBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = defaultdict(int)
+
+    def bump(self, tags: Tuple[str, ...]) -> None:
+        with self._lock:
+            self._versions[_GLOBAL_TAG] += 1
+            for tag in tags:
+                self._versions[tag] += 1
+
+    def versions(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        return tuple(self._versions[tag] for tag in tags)
+
+
+class SharedMap:
+    """Archivo mapeado en memoria y compartido por los procesos de la máquina.
+
+    El descriptor (y con él el flock) se abre por PID: con ``gunicorn --preload`` los
+    workers heredan del padre la misma descripción de archivo, y un flock sobre ella no
+    excluye a unos workers de otros.
+    """
+
+    def __init__(self, path: Path, size: int):
+        self.path = Path(path)
+        self.size = size
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._pid: Optional[int] = None
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self) -> None:
+        inherited = self._fd
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < self.size:
+            os.ftruncate(fd, self.size)
+        self._map = mmap.mmap(fd, self.size)
+        self._fd = fd
+        # El lock heredado podía estar tomado por un hilo que no existe en este proceso.
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        if inherited is not None:
+            os.close(inherited)
+
+    @property
+    def map(self) -> mmap.mmap:
+        if self._pid != os.getpid():
+            self._open()
+        return self._map
+
+    @contextmanager
+    def locked(self) -> Iterator[mmap.mmap]:
+        shared = self.map
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield shared
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class MmapVersionBackend:
+    _SLOT = struct.Struct("<Q")
+
+    def __init__(self, path: Path, slots: int = 4096):
+        self._slots = max(int(slots), 2)
+        self._shared = SharedMap(path, self._slots * self._SLOT.size)
+
+    def _slot(self, tag: str) -> int:
+        if tag == _GLOBAL_TAG:
+            return 0
+        # Las colisiones solo provocan invalidaciones de más, nunca de menos.
+        return 1 + zlib.crc32(tag.encode("utf-8")) % (self._slots - 1)
+
+    def _read(self, shared: mmap.mmap, slot: int) -> int:
+        return self._SLOT.unpack_from(shared, slot * self._SLOT.size)[0]
+
+    def bump(self, tags: Tuple[str, ...]) -> None:
+        slots = {0} | {self._slot(tag) for tag in tags}
+        with self._shared.locked() as shared:
+            for slot in slots:
+                self._SLOT.pack_into(shared, slot * self._SLOT.size, self._read(shared, slot) + 1)
+
+    def versions(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        shared = self._shared.map
+        return tuple(self._read(shared, self._slot(tag)) for tag in tags)
+
+
+class DatabaseVersionBackend:
+    def __init__(self, engine, poll_seconds: float = 1.0):
+        self._engine = engine
+        self._poll_seconds = float(poll_seconds)
+        self._lock = threading.Lock()
+        self._snapshot: Dict[str, int] = {}
+        self._loaded_at = 0.0
+
+    def bump(self, tags: Tuple[str, ...]) -> None:
+        from sqlalchemy import text
+
+        statement = text(
+            """
+            INSERT INTO cache_versions (tag, version) VALUES (:tag, 1)
+            ON CONFLICT (tag) DO UPDATE SET version = cache_versions.version + 1
+            RETURNING version
+            """
+        )
+        updated = {}
+        with self._engine.begin() as conn:
+            for tag in (_GLOBAL_TAG,) + tuple(tags):
+                updated[tag] = conn.execute(statement, {"tag": tag}).scalar_one()
+        with self._lock:
+            for tag, version in updated.items():
+                if version > self._snapshot.get(tag, 0):
+                    self._snapshot[tag] = version
+
+    def _refresh(self) -> None:
+        from sqlalchemy import text
+
+        with self._engine.connect() as conn:
+            rows = conn.execute(text("SELECT tag, version FROM cache_versions")).all()
+        with self._lock:
+            self._snapshot = {tag: version for tag, version in rows}
+            self._loaded_at = time.monotonic()
+
+    def versions(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        if time.monotonic() - self._loaded_at >= self._poll_seconds:
+            self._refresh()
+        snapshot = self._snapshot
+        return tuple(snapshot.get(tag, 0) for tag in tags)
+
+
+_backend = LocalVersionBackend()
+
+
+def init_backend(engine=None) -> None:
+    global _backend
+    kind = config.CACHE_VERSION_BACKEND
+    if kind == "mmap":
+        _backend = MmapVersionBackend(
+            config.CACHE_VERSION_MMAP_PATH, config.CACHE_VERSION_MMAP_SLOTS
+        )
+    elif kind == "db" and engine is not None:
+        _backend = DatabaseVersionBackend(engine, config.CACHE_VERSION_POLL_SECONDS)
+    else:
+        _backend = LocalVersionBackend()
 
 
 def bump_cache_version(*tags: str) -> None:
-    global _GLOBAL_VERSION
-    _GLOBAL_VERSION += 1
-    for tag in _normalize_tags(tags):
-        _TAG_VERSIONS[tag] += 1
+    _backend.bump(_normalize_tags(tags))
 
 
 def cache_version(*tags: str):
     if not tags:
-        return _GLOBAL_VERSION
-    normalized = _normalize_tags(tags)
-    return tuple(_TAG_VERSIONS[tag] for tag in normalized)
+        return _backend.versions((_GLOBAL_TAG,))[0]
+    return _backend.versions(_expand_tags(_normalize_tags(tags)))
+
+
+def scoped_tag(table: str, key: Any) -> str:
+    return f"{table}:{key}"
+
+
+def invalidate(tags: Iterable[str], keys: Optional[Iterable[Any]] = None) -> None:
+    # Una escritura con clave solo invalida "tabla:clave"; sin clave invalida "tabla:*",
+    # que forma parte de la versión de todas las etiquetas con clave de esa tabla.
+    bumped = []
+    for tag in _normalize_tags(tags):
+        bumped.append(tag)
+        if keys is None:
+            bumped.append(scoped_tag(tag, "*"))
+        else:
+            bumped.extend(scoped_tag(tag, key) for key in keys)
+    if bumped:
+        bump_cache_version(*bumped)
+
+
+def _expand_tags(tags: Tuple[str, ...]) -> Tuple[str, ...]:
+    expanded = []
+    for tag in tags:
+        table, sep, _key = tag.partition(":")
+        if sep:
+            expanded.append(scoped_tag(table, "*"))
+        expanded.append(tag)
+    return tuple(expanded)
 
 
 def _normalize_tags(tags: Iterable[str]) -> Tuple[str, ...]:
     return tuple(tag.strip().lower() for tag in tags if tag and tag.strip())
+
+
+_MISSING = object()
+_REGISTRY: Dict[str, "LRUCache"] = {}
+_stale_watch: ContextVar[Optional[list]] = ContextVar("cache_stale_watch", default=None)
+
+
+@contextmanager
+def watch_stale() -> Iterator[list]:
+    """Anota en la lista devuelta las cachés que sirven una entrada caducada."""
+    served: list = []
+    token = _stale_watch.set(served)
+    try:
+        yield served
+    finally:
+        _stale_watch.reset(token)
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+    tags: Tuple[str, ...]
+    version: Tuple[int, ...]
+    size: int
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Any = _MISSING
+        self.error: Optional[BaseException] = None
+
+
+class LRUCache:
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 256,
+        max_bytes: Optional[int] = None,
+        ttl: float = 60.0,
+    ):
+        self.name = name
+        self.max_entries = max(int(max_entries), 1)
+        self.max_bytes = int(max_bytes if max_bytes is not None else config.CACHE_MAX_BYTES)
+        self.ttl = float(ttl)
+        self._items: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self._flights: Dict[Hashable, _Flight] = {}
+        _REGISTRY[name] = self
+
+    def _peek(self, key: Hashable) -> Tuple[Optional[_Entry], Tuple[int, ...]]:
+        # La versión se lee fuera del lock: el backend puede tocar el mmap o la base de datos.
+        entry = self._items.get(key)
+        if entry is None or not entry.tags:
+            return entry, ()
+        return entry, cache_version(*entry.tags)
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._items.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        peeked, version = self._peek(key)
+        with self._lock:
+            entry = self._items.get(key)
+            # Si la entrada cambió mientras se leía la versión, cuenta como fallo sin borrarla.
+            if (
+                entry is None
+                or entry is not peeked
+                or entry.version != version
+                or entry.expires_at <= time.monotonic()
+            ):
+                if entry is not None and entry is peeked:
+                    self._drop(key)
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        tags: Iterable[str] = (),
+        ttl: Optional[float] = None,
+        version: Optional[Tuple[int, ...]] = None,
+    ) -> None:
+        tags = _normalize_tags(tags)
+        if version is None:
+            version = cache_version(*tags) if tags else ()
+        size = _approx_size(value)
+        if size > self.max_bytes:
+            with self._lock:
+                self._drop(key)
+            return
+        entry = _Entry(
+            value=value,
+            expires_at=time.monotonic() + (self.ttl if ttl is None else ttl),
+            tags=tags,
+            version=version,
+            size=size,
+        )
+        with self._lock:
+            self._drop(key)
+            self._items[key] = entry
+            self._bytes += size
+            while len(self._items) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._items))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def get_or_set(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        tags: Iterable[str] = (),
+        ttl: Optional[float] = None,
+        stale_while_revalidate: bool = False,
+        refresh: Optional[Callable[[], Any]] = None,
+    ) -> Any:
+        tags = _normalize_tags(tags)
+        peeked, version = self._peek(key)
+        with self._lock:
+            entry = self._items.get(key)
+            stale = None
+            if entry is not None:
+                current = entry is peeked and entry.version == version
+                if current and entry.expires_at > time.monotonic():
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                # Solo se sirve como obsoleto lo caducado por TTL, nunca lo invalidado por escritura.
+                if current:
+                    stale = entry
+            self.misses += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            if stale is not None and (stale_while_revalidate or not leader):
+                self.stale_hits += 1
+                watch = _stale_watch.get()
+                if watch is not None:
+                    watch.append(self.name)
+                if leader:
+                    threading.Thread(
+                        target=self._refresh_in_background,
+                        args=(key, flight, refresh or loader, tags, ttl),
+                        name=f"cache-refresh-{self.name}",
+                        daemon=True,
+                    ).start()
+                return stale.value
+            if not leader:
+                self.coalesced += 1
+
+        if leader:
+            return self._run_flight(key, flight, loader, tags, ttl)
+        if flight.event.wait(config.CACHE_SINGLE_FLIGHT_TIMEOUT):
+            if flight.error is not None:
+                raise flight.error
+            if flight.value is not _MISSING:
+                return flight.value
+        return loader()
+
+    def _run_flight(
+        self,
+        key: Hashable,
+        flight: _Flight,
+        loader: Callable[[], Any],
+        tags: Tuple[str, ...],
+        ttl: Optional[float],
+    ) -> Any:
+        # La versión se toma antes de cargar: una escritura concurrente invalida el valor.
+        version = cache_version(*tags) if tags else ()
+        try:
+            value = loader()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        else:
+            flight.value = value
+            self.set(key, value, tags=tags, ttl=ttl, version=version)
+            return value
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.event.set()
+
+    def _refresh_in_background(self, key, flight, loader, tags, ttl) -> None:
+        try:
+            self._run_flight(key, flight, loader, tags, ttl)
+        except Exception:
+            logger.exception("No se pudo refrescar la caché %s para %r", self.name, key)
+
+    def invalidate(self, *tags: str) -> int:
+        wanted = set(_normalize_tags(tags))
+        with self._lock:
+            keys = [
+                key
+                for key, entry in self._items.items()
+                if any(tag in wanted or tag.partition(":")[0] in wanted for tag in entry.tags)
+            ]
+            for key in keys:
+                self._drop(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_hits": self.stale_hits,
+                "coalesced": self.coalesced,
+            }
+
+
+def caches() -> Dict[str, LRUCache]:
+    return dict(_REGISTRY)
+
+
+def _approx_size(value: Any, depth: int = 0) -> int:
+    size = sys.getsizeof(value, 64)
+    if depth >= 4:
+        return size
+    if isinstance(value, (str, bytes, bytearray, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, Mapping):
+        return size + sum(
+            _approx_size(k, depth + 1) + _approx_size(v, depth + 1)
+            for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(_approx_size(item, depth + 1) for item in value)
+    return size
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import click
+from flask import Flask
+
+from . import db
+from .services import availability
+
+
+@click.command("crear-indices")
+def crear_indices_command() -> None:
+    """Crea con CONCURRENTLY los índices que falten en una base ya existente."""
+    created = db.create_indexes()
+    if created:
+        click.echo("Índices creados: " + ", ".join(created))
+    else:
+        click.echo("No faltaba ningún índice.")
+
+
+@click.command("verificar-disponibilidad")
+@click.option("--reparar", is_flag=True, help="Reconstruye los contadores si no cuadran.")
+def verificar_disponibilidad_command(reparar: bool) -> None:
+    """Compara los contadores de disponibilidad con un recuento completo."""
+    diferencias = availability.comprobar(reparar=reparar)
+    if not diferencias:
+        click.echo("Los contadores cuadran.")
+        return
+    for diferencia in diferencias:
+        click.echo(diferencia)
+    if reparar:
+        click.echo("Contadores reconstruidos.")
+    else:
+        raise SystemExit(1)
+
+
+def init_app(app: Flask) -> None:
+    app.cli.add_command(crear_indices_command)
+    app.cli.add_command(verificar_disponibilidad_command)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from functools import wraps
+from typing import Callable, Iterable, Optional, Union
+
+from flask import current_app, g, make_response, request, session
+
+from . import cache, config
+from .auth import csrf_token
+
+TagSpec = Union[Iterable[str], Callable[..., Iterable[str]]]
+
+
+def _etag(template: str, tags: Iterable[str], time_bucket: Optional[int]) -> str:
+    user = g.get("current_user")
+    parts = [
+        template,
+        current_app.config.get("SERVER_INSTANCE_ID") or "",
+        user["username"] if user else "",
+        user["role"] if user else "",
+        # La página incrusta el token CSRF de la sesión.
+        csrf_token(),
+        request.query_string.decode("latin-1"),
+        repr(cache.cache_version(*tags)),
+        "" if time_bucket is None else str(time_bucket),
+    ]
+    return hashlib.blake2b("\0".join(parts).encode("utf-8"), digest_size=12).hexdigest()
+
+
+def etag(template: str, tags: TagSpec, time_dependent: bool = False):
+    """GET condicional con un ETag débil derivado de las versiones de caché.
+
+    Si el navegador ya tiene la versión vigente se responde 304 antes de consultar la
+    base de datos o renderizar. ``tags`` puede ser una función de los argumentos de la
+    ruta. Las páginas que filtran por ``now()`` cambian aunque no haya escrituras, así
+    que con ``time_dependent`` el ETag caduca cada ``ETAG_TIME_BUCKET_SECONDS``.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            # Con mensajes flash pendientes la página es irrepetible: ni 304 ni ETag.
+            if not config.ETAGS_ENABLED or request.method not in ("GET", "HEAD") or session.get("_flashes"):
+                return view(**kwargs)
+            bucket = None
+            if time_dependent:
+                bucket = int(time.time() // max(config.ETAG_TIME_BUCKET_SECONDS, 1))
+            resolved = tags(**kwargs) if callable(tags) else tags
+            value = _etag(template, resolved, bucket)
+            if request.if_none_match.contains_weak(value):
+                response = make_response("", 304)
+            else:
+                with cache.watch_stale() as stale:
+                    response = make_response(view(**kwargs))
+                # Una entrada caducada no corresponde al ETag recién calculado: se sirve sin él.
+                if response.status_code != 200 or stale or session.get("_flashes"):
+                    return response
+            response.set_etag(value, weak=True)
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+
+        return wrapper
+
+    return decorator
@@ -16,28 +16,92 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 COOKIE_SECURE = os.getenv("COOKIE_SECURE").lower() == "true"
 
 ATLETICO_TEAM_NAME = "Atleti"
+APP_TIMEZONE = os.getenv("APP_TIMEZONE", "Europe/Madrid")
 
 # API-Football settings
-API_FOOTBALL_BASE = "https://v3.football.api-sports.io"
+API_FOOTBALL_BASE = os.getenv("API_FOOTBALL_BASE", "https://v3.football.api-sports.io")
 API_FOOTBALL_HOST = "v3.football.api-sports.io"
 API_FOOTBALL_TEAM_ID = 530  # Atlético de Madrid en API-Football
 API_FOOTBALL_NEXT = int(os.getenv("API_FOOTBALL_NEXT", "10"))  # número de próximos partidos a traer
 API_FOOTBALL_KEY = os.getenv("API_FOOTBALL_KEY")
+API_FOOTBALL_TIMEOUT = float(os.getenv("API_FOOTBALL_TIMEOUT", "15"))
+API_FOOTBALL_MAX_RETRIES = int(os.getenv("API_FOOTBALL_MAX_RETRIES", "3"))
+API_FOOTBALL_BACKOFF_BASE = float(os.getenv("API_FOOTBALL_BACKOFF_BASE", "0.5"))
+API_FOOTBALL_BACKOFF_MAX = float(os.getenv("API_FOOTBALL_BACKOFF_MAX", "8"))
+# Esperas pedidas por el servidor (Retry-After) más largas que esto abandonan la consulta.
+API_FOOTBALL_RETRY_AFTER_MAX = float(os.getenv("API_FOOTBALL_RETRY_AFTER_MAX", "120"))
+# Respuestas crudas de fixtures, comprimidas y rotadas; FIXTURES_OFFLINE_SOURCE las reproduce sin red.
+FIXTURES_ARCHIVE_ENABLED = os.getenv("FIXTURES_ARCHIVE_ENABLED", "true").lower() == "true"
+FIXTURES_ARCHIVE_DIR = Path(
+    os.getenv("FIXTURES_ARCHIVE_DIR", str(BASE_DIR / "instance" / "fixtures_archive"))
+)
+FIXTURES_ARCHIVE_MAX_FILES = int(os.getenv("FIXTURES_ARCHIVE_MAX_FILES", "50"))
+FIXTURES_ARCHIVE_MAX_AGE_DAYS = int(os.getenv("FIXTURES_ARCHIVE_MAX_AGE_DAYS", "30"))
+FIXTURES_ARCHIVE_MAX_BYTES = int(os.getenv("FIXTURES_ARCHIVE_MAX_BYTES", str(50 * 1024 * 1024)))
+FIXTURES_OFFLINE_SOURCE = Path(os.environ["FIXTURES_OFFLINE_SOURCE"]) if os.getenv("FIXTURES_OFFLINE_SOURCE") else None
 
 SYNC_INTERVAL_MINUTES = int(os.getenv("SYNC_INTERVAL_MINUTES", "180")) #Intervalo de tiempo para llamar a la api
 ENABLE_BG_SYNC = os.getenv("ENABLE_BG_SYNC", "true").lower() == "true"
+# Solo un proceso sincroniza: el que tiene la concesión, que renueva cada tercio de este plazo.
+SYNC_LEASE_SECONDS = int(os.getenv("SYNC_LEASE_SECONDS", "90"))
+# Tope de cada consulta a API-Football (reintentos y esperas incluidos), por debajo de la concesión.
+API_FOOTBALL_MAX_TOTAL_SECONDS = float(
+    os.getenv("API_FOOTBALL_MAX_TOTAL_SECONDS", str(SYNC_LEASE_SECONDS * 2 / 3))
+)
 
 DEFAULT_ADMIN_USERNAME = os.getenv("DEFAULT_ADMIN_USERNAME")
 DEFAULT_ADMIN_HASH = os.getenv("DEFAULT_ADMIN_HASH")
 DEFAULT_ADMIN_SALT = os.getenv("DEFAULT_ADMIN_SALT")
 
 SESSION_MAX_AGE_SECONDS = int(os.getenv("SESSION_MAX_AGE_SECONDS", "604800"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+PASSWORD_HASH_ITERATIONS = int(os.getenv("PASSWORD_HASH_ITERATIONS", "600000"))
+# PBKDF2 se calcula en un pool de procesos; 0 lo calcula en el hilo de la petición.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "8"))
+PASSWORD_HASH_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS", "5"))
 POST_RATE_LIMIT_COUNT = int(os.getenv("POST_RATE_LIMIT_COUNT", "120"))
 POST_RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("POST_RATE_LIMIT_WINDOW_SECONDS", "60"))
 
 DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
 DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
 DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "512"))
+DB_BULK_PAGE_SIZE = int(os.getenv("DB_BULK_PAGE_SIZE", "500"))
 
 LOG_SLOW_QUERIES = os.getenv("LOG_SLOW_QUERIES", "true").lower() == "true"
 SLOW_QUERY_THRESHOLD_MS = int(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+ENABLE_SERVER_TIMING = os.getenv("ENABLE_SERVER_TIMING", "false").lower() == "true"
+QUERY_BUDGET_COUNT = int(os.getenv("QUERY_BUDGET_COUNT", "15"))
+QUERY_BUDGET_MS = float(os.getenv("QUERY_BUDGET_MS", "250"))
+
+# Versionado de caché compartido entre workers: "local", "mmap" (mismo host) o "db" (multi-host)
+CACHE_VERSION_BACKEND = os.getenv("CACHE_VERSION_BACKEND", "local").lower()
+CACHE_VERSION_MMAP_PATH = Path(
+    os.getenv("CACHE_VERSION_MMAP_PATH", str(BASE_DIR / "instance" / "cache_versions.bin"))
+)
+CACHE_VERSION_MMAP_SLOTS = int(os.getenv("CACHE_VERSION_MMAP_SLOTS", "4096"))
+CACHE_VERSION_POLL_SECONDS = float(os.getenv("CACHE_VERSION_POLL_SECONDS", "1"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+CACHE_SINGLE_FLIGHT_TIMEOUT = float(os.getenv("CACHE_SINGLE_FLIGHT_TIMEOUT", "30"))
+CACHE_STALE_WHILE_REVALIDATE = os.getenv("CACHE_STALE_WHILE_REVALIDATE", "false").lower() == "true"
+# ETags débiles en los listados; las páginas que dependen de now() se revalidan por tramos.
+ETAGS_ENABLED = os.getenv("ETAGS_ENABLED", "true").lower() == "true"
+ETAG_TIME_BUCKET_SECONDS = int(os.getenv("ETAG_TIME_BUCKET_SECONDS", "60"))
+# Limitadores de login y POST: "db" (compartido por todos los workers y máquinas), "mmap"
+# (compartido en la máquina) o "local" (por proceso: N workers permiten N veces el límite).
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "db").lower()
+RATE_LIMIT_MMAP_PATH = Path(
+    os.getenv("RATE_LIMIT_MMAP_PATH", str(BASE_DIR / "instance" / "rate_limits.bin"))
+)
+RATE_LIMIT_MMAP_SLOTS = int(os.getenv("RATE_LIMIT_MMAP_SLOTS", "8192"))
+RATE_LIMIT_SWEEP_SECONDS = float(os.getenv("RATE_LIMIT_SWEEP_SECONDS", "60"))
+
+# Métricas: sin METRICS_TOKEN el endpoint /metrics queda desactivado
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Cada worker vuelca aquí sus métricas para que /metrics las sume; METRICS_DIR="" lo desactiva.
+_METRICS_DIR = os.getenv("METRICS_DIR", str(BASE_DIR / "instance" / "metrics"))
+METRICS_DIR = Path(_METRICS_DIR) if _METRICS_DIR else None
+METRICS_STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS", "86400"))
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+CLIENTES_PAGE_SIZE = int(os.getenv("CLIENTES_PAGE_SIZE", "8"))
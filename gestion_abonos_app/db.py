@@ -1,13 +1,19 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
 import logging
+import re
 import time
 from pathlib import Path
-from typing import Any, Optional, Sequence
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
+from flask import g
 from sqlalchemy import (
+    BigInteger,
     Column,
+    DateTime,
+    Float,
     ForeignKey,
     Index,
     Integer,
@@ -17,10 +23,14 @@ from sqlalchemy import (
     create_engine,
     event,
     func,
+    inspect,
     text,
 )
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.sql.elements import TextClause
 
-from . import cache, config
+from . import cache, config, instrumentation, metrics, ratelimit
+from .utils import ACCENTED_CHARS, UNACCENTED_CHARS
 
 
 def _build_database_url() -> str:
@@ -75,7 +85,7 @@ partidos = Table(
     Column("id", Integer, primary_key=True, autoincrement=True),
     Column("jornada", Integer),
     Column("rival", Text),
-    Column("fecha", Text),
+    Column("fecha", DateTime(timezone=True)),
     Column("localia", Integer, server_default="1"),
     Column("competicion", Text),
     Column("api_id", Text, unique=True),
@@ -84,6 +94,7 @@ partidos = Table(
     Column("equipo_visitante", Text),
     Column("logo_local", Text),
     Column("logo_visitante", Text),
+    Column("sync_hash", Text),
 )
 
 abonos = Table(
@@ -123,8 +134,66 @@ asignaciones_parkings = Table(
     Column("asignador", Text, ForeignKey("usuarios.username")),
 )
 
+# Contadores mantenidos por las rutas de asignación; services.availability los verifica y reconstruye.
+disponibilidad_partidos = Table(
+    "disponibilidad_partidos",
+    metadata,
+    Column("id_partido", Integer, ForeignKey("partidos.id"), primary_key=True),
+    Column("abonos_asignados", Integer, nullable=False, server_default="0"),
+    Column("parkings_asignados", Integer, nullable=False, server_default="0"),
+)
+
+totales_recursos = Table(
+    "totales_recursos",
+    metadata,
+    Column("recurso", Text, primary_key=True),
+    Column("total", Integer, nullable=False, server_default="0"),
+)
+
+# Concesión del líder de la sincronización y su último resultado, compartidos entre procesos.
+sync_estado = Table(
+    "sync_estado",
+    metadata,
+    Column("nombre", Text, primary_key=True),
+    Column("lider", Text),
+    Column("lease_hasta", DateTime(timezone=True)),
+    Column("en_curso", Integer, nullable=False, server_default="0"),
+    Column("solicitada", DateTime(timezone=True)),
+    Column("ultimo_inicio", DateTime(timezone=True)),
+    Column("ultimo_fin", DateTime(timezone=True)),
+    Column("duracion", Float),
+    Column("items", Integer),
+    Column("ultimo_error", Text),
+)
+
+rate_limits = Table(
+    "rate_limits",
+    metadata,
+    Column("clave", Text, primary_key=True),
+    Column("ventana", BigInteger),
+    Column("actual", Integer, nullable=False, server_default="0"),
+    Column("anterior", Integer, nullable=False, server_default="0"),
+    Column("expira", Float),
+)
+Index("idx_rate_limits_expira", rate_limits.c.expira)
+
+cache_versions = Table(
+    "cache_versions",
+    metadata,
+    Column("tag", Text, primary_key=True),
+    Column("version", BigInteger, nullable=False, server_default="0"),
+)
+
+# Orden y búsqueda de clientes sin tildes ni mayúsculas; las consultas deben usar esta misma expresión.
+CLIENTE_ORDEN_SQL = f"lower(translate(nombre, '{ACCENTED_CHARS}', '{UNACCENTED_CHARS}'))"
+
 Index("idx_partidos_fecha", partidos.c.fecha)
 Index("idx_clientes_nombre", func.lower(clientes.c.nombre), unique=True)
+Index(
+    "idx_clientes_orden",
+    func.lower(func.translate(clientes.c.nombre, ACCENTED_CHARS, UNACCENTED_CHARS)),
+    clientes.c.id,
+)
 Index(
     "idx_abonos_unique",
     abonos.c.sector,
@@ -134,38 +203,135 @@ Index(
     unique=True,
 )
 Index("idx_parkings_id", parkings.c.id, unique=True)
+Index(
+    "idx_abonos_orden",
+    abonos.c.puerta,
+    abonos.c.sector,
+    abonos.c.fila,
+    abonos.c.asiento,
+    postgresql_include=["id"],
+)
+Index("idx_parkings_nombre", parkings.c.nombre, postgresql_include=["id"])
+Index("idx_partidos_localia_fecha", partidos.c.localia, partidos.c.fecha)
+# Las claves primarias empiezan por id_partido; estos cubren las búsquedas por recurso y por cliente.
+Index("idx_asignaciones_abonos_abono", asignaciones_abonos.c.abono_id)
+Index("idx_asignaciones_abonos_cliente", asignaciones_abonos.c.id_cliente, asignaciones_abonos.c.id_partido)
+Index("idx_asignaciones_parkings_parking", asignaciones_parkings.c.parking_id)
+Index(
+    "idx_asignaciones_parkings_cliente",
+    asignaciones_parkings.c.id_cliente,
+    asignaciones_parkings.c.id_partido,
+)
 
 
 @dataclass
 class DBConnection:
     conn: Any
+    _pending: Dict[str, Optional[set]] = field(default_factory=dict, init=False, repr=False)
 
     def execute(self, statement: str, params: Optional[Sequence[Any]] = None):
-        stmt, bound = _prepare_statement(statement, params)
+        compiled = _compile_statement(statement)
+        stmt, bound = _bind(compiled, statement, params)
         start = time.perf_counter()
         result = self.conn.execute(stmt, bound)
         elapsed_ms = (time.perf_counter() - start) * 1000
+        instrumentation.record_query(statement, params, elapsed_ms)
         if config.LOG_SLOW_QUERIES and elapsed_ms >= config.SLOW_QUERY_THRESHOLD_MS:
             logger.warning(
                 "Slow query %.1fms: %s",
                 elapsed_ms,
                 statement.strip().replace("\n", " "),
             )
-        if _is_write_query(statement):
-            tags = _write_tags(statement)
-            if tags:
-                cache.bump_cache_version(*tags)
+        if compiled.write_target is not None:
+            self._track_write(compiled.write_target, params)
         return ResultProxy(result)
 
+    def execute_values(
+        self,
+        statement: str,
+        rows: Sequence[Sequence[Any]],
+        page_size: Optional[int] = None,
+    ) -> "BulkResult":
+        # La sentencia lleva "{values}" donde van las tuplas: VALUES {values}.
+        rows = [tuple(row) for row in rows]
+        bulk = BulkResult()
+        if not rows:
+            return bulk
+        page_size = page_size or config.DB_BULK_PAGE_SIZE
+        group = "(" + ", ".join("?" for _ in rows[0]) + ")"
+        for start in range(0, len(rows), page_size):
+            chunk = rows[start : start + page_size]
+            result = self.execute(
+                statement.replace("{values}", ", ".join(group for _ in chunk)),
+                [value for row in chunk for value in row],
+            )
+            if result.returns_rows:
+                bulk.rows.extend(result.fetchall())
+            bulk.rowcount += max(result.rowcount, 0)
+        return bulk
+
+    def _track_write(self, target, params: Optional[Sequence[Any]]) -> None:
+        table, positions = target
+        keys = self._pending.get(table, set())
+        if keys is None:
+            return
+        if positions is None or not params or isinstance(params, dict):
+            self._pending[table] = None
+            return
+        keys.update(str(params[idx]) for idx in positions if idx < len(params))
+        self._pending[table] = keys
+
     def commit(self) -> None:
         self.conn.commit()
+        # Se invalida tras el commit para que ningún worker cachee datos sin confirmar.
+        pending, self._pending = self._pending, {}
+        for table, keys in pending.items():
+            cache.invalidate((table,), keys)
+
+    def rollback(self) -> None:
+        self.conn.rollback()
+        self._pending.clear()
 
     def close(self) -> None:
         self.conn.close()
 
 
 def get_connection() -> DBConnection:
-    return DBConnection(engine.connect())
+    start = time.perf_counter()
+    conn = engine.connect()
+    metrics.DB_POOL_CHECKOUT.observe(time.perf_counter() - start)
+    return DBConnection(conn)
+
+
+def get_db() -> DBConnection:
+    # Conexión por petición: solo se saca del pool la primera vez que se usa.
+    conn = g.get("_db_conn")
+    if conn is None:
+        conn = g._db_conn = get_connection()
+    return conn
+
+
+def close_db(exc: Optional[BaseException] = None) -> None:
+    conn = g.pop("_db_conn", None)
+    if conn is None:
+        return
+    try:
+        if exc is None:
+            conn.commit()
+        else:
+            conn.rollback()
+    finally:
+        conn.close()
+
+
+def init_app(app) -> None:
+    app.teardown_appcontext(close_db)
+
+@dataclass
+class BulkResult:
+    rowcount: int = 0
+    rows: list = field(default_factory=list)
+
 
 class ResultProxy:
     def __init__(self, result):
@@ -176,6 +342,10 @@ class ResultProxy:
     def rowcount(self):
         return self._result.rowcount
 
+    @property
+    def returns_rows(self) -> bool:
+        return self._result.returns_rows
+
     def _map(self):
         if self._mappings is None:
             self._mappings = self._result.mappings()
@@ -188,22 +358,44 @@ class ResultProxy:
         return self._map().fetchall()
 
 
+@dataclass(frozen=True)
+class CompiledStatement:
+    clause: TextClause
+    param_names: Tuple[str, ...]
+    is_write: bool
+    write_target: Optional[Tuple[str, Optional[Tuple[int, ...]]]]
+
+
+@lru_cache(maxsize=config.DB_STATEMENT_CACHE_SIZE)
+def _compile_statement(statement: str) -> CompiledStatement:
+    parts = statement.split("?")
+    names = tuple(f"p{idx}" for idx in range(1, len(parts)))
+    rebuilt = "".join(part + f":{name}" for part, name in zip(parts, names)) + parts[-1]
+    is_write = _is_write_query(statement)
+    return CompiledStatement(
+        clause=text(rebuilt),
+        param_names=names,
+        is_write=is_write,
+        write_target=_write_target(statement) if is_write else None,
+    )
+
+
+def _bind(compiled: CompiledStatement, statement: str, params: Optional[Sequence[Any]]):
+    if not params:
+        if compiled.param_names:
+            return text(statement), {}
+        return compiled.clause, {}
+    if isinstance(params, dict):
+        return compiled.clause, params
+    if len(params) < len(compiled.param_names):
+        raise IndexError("Faltan parámetros para la sentencia")
+    return compiled.clause, dict(zip(compiled.param_names, params))
+
+
 def _prepare_statement(
     statement: str, params: Optional[Sequence[Any]]
 ):
-    if not params:
-        return text(statement), {}
-    if "?" in statement:
-        mapped = {}
-        parts = statement.split("?")
-        rebuilt = []
-        for idx, part in enumerate(parts[:-1], start=1):
-            key = f"p{idx}"
-            mapped[key] = params[idx - 1]
-            rebuilt.append(part + f":{key}")
-        rebuilt.append(parts[-1])
-        return text("".join(rebuilt)), mapped
-    return text(statement), params
+    return _bind(_compile_statement(statement), statement, params)
 
 
 def _is_write_query(statement: str) -> bool:
@@ -211,10 +403,25 @@ def _is_write_query(statement: str) -> bool:
     return statement.startswith("INSERT") or statement.startswith("UPDATE") or statement.startswith("DELETE")
 
 
-def _write_tags(statement: str) -> Sequence[str]:
+# Columna que identifica la clave de invalidación de cada tabla (el partido, salvo en recursos).
+_TAG_KEY_COLUMNS = {
+    "partidos": "id",
+    "asignaciones_abonos": "id_partido",
+    "asignaciones_parkings": "id_partido",
+    "abonos": "id",
+    "parkings": "id",
+    "usuarios": "username",
+}
+_INSERT_RE = re.compile(
+    r"^insert\s+into\s+[\w\".]+\s*\(([^)]*)\)\s*values\s*((?:\(\s*[?,\s]*\)\s*,?\s*)+)",
+    re.IGNORECASE,
+)
+
+
+def _write_target(statement: str) -> Optional[Tuple[str, Optional[Tuple[int, ...]]]]:
     statement = statement.strip()
     if not statement:
-        return ()
+        return None
     lowered = statement.lower()
     table = None
     if lowered.startswith("insert"):
@@ -224,8 +431,44 @@ def _write_tags(statement: str) -> Sequence[str]:
     elif lowered.startswith("delete"):
         table = _extract_table_name(lowered, "delete from")
     if not table:
-        return ()
-    return (table,)
+        return None
+    column = _TAG_KEY_COLUMNS.get(table)
+    if column is None:
+        return table, None
+    if lowered.startswith("insert"):
+        return table, _insert_key_positions(lowered, column)
+    return table, _where_key_positions(lowered, column)
+
+
+def _insert_key_positions(statement: str, column: str) -> Optional[Tuple[int, ...]]:
+    match = _INSERT_RE.match(statement)
+    if not match:
+        return None
+    columns = [name.strip().strip('"') for name in match.group(1).split(",")]
+    if column not in columns:
+        return None
+    placeholders = match.group(2).count("?")
+    if statement[: match.start(2)].count("?") or placeholders % len(columns):
+        return None
+    offset = columns.index(column)
+    return tuple(
+        row * len(columns) + offset for row in range(placeholders // len(columns))
+    )
+
+
+def _where_key_positions(statement: str, column: str) -> Optional[Tuple[int, ...]]:
+    where = re.search(r"\swhere\s", statement)
+    if not where:
+        return None
+    head, clause = statement[: where.start()], statement[where.end():]
+    if re.search(r"\bor\b", clause):
+        return None
+    if head.startswith("update") and re.search(rf"\b{column}\s*=", head):
+        return None
+    match = re.search(rf"\b{column}\s*=\s*\?", clause)
+    if not match:
+        return None
+    return (statement.count("?", 0, where.end() + match.end() - 1),)
 
 
 def _extract_table_name(statement: str, keyword: str) -> Optional[str]:
@@ -242,8 +485,69 @@ def _extract_table_name(statement: str, keyword: str) -> Optional[str]:
     return token or None
 
 
+def _migrate_partidos_fecha(conn) -> None:
+    columns = {column["name"]: column for column in inspect(conn).get_columns("partidos")}
+    fecha = columns.get("fecha")
+    if fecha is None or isinstance(fecha["type"], DateTime):
+        return
+    if conn.dialect.name != "postgresql":
+        logger.warning("partidos.fecha sigue siendo texto: migración solo disponible en PostgreSQL")
+        return
+    # Los valores antiguos no llevaban zona, pero no todos significan lo mismo: el
+    # importador de la API sumaba una hora fija a la hora UTC (también en verano), y los
+    # partidos dados de alta a mano guardaban la hora local tal cual se tecleó.
+    timezone_name = config.APP_TIMEZONE.replace("'", "")
+    conn.execute(
+        text(
+            f"""
+            ALTER TABLE partidos
+            ALTER COLUMN fecha TYPE timestamptz
+            USING (
+                CASE
+                    WHEN api_id IS NOT NULL
+                    THEN NULLIF(trim(fecha), '')::timestamp AT TIME ZONE INTERVAL '+01:00'
+                    ELSE NULLIF(trim(fecha), '')::timestamp AT TIME ZONE '{timezone_name}'
+                END
+            )
+            """
+        )
+    )
+    logger.info("partidos.fecha migrada a timestamptz")
+
+
+def _migrate_partidos_sync_hash(conn) -> None:
+    columns = {column["name"] for column in inspect(conn).get_columns("partidos")}
+    if "sync_hash" not in columns:
+        conn.execute(text("ALTER TABLE partidos ADD COLUMN sync_hash TEXT"))
+
+
+def _seed_availability(conn: DBConnection) -> None:
+    # Los contadores recién creados (o vacíos) parten del recuento real; sin esto la
+    # portada mostraría 0 libres y el primer ajuste dejaría el total en 1. Los desajustes
+    # posteriores se revisan con "flask verificar-disponibilidad".
+    from .services import availability
+
+    if conn.execute("SELECT 1 FROM totales_recursos LIMIT 1").fetchone() is None:
+        availability.reconstruir(conn)
+        logger.info("Contadores de disponibilidad inicializados desde las asignaciones")
+
+
+# Identificador arbitrario del advisory lock que serializa el arranque del esquema.
+_SCHEMA_LOCK_ID = 7_415_001
+
+
 def init_db() -> None:
-    metadata.create_all(engine)
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Varios workers arrancan a la vez: el primero crea el esquema y los demás
+            # esperan y lo encuentran hecho, en vez de chocar con "already exists".
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _SCHEMA_LOCK_ID})
+        metadata.create_all(conn)
+        _migrate_partidos_fecha(conn)
+        _migrate_partidos_sync_hash(conn)
+        _seed_availability(DBConnection(conn))
+    cache.init_backend(engine)
+    ratelimit.init_backend(engine)
     if not config.DEFAULT_ADMIN_USERNAME:
         return
 
@@ -267,3 +571,42 @@ def init_db() -> None:
                 ),
             )
             conn.execute(stmt, bound)
+
+
+_CREATE_INDEX_RE = re.compile(r"^CREATE (?:UNIQUE )?INDEX")
+
+
+def create_indexes() -> List[str]:
+    """Crea los índices que falten en tablas ya existentes sin bloquear escrituras.
+
+    create_all solo crea índices junto con su tabla. Se ejecuta una vez por despliegue
+    (``flask --app app crear-indices``), no en cada arranque. Un CONCURRENTLY
+    interrumpido deja el índice marcado como inválido: se elimina y se vuelve a crear.
+    """
+    created = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        postgres = conn.dialect.name == "postgresql"
+        for table in metadata.sorted_tables:
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if postgres:
+                    valid = conn.execute(
+                        text(
+                            """
+                            SELECT i.indisvalid
+                            FROM pg_index i
+                            JOIN pg_class c ON c.oid = i.indexrelid
+                            WHERE c.relname = :name
+                            """
+                        ),
+                        {"name": index.name},
+                    ).scalar()
+                    if valid:
+                        continue
+                    if valid is False:
+                        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+                    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+                    conn.execute(text(_CREATE_INDEX_RE.sub(r"\g<0> CONCURRENTLY", ddl, count=1)))
+                else:
+                    conn.execute(CreateIndex(index, if_not_exists=True))
+                created.append(index.name)
+    return created
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+import logging
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from flask import Flask, g, request
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=512)
+def _statement_key(statement: str) -> str:
+    return " ".join(statement.split())
+
+
+class QueryCollector:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.by_statement: Dict[str, List[float]] = {}
+        self._identical: Counter = Counter()
+
+    def record(self, statement: str, params: Any, elapsed_ms: float) -> None:
+        key = _statement_key(statement)
+        self.count += 1
+        self.total_ms += elapsed_ms
+        stats = self.by_statement.setdefault(key, [0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed_ms
+        self._identical[(key, repr(params))] += 1
+
+    def repeated(self) -> List[Tuple[str, int]]:
+        return [
+            (statement, times)
+            for (statement, _params), times in self._identical.most_common()
+            if times > 1
+        ]
+
+    def over_budget(self, max_queries: Optional[int], max_ms: Optional[float]) -> bool:
+        if max_queries is not None and self.count > max_queries:
+            return True
+        return max_ms is not None and self.total_ms > max_ms
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.total_ms:.1f};desc="{self.count} queries"'
+
+    def summary(self, limit: int = 5) -> str:
+        lines = [f"{self.count} consultas, {self.total_ms:.1f}ms en BD"]
+        slowest = sorted(self.by_statement.items(), key=lambda item: item[1][1], reverse=True)
+        for statement, (times, total_ms) in slowest[:limit]:
+            lines.append(f"  {total_ms:.1f}ms x{times}: {statement[:200]}")
+        for statement, times in self.repeated()[:limit]:
+            lines.append(f"  repetida x{times} (posible N+1): {statement[:200]}")
+        return "\n".join(lines)
+
+
+_current: ContextVar[Optional[QueryCollector]] = ContextVar("query_collector", default=None)
+
+
+def record_query(statement: str, params: Any, elapsed_ms: float) -> None:
+    collector = _current.get()
+    if collector is not None:
+        collector.record(statement, params, elapsed_ms)
+
+
+def current_collector() -> Optional[QueryCollector]:
+    return _current.get()
+
+
+@contextmanager
+def collect_queries() -> Iterator[QueryCollector]:
+    collector = QueryCollector()
+    token = _current.set(collector)
+    try:
+        yield collector
+    finally:
+        _current.reset(token)
+
+
+def init_app(app: Flask) -> None:
+    @app.before_request
+    def start_query_collector():
+        # Dentro de collect_queries() (p. ej. el presupuesto de las pruebas) se suma a ese colector.
+        g._query_collector_token = _current.set(_current.get() or QueryCollector())
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def report_queries(response):
+        collector = _current.get()
+        if collector is None:
+            return response
+        user = g.get("current_user")
+        # Los tiempos de BD dan pistas a un atacante: solo para administradores.
+        if config.ENABLE_SERVER_TIMING and user and user["role"] == "admin":
+            elapsed_ms = (time.perf_counter() - g.get("_request_started", time.perf_counter())) * 1000
+            response.headers.add(
+                "Server-Timing", f"{collector.server_timing()}, app;dur={elapsed_ms:.1f}"
+            )
+        if collector.over_budget(config.QUERY_BUDGET_COUNT, config.QUERY_BUDGET_MS):
+            logger.warning(
+                "Petición %s %s (%s) sobre presupuesto de BD:\n%s",
+                request.method,
+                request.path,
+                request.endpoint,
+                collector.summary(),
+            )
+        return response
+
+    @app.teardown_request
+    def stop_query_collector(_exc=None):
+        token = g.pop("_query_collector_token", None)
+        if token is None:
+            return
+        try:
+            _current.reset(token)
+        except ValueError:
+            _current.set(None)
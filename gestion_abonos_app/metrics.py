@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import Flask, g, request
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, object] = {}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [[list(map(list, key)), value] for key, value in self._values.items()]
+        return {"type": self.type, "help": self.help, "samples": samples}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels) -> None:
+        # Para contadores que ya lleva otro componente (p. ej. las estadísticas de caché).
+        with self._lock:
+            self._values[_label_key(labels)] = float(value)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {
+                    "buckets": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            state["buckets"][bisect_left(self.buckets, value)] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [
+                [list(map(list, key)), {**state, "buckets": list(state["buckets"])}]
+                for key, state in self._values.items()
+            ]
+        return {"type": self.type, "help": self.help, "buckets": list(self.buckets), "samples": samples}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._pid: Optional[int] = None
+        self._started = 0.0
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        # Lo heredado ya figura en la instantánea del padre; el hijo empieza de cero.
+        self._lock = threading.Lock()
+        for metric in list(self._metrics.values()):
+            metric._lock = threading.Lock()
+            metric.reset()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self._collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("Fallo recogiendo métricas")
+        with self._lock:
+            metrics = list(self._metrics.values())
+        pid, started = self.identity()
+        return {
+            "pid": pid,
+            "started": started,
+            "metrics": {metric.name: metric.snapshot() for metric in metrics},
+        }
+
+    def identity(self) -> Tuple[int, float]:
+        # PID más hora de arranque: un PID reciclado no pisa el archivo de un worker muerto.
+        # Se recalcula tras un fork, porque el registro se hereda del proceso padre.
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid = pid
+            self._started = time.time()
+            self._last_flush = 0.0
+        return self._pid, self._started
+
+    def flush(self, force: bool = False) -> None:
+        directory = config.METRICS_DIR
+        if directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < config.METRICS_FLUSH_SECONDS:
+            return
+        self._last_flush = now
+        directory.mkdir(parents=True, exist_ok=True)
+        pid, started = self.identity()
+        target = directory / f"metrics-{pid}-{int(started * 1000)}.json"
+        tmp = target.with_suffix(".tmp")
+        try:
+            tmp.write_text(json.dumps(self.snapshot()), encoding="utf-8")
+            os.replace(tmp, target)
+        except OSError as exc:
+            logger.warning("No se pudieron volcar las métricas: %s", exc)
+
+    def exposition(self) -> str:
+        snapshots = _read_snapshots(config.METRICS_DIR)
+        snapshots[self.identity()] = self.snapshot()
+        return _render(_merge(snapshots))
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+Identity = Tuple[int, float]
+
+
+def _read_snapshots(directory: Optional[Path]) -> Dict[Identity, dict]:
+    snapshots: Dict[Identity, dict] = {}
+    if directory is None or not directory.is_dir():
+        return snapshots
+    now = time.time()
+    for path in directory.glob("metrics-*.json"):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            pid = int(data.get("pid", 0))
+            if not _pid_alive(pid) and now - path.stat().st_mtime > config.METRICS_STALE_SECONDS:
+                # Worker muerto hace tiempo: Prometheus asume el reinicio de sus contadores.
+                path.unlink()
+                continue
+        except (OSError, ValueError):
+            continue
+        snapshots[(pid, float(data.get("started", 0.0)))] = data
+    return snapshots
+
+
+def _live_identities(snapshots: Dict[Identity, dict]) -> set:
+    # De varios archivos con el mismo PID solo el más reciente puede seguir vivo.
+    newest: Dict[int, Identity] = {}
+    for identity in snapshots:
+        pid = identity[0]
+        if pid not in newest or identity[1] > newest[pid][1]:
+            newest[pid] = identity
+    return {
+        identity
+        for pid, identity in newest.items()
+        if pid == os.getpid() or _pid_alive(pid)
+    }
+
+
+def _merge(snapshots: Dict[Identity, dict]) -> Dict[str, dict]:
+    merged: Dict[str, dict] = {}
+    live = _live_identities(snapshots)
+    for identity, snapshot in snapshots.items():
+        alive = identity in live
+        for name, metric in snapshot.get("metrics", {}).items():
+            # Los gauges de procesos muertos ya no describen nada; los contadores se conservan.
+            if metric["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(
+                name,
+                {"type": metric["type"], "help": metric["help"], "buckets": metric.get("buckets"), "samples": {}},
+            )
+            for raw_key, value in metric["samples"]:
+                key = tuple(tuple(pair) for pair in raw_key)
+                if metric["type"] == "histogram":
+                    current = target["samples"].get(key)
+                    if current is None:
+                        target["samples"][key] = {**value, "buckets": list(value["buckets"])}
+                    else:
+                        current["buckets"] = [a + b for a, b in zip(current["buckets"], value["buckets"])]
+                        current["sum"] += value["sum"]
+                        current["count"] += value["count"]
+                else:
+                    target["samples"][key] = target["samples"].get(key, 0.0) + value
+    return merged
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = tuple(key) + extra
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + body + "}"
+
+
+def _render(merged: Dict[str, dict]) -> str:
+    lines: List[str] = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key, value in sorted(metric["samples"].items()):
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(key)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + ["+Inf"], value["buckets"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(key, (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(key)} {value['sum']}")
+            lines.append(f"{name}_count{_format_labels(key)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Duración de las peticiones HTTP por endpoint"
+)
+REQUESTS_TOTAL = registry.counter("http_requests_total", "Peticiones HTTP por endpoint y estado")
+DB_POOL_CHECKOUT = registry.histogram(
+    "db_pool_checkout_seconds", "Espera para obtener una conexión del pool"
+)
+DB_POOL_IN_USE = registry.gauge("db_pool_connections_in_use", "Conexiones del pool en uso")
+DB_POOL_OVERFLOW = registry.gauge("db_pool_overflow", "Conexiones abiertas por encima del tamaño del pool")
+DB_POOL_SIZE = registry.gauge("db_pool_size", "Tamaño configurado del pool")
+CACHE_HITS = registry.counter("cache_hits_total", "Aciertos por caché")
+CACHE_MISSES = registry.counter("cache_misses_total", "Fallos por caché")
+CACHE_EVICTIONS = registry.counter("cache_evictions_total", "Expulsiones por caché")
+CACHE_ENTRIES = registry.gauge("cache_entries", "Entradas en cada caché")
+RATE_LIMIT_REJECTIONS = registry.counter(
+    "rate_limit_rejections_total", "Peticiones rechazadas por el limitador"
+)
+SYNC_DURATION = registry.histogram(
+    "sync_duration_seconds",
+    "Duración de la sincronización de partidos",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0),
+)
+SYNC_RUNS = registry.counter("sync_runs_total", "Sincronizaciones de partidos por resultado")
+
+
+def _collect_runtime() -> None:
+    from . import cache, db
+
+    pool = db.engine.pool
+    for metric, attr in ((DB_POOL_IN_USE, "checkedout"), (DB_POOL_OVERFLOW, "overflow"), (DB_POOL_SIZE, "size")):
+        getter = getattr(pool, attr, None)
+        if getter is not None:
+            metric.set(max(getter(), 0))
+    for name, lru in cache.caches().items():
+        stats = lru.stats()
+        CACHE_HITS.set_total(stats["hits"], cache=name)
+        CACHE_MISSES.set_total(stats["misses"], cache=name)
+        CACHE_EVICTIONS.set_total(stats["evictions"], cache=name)
+        CACHE_ENTRIES.set(stats["entries"], cache=name)
+
+
+registry.add_collector(_collect_runtime)
+atexit.register(registry.flush, True)
+
+
+def init_app(app: Flask) -> None:
+    @app.before_request
+    def start_request_timer():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get("_metrics_started")
+        if started is not None:
+            endpoint = request.endpoint or "unknown"
+            REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+            REQUESTS_TOTAL.inc(endpoint=endpoint, status=response.status_code)
+        registry.flush()
+        return response
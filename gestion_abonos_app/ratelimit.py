@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from . import config
+from .cache import SharedMap
+
+logger = logging.getLogger(__name__)
+
+
+class _State(NamedTuple):
+    window: int
+    current: int
+    previous: int
+
+
+def _slide(
+    state: Optional[_State], now: float, window: float, limit: int
+) -> Tuple[_State, bool, Optional[int]]:
+    """Contador de ventana deslizante: la ventana anterior pesa según lo que queda de ella."""
+    index = int(now // window)
+    if state is None or state.window < index - 1:
+        state = _State(index, 0, 0)
+    elif state.window == index - 1:
+        state = _State(index, 0, state.current)
+    remaining = window - now % window
+    estimate = state.previous * remaining / window + state.current
+    if estimate >= limit:
+        wait = remaining
+        if state.current < limit:
+            # Momento en que el peso de la ventana anterior deja sitio para una petición más.
+            wait -= window * (limit - state.current) / state.previous
+        return state, False, max(int(math.ceil(round(wait, 6))), 1)
+    return _State(state.window, state.current + 1, state.previous), True, None
+
+
+def _expires_at(state: _State, window: float) -> float:
+    return (state.window + 2) * window
+
+
+class LocalBackend:
+    def __init__(self, sweep_seconds: float = 60.0):
+        self._lock = threading.Lock()
+        self._states: Dict[str, Tuple[_State, float]] = {}
+        self._sweep_seconds = sweep_seconds
+        self._next_sweep = 0.0
+
+    def hit(self, key: str, window: float, limit: int, now: float) -> Tuple[bool, Optional[int]]:
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            current = self._states.get(key)
+            state, allowed, wait = _slide(current[0] if current else None, now, window, limit)
+            self._states[key] = (state, _expires_at(state, window))
+            return allowed, wait
+
+    def _sweep(self, now: float) -> None:
+        # Las claves inactivas dos ventanas ya no influyen en nada.
+        for key in [key for key, (_state, expires) in self._states.items() if expires <= now]:
+            del self._states[key]
+        self._next_sweep = now + self._sweep_seconds
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+class MmapBackend:
+    """Tabla de tamaño fijo compartida entre procesos: la memoria no crece con las IPs."""
+
+    _SLOT = struct.Struct("<QqII")
+
+    def __init__(self, path: Path, slots: int = 8192):
+        self._slots = max(int(slots), 1)
+        self._shared = SharedMap(path, self._slots * self._SLOT.size)
+
+    def hit(self, key: str, window: float, limit: int, now: float) -> Tuple[bool, Optional[int]]:
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+        offset = (key_hash % self._slots) * self._SLOT.size
+        with self._shared.locked() as shared:
+            stored_hash, index, current, previous = self._SLOT.unpack_from(shared, offset)
+            state = None
+            # Una colisión con una clave activa comparte contador: limita de más, nunca de menos.
+            if stored_hash and (stored_hash == key_hash or index >= int(now // window) - 1):
+                state = _State(index, current, previous)
+            state, allowed, wait = _slide(state, now, window, limit)
+            self._SLOT.pack_into(shared, offset, key_hash, state.window, state.current, state.previous)
+        return allowed, wait
+
+
+class DatabaseBackend:
+    def __init__(self, engine, sweep_seconds: float = 300.0):
+        self._engine = engine
+        self._sweep_seconds = sweep_seconds
+        self._next_sweep = 0.0
+
+    def hit(self, key: str, window: float, limit: int, now: float) -> Tuple[bool, Optional[int]]:
+        from sqlalchemy import text
+
+        with self._engine.begin() as conn:
+            if now >= self._next_sweep:
+                self._next_sweep = now + self._sweep_seconds
+                conn.execute(text("DELETE FROM rate_limits WHERE expira < :now"), {"now": now})
+            conn.execute(
+                text("INSERT INTO rate_limits (clave) VALUES (:clave) ON CONFLICT (clave) DO NOTHING"),
+                {"clave": key},
+            )
+            row = conn.execute(
+                text("SELECT ventana, actual, anterior FROM rate_limits WHERE clave = :clave FOR UPDATE"),
+                {"clave": key},
+            ).one()
+            state = _State(row.ventana, row.actual, row.anterior) if row.ventana is not None else None
+            state, allowed, wait = _slide(state, now, window, limit)
+            conn.execute(
+                text(
+                    """
+                    UPDATE rate_limits
+                    SET ventana = :ventana, actual = :actual, anterior = :anterior, expira = :expira
+                    WHERE clave = :clave
+                    """
+                ),
+                {
+                    "clave": key,
+                    "ventana": state.window,
+                    "actual": state.current,
+                    "anterior": state.previous,
+                    "expira": _expires_at(state, window),
+                },
+            )
+        return allowed, wait
+
+
+_backend = LocalBackend(config.RATE_LIMIT_SWEEP_SECONDS)
+# Si el almacén compartido falla, cada proceso sigue limitando con sus propios contadores.
+_fallback = LocalBackend(config.RATE_LIMIT_SWEEP_SECONDS)
+
+
+def init_backend(engine=None) -> None:
+    global _backend
+    kind = config.RATE_LIMIT_BACKEND
+    if kind == "mmap":
+        _backend = MmapBackend(config.RATE_LIMIT_MMAP_PATH, config.RATE_LIMIT_MMAP_SLOTS)
+    elif kind == "db" and engine is not None:
+        _backend = DatabaseBackend(engine, config.RATE_LIMIT_SWEEP_SECONDS)
+    else:
+        _backend = LocalBackend(config.RATE_LIMIT_SWEEP_SECONDS)
+
+
+class RateLimiter:
+    def __init__(self, name: str, limit: int, window: float):
+        self.name = name
+        self.limit = int(limit)
+        self.window = float(window)
+
+    def hit(self, key: str) -> Tuple[bool, Optional[int]]:
+        """Cuenta una petición; devuelve (permitida, segundos de espera si no lo está)."""
+        key = f"{self.name}:{key}"
+        now = time.time()
+        try:
+            return _backend.hit(key, self.window, self.limit, now)
+        except Exception:
+            logger.exception("Fallo en el almacén del limitador %s; se usan contadores locales", self.name)
+            return _fallback.hit(key, self.window, self.limit, now)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Mapping
+
+from .. import db
+
+logger = logging.getLogger(__name__)
+
+_COLUMNAS = {"abonos": "abonos_asignados", "parkings": "parkings_asignados"}
+
+
+def liberadas(filas: Iterable[Mapping]) -> Dict[int, int]:
+    """Cambios de contador a partir de las filas devueltas por un DELETE ... RETURNING id_partido."""
+    return {partido_id: -total for partido_id, total in Counter(fila["id_partido"] for fila in filas).items()}
+
+
+def registrar(conn: db.DBConnection, kind: str, cambios: Mapping[int, int]) -> None:
+    # Debe ir en la misma transacción que el cambio de asignaciones.
+    columna = _COLUMNAS[kind]
+    filas = [(partido_id, delta) for partido_id, delta in sorted(cambios.items()) if delta]
+    if not filas:
+        return
+    conn.execute_values(
+        f"""
+        INSERT INTO disponibilidad_partidos (id_partido, {columna})
+        VALUES {{values}}
+        ON CONFLICT (id_partido) DO UPDATE
+        SET {columna} = disponibilidad_partidos.{columna} + excluded.{columna}
+        """,
+        filas,
+    )
+
+
+def ajustar_total(conn: db.DBConnection, kind: str, delta: int) -> None:
+    conn.execute(
+        """
+        INSERT INTO totales_recursos (recurso, total) VALUES (?, ?)
+        ON CONFLICT (recurso) DO UPDATE SET total = totales_recursos.total + excluded.total
+        """,
+        (kind, delta),
+    )
+
+
+def verificar(conn: db.DBConnection) -> List[dict]:
+    """Diferencias entre los contadores guardados y un recuento desde cero."""
+    partidos = conn.execute(
+        """
+        SELECT p.id AS id_partido,
+               COALESCE(d.abonos_asignados, 0) AS abonos_asignados,
+               COALESCE(d.parkings_asignados, 0) AS parkings_asignados,
+               (SELECT COUNT(*) FROM asignaciones_abonos aa WHERE aa.id_partido = p.id) AS abonos_reales,
+               (SELECT COUNT(*) FROM asignaciones_parkings ap WHERE ap.id_partido = p.id) AS parkings_reales
+        FROM partidos p
+        LEFT JOIN disponibilidad_partidos d ON d.id_partido = p.id
+        """
+    ).fetchall()
+    diferencias = [
+        dict(fila)
+        for fila in partidos
+        if fila["abonos_asignados"] != fila["abonos_reales"]
+        or fila["parkings_asignados"] != fila["parkings_reales"]
+    ]
+    totales = conn.execute(
+        """
+        SELECT r.recurso, COALESCE(t.total, 0) AS total, r.recuento
+        FROM (
+            SELECT 'abonos' AS recurso, (SELECT COUNT(*) FROM abonos) AS recuento
+            UNION ALL
+            SELECT 'parkings', (SELECT COUNT(*) FROM parkings)
+        ) AS r
+        LEFT JOIN totales_recursos t ON t.recurso = r.recurso
+        """
+    ).fetchall()
+    diferencias.extend(dict(fila) for fila in totales if fila["total"] != fila["recuento"])
+    return diferencias
+
+
+def reconstruir(conn: db.DBConnection) -> None:
+    # El bloqueo hace esperar a las escrituras en curso, de modo que ningún incremento
+    # se pierde ni se cuenta dos veces respecto al recuento.
+    conn.execute("LOCK TABLE disponibilidad_partidos, totales_recursos IN EXCLUSIVE MODE")
+    conn.execute("DELETE FROM disponibilidad_partidos")
+    conn.execute("DELETE FROM totales_recursos")
+    conn.execute(
+        """
+        INSERT INTO disponibilidad_partidos (id_partido, abonos_asignados, parkings_asignados)
+        SELECT p.id,
+               (SELECT COUNT(*) FROM asignaciones_abonos aa WHERE aa.id_partido = p.id),
+               (SELECT COUNT(*) FROM asignaciones_parkings ap WHERE ap.id_partido = p.id)
+        FROM partidos p
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO totales_recursos (recurso, total)
+        SELECT 'abonos', COUNT(*) FROM abonos
+        UNION ALL
+        SELECT 'parkings', COUNT(*) FROM parkings
+        """
+    )
+
+
+def comprobar(reparar: bool = True) -> List[dict]:
+    conn = db.get_connection()
+    try:
+        diferencias = verificar(conn)
+        if diferencias:
+            logger.warning("Contadores de disponibilidad desajustados: %s", diferencias)
+            if reparar:
+                reconstruir(conn)
+        conn.commit()
+        return diferencias
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, List, Optional
+
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+_PREFIX = "fixtures-"
+_SUFFIX = ".json.gz"
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Un solo hilo: las escrituras y la rotación nunca se pisan entre sí.
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fixtures-archive")
+        return _executor
+
+
+def archive(payload: Any) -> Optional[Future]:
+    """Guarda la respuesta cruda en segundo plano; no bloquea la sincronización."""
+    if not config.FIXTURES_ARCHIVE_ENABLED:
+        return None
+    return _get_executor().submit(_write_safely, payload, datetime.now(timezone.utc))
+
+
+def _write_safely(payload: Any, fetched_at: datetime) -> Optional[Path]:
+    try:
+        path = _write(config.FIXTURES_ARCHIVE_DIR, payload, fetched_at)
+        _rotate(config.FIXTURES_ARCHIVE_DIR)
+        return path
+    except Exception:
+        logger.exception("No se pudo archivar la respuesta de fixtures")
+        return None
+
+
+def _write(directory: Path, payload: Any, fetched_at: datetime) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = fetched_at.strftime("%Y%m%dT%H%M%S.%fZ")
+    target = directory / f"{_PREFIX}{stamp}{_SUFFIX}"
+    tmp = directory / f".{target.name}.{os.getpid()}.tmp"
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    with gzip.open(tmp, "wb", compresslevel=6) as fh:
+        fh.write(data)
+    os.replace(tmp, target)
+    return target
+
+
+def archived_files(directory: Optional[Path] = None) -> List[Path]:
+    """Archivos del más antiguo al más reciente (el nombre lleva la fecha)."""
+    directory = directory or config.FIXTURES_ARCHIVE_DIR
+    if not directory.is_dir():
+        return []
+    return sorted(directory.glob(f"{_PREFIX}*{_SUFFIX}"))
+
+
+def _rotate(directory: Path) -> None:
+    files = archived_files(directory)
+    cutoff = time.time() - config.FIXTURES_ARCHIVE_MAX_AGE_DAYS * 86400
+    kept = total = 0
+    # Del más reciente al más antiguo; el más reciente se conserva siempre para poder
+    # reproducirlo sin red, aunque por sí solo supere el límite de bytes.
+    for path in reversed(files):
+        try:
+            stat = path.stat()
+            # Se suman también los borrados: pasado el límite sobran todos los anteriores.
+            total += stat.st_size
+            if kept and (
+                kept >= config.FIXTURES_ARCHIVE_MAX_FILES
+                or total > config.FIXTURES_ARCHIVE_MAX_BYTES
+                or stat.st_mtime < cutoff
+            ):
+                path.unlink()
+                continue
+            kept += 1
+        except OSError as exc:
+            logger.warning("No se pudo rotar %s: %s", path, exc)
+
+
+def load(source: Optional[Path] = None) -> Any:
+    """Lee una respuesta archivada: un archivo concreto o el más reciente de un directorio."""
+    source = Path(source or config.FIXTURES_ARCHIVE_DIR)
+    if source.is_dir():
+        files = archived_files(source)
+        if not files:
+            raise FileNotFoundError(f"No hay respuestas archivadas en {source}")
+        source = files[-1]
+    opener = gzip.open if source.suffix == ".gz" else open
+    with opener(source, "rt", encoding="utf-8") as fh:
+        return json.load(fh)
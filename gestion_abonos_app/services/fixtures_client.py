@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FixturesAPIError(RuntimeError):
+    pass
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After admite segundos o una fecha HTTP."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class FixturesClient:
+    """Cliente de API-Football con sesión persistente, reintentos y peticiones condicionales.
+
+    ``max_total_seconds`` acota cada llamada a ``get`` con todos sus reintentos y esperas;
+    el planificador lo mantiene por debajo de la concesión de sincronización.
+
+    ``base_url`` y ``sleep`` se pueden sustituir para probarlo contra un servidor local.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str],
+        host: Optional[str] = None,
+        timeout: float = 15.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_throttle_wait: float = 60.0,
+        max_total_seconds: Optional[float] = None,
+        retry_after_max: float = 120.0,
+        session: Optional[requests.Session] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_throttle_wait = max_throttle_wait
+        self.max_total_seconds = max_total_seconds
+        self.retry_after_max = retry_after_max
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._cache: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Tuple[Optional[str], Optional[str], Any]] = {}
+        self._minute_remaining: Optional[int] = None
+        self._minute_reset = 0.0
+        self._daily_exhausted_until: Optional[datetime] = None
+
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["accept"] = "application/json"
+        if api_key:
+            self.session.headers["x-apisports-key"] = api_key
+        if host:
+            self.session.headers["x-rapidapi-host"] = host
+
+    def get(self, path: str, **params) -> Any:
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        cache_key = (url, tuple(sorted((name, str(value)) for name, value in params.items())))
+        deadline = None if self.max_total_seconds is None else time.monotonic() + self.max_total_seconds
+        for attempt in range(self.max_retries + 1):
+            self._throttle(deadline)
+            timeout = self.timeout
+            if deadline is not None:
+                timeout = min(timeout, self._remaining(deadline, url))
+            headers = {}
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                etag, last_modified, _payload = cached
+                if etag:
+                    headers["If-None-Match"] = etag
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                if attempt >= self.max_retries:
+                    raise FixturesAPIError(f"No se pudo conectar con {url}: {exc}") from exc
+                self._backoff(attempt, deadline=deadline)
+                continue
+
+            self._record_quota(response)
+            if response.status_code == 304 and cached is not None:
+                return cached[2]
+            if response.status_code in _RETRY_STATUSES and attempt < self.max_retries:
+                self._backoff(attempt, response.headers.get("Retry-After"), deadline)
+                continue
+            try:
+                response.raise_for_status()
+                payload = response.json()
+            except (requests.RequestException, ValueError) as exc:
+                raise FixturesAPIError(f"Respuesta no válida de {url}: {exc}") from exc
+
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if etag or last_modified:
+                self._cache[cache_key] = (etag, last_modified, payload)
+            return payload
+        raise FixturesAPIError(f"Sin respuesta válida de {url} tras {self.max_retries + 1} intentos")
+
+    @staticmethod
+    def _remaining(deadline: float, url: str) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise FixturesAPIError(f"Tiempo máximo agotado consultando {url}")
+        return remaining
+
+    def _backoff(
+        self, attempt: int, retry_after: Optional[str] = None, deadline: Optional[float] = None
+    ) -> None:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        # "Full jitter": repartir los reintentos en lugar de repetirlos todos a la vez.
+        delay = random.uniform(0, delay)
+        # Retry-After se respeta entero: reintentar antes solo gasta cuota. Si pide más de
+        # lo que se está dispuesto a esperar, se abandona la consulta.
+        requested = _parse_retry_after(retry_after)
+        if requested is not None:
+            if requested > self.retry_after_max:
+                raise FixturesAPIError(f"API-Football pide esperar {requested:.0f}s antes de reintentar")
+            delay = max(delay, requested)
+        if deadline is not None and delay >= deadline - time.monotonic():
+            raise FixturesAPIError("La espera antes de reintentar excede el tiempo máximo de la consulta")
+        logger.info("Reintentando API-Football en %.2fs (intento %s)", delay, attempt + 1)
+        self._sleep(delay)
+
+    def _record_quota(self, response: requests.Response) -> None:
+        headers = response.headers
+        with self._lock:
+            minute = headers.get("X-RateLimit-Remaining")
+            if minute is not None and minute.isdigit():
+                self._minute_remaining = int(minute)
+                self._minute_reset = time.monotonic() + 60
+            daily = headers.get("x-ratelimit-requests-remaining")
+            if daily is not None and daily.isdigit() and int(daily) <= 0:
+                tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+                self._daily_exhausted_until = datetime.combine(tomorrow, datetime.min.time(), timezone.utc)
+                logger.warning("Cuota diaria de API-Football agotada hasta %s", self._daily_exhausted_until)
+
+    def _throttle(self, deadline: Optional[float] = None) -> None:
+        with self._lock:
+            if self._daily_exhausted_until is not None:
+                if datetime.now(timezone.utc) < self._daily_exhausted_until:
+                    raise FixturesAPIError("Cuota diaria de API-Football agotada")
+                self._daily_exhausted_until = None
+            wait = 0.0
+            if self._minute_remaining is not None and self._minute_remaining <= 0:
+                wait = self._minute_reset - time.monotonic()
+        if wait <= 0:
+            return
+        if wait > self.max_throttle_wait or (deadline is not None and wait >= deadline - time.monotonic()):
+            raise FixturesAPIError("Límite por minuto de API-Football alcanzado")
+        logger.info("Límite por minuto de API-Football alcanzado; esperando %.1fs", wait)
+        self._sleep(wait)
+
+
+_client: Optional[FixturesClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> FixturesClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = FixturesClient(
+                config.API_FOOTBALL_BASE,
+                config.API_FOOTBALL_KEY,
+                config.API_FOOTBALL_HOST,
+                timeout=config.API_FOOTBALL_TIMEOUT,
+                max_retries=config.API_FOOTBALL_MAX_RETRIES,
+                backoff_base=config.API_FOOTBALL_BACKOFF_BASE,
+                backoff_max=config.API_FOOTBALL_BACKOFF_MAX,
+                max_total_seconds=config.API_FOOTBALL_MAX_TOTAL_SECONDS,
+                retry_after_max=config.API_FOOTBALL_RETRY_AFTER_MAX,
+            )
+        return _client
@@ -1,69 +1,149 @@
 from __future__ import annotations
 
+import hashlib
 import json
-from datetime import datetime, timedelta, timezone
+import time
 from typing import Dict, Optional
 
-import requests
 from flask import current_app
 
-from .. import config, db, utils
+from .. import config, db, metrics, utils
+from . import fixtures_archive, fixtures_client
 
-_last_sync: Optional[datetime] = None
+
+class SyncError(RuntimeError):
+    pass
 
 
 def _fetch_fixtures(**params) -> list[Dict]:
-    headers = {"accept": "application/json"}
-    if config.API_FOOTBALL_KEY:
-        headers.update(
-            {
-                "x-apisports-key": config.API_FOOTBALL_KEY,
-                "x-rapidapi-host": config.API_FOOTBALL_HOST,
-            }
-        )
+    if config.FIXTURES_OFFLINE_SOURCE is not None:
+        try:
+            payload = fixtures_archive.load(config.FIXTURES_OFFLINE_SOURCE)
+        except (OSError, ValueError) as exc:
+            raise SyncError(f"No se pudo leer la fuente offline de fixtures: {exc}") from exc
     else:
-        current_app.logger.error(
-            "API_FOOTBALL_KEY no está configurada; no se puede sincronizar fixtures."
-        )
-        return []
-
-    try:
-        response = requests.get(
-            f"{config.API_FOOTBALL_BASE}/fixtures",
-            params=params,
-            headers=headers,
-            timeout=15,
-        )
-        response.raise_for_status()
-    except requests.RequestException as exc:
-        current_app.logger.warning("No se pudo sincronizar con fixtures: %s", exc)
-        return []
-
-    payload = response.json() or {}
-    try:
-        dump_path = config.BASE_DIR / "api_events_dump.json"
-        with dump_path.open("w", encoding="utf-8") as fh:
-            json.dump(payload, fh, ensure_ascii=False, indent=2)
-    except Exception as exc:
-        current_app.logger.warning("No se pudo volcar el JSON de fixtures: %s", exc)
+        if not config.API_FOOTBALL_KEY:
+            raise SyncError("API_FOOTBALL_KEY no está configurada; no se puede sincronizar fixtures.")
+        try:
+            payload = fixtures_client.get_client().get("fixtures", **params)
+        except fixtures_client.FixturesAPIError as exc:
+            raise SyncError(str(exc)) from exc
+        fixtures_archive.archive(payload)
 
+    payload = payload or {}
     fixtures = payload.get("response") or []
     if not isinstance(fixtures, list):
-        current_app.logger.warning("Respuesta inesperada de fixtures: %r", payload)
-        return []
+        raise SyncError(f"Respuesta inesperada de fixtures: {payload!r}"[:500])
     return fixtures
 
 
-def sync_upcoming_matches(force: bool = False) -> bool:
-    global _last_sync
-    now = datetime.now(timezone.utc)
-    if (
-        not force
-        and _last_sync is not None
-        and now - _last_sync < timedelta(minutes=config.SYNC_INTERVAL_MINUTES)
-    ):
-        return False
+def sync_upcoming_matches() -> tuple[bool, int]:
+    """Una pasada de sincronización; la planificación vive en services.scheduler."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        updated, count = _sync_fixtures()
+        outcome = "updated" if updated else ("unchanged" if count else "empty")
+    finally:
+        metrics.SYNC_DURATION.observe(time.perf_counter() - started)
+        metrics.SYNC_RUNS.inc(outcome=outcome)
+    return updated, count
+
+
+_FIXTURE_COLUMNS = (
+    "api_id",
+    "jornada",
+    "rival",
+    "fecha",
+    "localia",
+    "competicion",
+    "estadio",
+    "equipo_local",
+    "equipo_visitante",
+    "logo_local",
+    "logo_visitante",
+)
+
+
+def _normalize_fixture(fixture: Dict) -> Optional[Dict]:
+    fixture_info = fixture.get("fixture") or {}
+    league_info = fixture.get("league") or {}
+    teams_info = fixture.get("teams") or {}
+    home_info = teams_info.get("home") or {}
+    away_info = teams_info.get("away") or {}
+
+    api_id = str(fixture_info.get("id") or "")
+    if not api_id:
+        return None
+
+    id_home = str(home_info.get("id") or "")
+    id_away = str(away_info.get("id") or "")
+    home_team = home_info.get("name") or ""
+    away_team = away_info.get("name") or ""
+    logo_home = home_info.get("logo")
+    logo_away = away_info.get("logo")
+
+    is_home = id_home == str(config.API_FOOTBALL_TEAM_ID)
+    if not is_home and id_away != str(config.API_FOOTBALL_TEAM_ID):
+        normalized_team = utils.normalize_team_name(config.ATLETICO_TEAM_NAME)
+        if (
+            utils.normalize_team_name(home_team) != normalized_team
+            and utils.normalize_team_name(away_team) != normalized_team
+        ):
+            current_app.logger.debug("Fixture descartado por nombres: %r", fixture)
+            return None
+        is_home = utils.normalize_team_name(home_team) == normalized_team
+
+    rival = away_team if is_home else home_team
+
+    fecha_raw = fixture_info.get("date") or fixture_info.get("timestamp")
+    fecha = utils.parse_datetime_value(fecha_raw)
+
+    estadio = None
+    venue_info = fixture_info.get("venue") or {}
+    if isinstance(venue_info, dict):
+        estadio = venue_info.get("name")
+
+    competicion = league_info.get("name")
+    jornada = league_info.get("round")
+    try:
+        if isinstance(jornada, str):
+            parts = [int(p) for p in jornada.split() if p.isdigit()]
+            jornada = parts[0] if parts else None
+        else:
+            jornada = int(jornada) if jornada is not None else None
+    except (TypeError, ValueError):
+        jornada = None
+
+    equipo_local, equipo_visitante = (
+        (config.ATLETICO_TEAM_NAME, rival)
+        if is_home
+        else (rival, config.ATLETICO_TEAM_NAME)
+    )
+
+    return {
+        "api_id": api_id,
+        "jornada": jornada,
+        "rival": rival,
+        "fecha": fecha,
+        "localia": 1 if is_home else 0,
+        "competicion": competicion,
+        "estadio": estadio,
+        "equipo_local": equipo_local,
+        "equipo_visitante": equipo_visitante,
+        "logo_local": logo_home,
+        "logo_visitante": logo_away,
+    }
+
+
+def _fixture_hash(row: Dict) -> str:
+    canonical = json.dumps(
+        [row[column] for column in _FIXTURE_COLUMNS], default=str, ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
 
+def _sync_fixtures() -> tuple[bool, int]:
     fixtures = _fetch_fixtures(
         team=config.API_FOOTBALL_TEAM_ID,
         next=config.API_FOOTBALL_NEXT,
@@ -74,112 +154,51 @@ def sync_upcoming_matches(force: bool = False) -> bool:
         config.API_FOOTBALL_TEAM_ID,
     )
     if not fixtures:
-        _last_sync = now
-        return False
-
-    conn = db.get_connection()
-    updated = False
+        return False, 0
 
+    rows: Dict[str, Dict] = {}
     for fixture in fixtures:
-        fixture_info = fixture.get("fixture") or {}
-        league_info = fixture.get("league") or {}
-        teams_info = fixture.get("teams") or {}
-        home_info = teams_info.get("home") or {}
-        away_info = teams_info.get("away") or {}
-
-        api_id = str(fixture_info.get("id") or "")
-        if not api_id:
-            continue
-
-        id_home = str(home_info.get("id") or "")
-        id_away = str(away_info.get("id") or "")
-        home_team = home_info.get("name") or ""
-        away_team = away_info.get("name") or ""
-        logo_home = home_info.get("logo")
-        logo_away = away_info.get("logo")
-
-        is_home = id_home == str(config.API_FOOTBALL_TEAM_ID)
-        if not is_home and id_away != str(config.API_FOOTBALL_TEAM_ID):
-            normalized_team = utils.normalize_team_name(config.ATLETICO_TEAM_NAME)
-            if (
-                utils.normalize_team_name(home_team) != normalized_team
-                and utils.normalize_team_name(away_team) != normalized_team
-            ):
-                current_app.logger.debug("Fixture descartado por nombres: %r", fixture)
-                continue
-            is_home = utils.normalize_team_name(home_team) == normalized_team
-
-        rival = away_team if is_home else home_team
-
-        fecha_raw = fixture_info.get("date") or fixture_info.get("timestamp")
-        fecha = utils.normalize_datetime_value(str(fecha_raw)) if fecha_raw else None
-
-        estadio = None
-        venue_info = fixture_info.get("venue") or {}
-        if isinstance(venue_info, dict):
-            estadio = venue_info.get("name")
-
-        competicion = league_info.get("name")
-        jornada = league_info.get("round")
-        try:
-            if isinstance(jornada, str):
-                parts = [int(p) for p in jornada.split() if p.isdigit()]
-                jornada = parts[0] if parts else None
-            else:
-                jornada = int(jornada) if jornada is not None else None
-        except (TypeError, ValueError):
-            jornada = None
-
-        equipo_local, equipo_visitante = (
-            (config.ATLETICO_TEAM_NAME, rival)
-            if is_home
-            else (rival, config.ATLETICO_TEAM_NAME)
-        )
+        row = _normalize_fixture(fixture)
+        if row is not None:
+            rows[row["api_id"]] = row
+    if not rows:
+        return False, len(fixtures)
 
-        conn.execute(
-            """
-            INSERT INTO partidos (
-                jornada,
-                rival,
-                fecha,
-                localia,
-                competicion,
-                api_id,
-                estadio,
-                equipo_local,
-                equipo_visitante,
-                logo_local,
-                logo_visitante
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(api_id) DO UPDATE SET
-                jornada=excluded.jornada,
-                rival=excluded.rival,
-                fecha=excluded.fecha,
-                localia=excluded.localia,
-                competicion=excluded.competicion,
-                estadio=excluded.estadio,
-                equipo_local=excluded.equipo_local,
-                equipo_visitante=excluded.equipo_visitante,
-                logo_local=excluded.logo_local,
-                logo_visitante=excluded.logo_visitante
+    conn = db.get_connection()
+    try:
+        stored = {
+            row["api_id"]: row["sync_hash"]
+            for row in conn.execute(
+                "SELECT api_id, sync_hash FROM partidos WHERE api_id = ANY(?)",
+                (list(rows),),
+            ).fetchall()
+        }
+        changed = []
+        for api_id, row in rows.items():
+            digest = _fixture_hash(row)
+            if stored.get(api_id) != digest:
+                changed.append(tuple(row[column] for column in _FIXTURE_COLUMNS) + (digest,))
+        # Sin cambios no se escribe nada, así que tampoco se invalida la etiqueta "partidos".
+        if not changed:
+            return False, len(fixtures)
+
+        columns = ", ".join(_FIXTURE_COLUMNS + ("sync_hash",))
+        updates = ", ".join(
+            f"{column}=excluded.{column}" for column in _FIXTURE_COLUMNS[1:] + ("sync_hash",)
+        )
+        conn.execute_values(
+            f"""
+            INSERT INTO partidos ({columns})
+            VALUES {{values}}
+            ON CONFLICT(api_id) DO UPDATE SET {updates}
             """,
-            (
-                jornada,
-                rival,
-                fecha,
-                1 if is_home else 0,
-                competicion,
-                api_id,
-                estadio,
-                equipo_local,
-                equipo_visitante,
-                logo_home,
-                logo_away,
-            ),
+            changed,
         )
-        updated = True
-
-    conn.commit()
-    conn.close()
-    _last_sync = now
-    return updated
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    current_app.logger.info("[sync] %s fixtures changed", len(changed))
+    return True, len(fixtures)
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import threading
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .. import cache, db
+
+
+class _Kind(NamedTuple):
+    recursos: str
+    asignaciones: str
+    columna: str
+
+
+_KINDS: Dict[str, _Kind] = {
+    "abonos": _Kind("abonos", "asignaciones_abonos", "abono_id"),
+    "parkings": _Kind("parkings", "asignaciones_parkings", "parking_id"),
+}
+
+
+class Slot(NamedTuple):
+    cliente_id: int
+    cliente: str
+    asignador: Optional[str]
+
+
+class OccupancyMatrix:
+    """Ocupación de un tipo de recurso en los próximos partidos en casa.
+
+    Cada partido es una fila con un array de ids de cliente (0 = libre) indexado por
+    la posición del recurso, y otro paralelo con el índice del asignador.
+    """
+
+    def __init__(
+        self,
+        recursos: Sequence[int],
+        partidos: Sequence[Tuple[int, datetime]],
+        version: Tuple[int, ...],
+    ):
+        self.version = version
+        self._columnas = {recurso_id: idx for idx, recurso_id in enumerate(recursos)}
+        self._filas = {partido_id: idx for idx, (partido_id, _fecha) in enumerate(partidos)}
+        self._fechas = [fecha for _partido_id, fecha in partidos]
+        self._clientes = [array("q", bytes(8 * len(recursos))) for _ in partidos]
+        self._asignadores = [array("H", bytes(2 * len(recursos))) for _ in partidos]
+        self._nombres: Dict[int, str] = {}
+        self._asignador_nombres: List[Optional[str]] = [None]
+        self._asignador_indices: Dict[str, int] = {}
+
+    def _asignador_idx(self, asignador: Optional[str]) -> int:
+        if not asignador:
+            return 0
+        idx = self._asignador_indices.get(asignador)
+        if idx is None:
+            idx = self._asignador_indices[asignador] = len(self._asignador_nombres)
+            self._asignador_nombres.append(asignador)
+        return idx
+
+    def asignar(
+        self, partido_id: int, recurso_id: int, cliente_id: int, cliente: str, asignador: Optional[str]
+    ) -> None:
+        fila = self._filas.get(partido_id)
+        columna = self._columnas.get(recurso_id)
+        if fila is None or columna is None:
+            return
+        self._clientes[fila][columna] = cliente_id
+        self._asignadores[fila][columna] = self._asignador_idx(asignador)
+        self._nombres[cliente_id] = cliente
+
+    def liberar(self, partido_id: int, recurso_id: int) -> None:
+        fila = self._filas.get(partido_id)
+        columna = self._columnas.get(recurso_id)
+        if fila is None or columna is None:
+            return
+        self._clientes[fila][columna] = 0
+        self._asignadores[fila][columna] = 0
+
+    def slot(self, recurso_id: int, partido_id: int) -> Optional[Slot]:
+        fila = self._filas.get(partido_id)
+        columna = self._columnas.get(recurso_id)
+        if fila is None or columna is None:
+            return None
+        cliente_id = self._clientes[fila][columna]
+        if not cliente_id:
+            return None
+        return Slot(
+            cliente_id,
+            self._nombres.get(cliente_id, ""),
+            self._asignador_nombres[self._asignadores[fila][columna]],
+        )
+
+    def uso(self, recurso_id: int) -> int:
+        """Partidos pendientes en los que el recurso ya está asignado."""
+        columna = self._columnas.get(recurso_id)
+        if columna is None:
+            return 0
+        ahora = datetime.now(timezone.utc)
+        return sum(
+            1
+            for fila, fecha in enumerate(self._fechas)
+            if fecha >= ahora and self._clientes[fila][columna]
+        )
+
+
+_lock = threading.Lock()
+_matrices: Dict[str, OccupancyMatrix] = {}
+
+
+def _tags(kind: str) -> Tuple[str, ...]:
+    spec = _KINDS[kind]
+    return (spec.asignaciones, spec.recursos, "partidos")
+
+
+def _build(kind: str, version: Tuple[int, ...]) -> OccupancyMatrix:
+    spec = _KINDS[kind]
+    conn = db.get_db()
+    recursos = [row["id"] for row in conn.execute(f"SELECT id FROM {spec.recursos} ORDER BY id").fetchall()]
+    partidos = [
+        (row["id"], row["fecha"])
+        for row in conn.execute(
+            """
+            SELECT id, fecha
+            FROM partidos
+            WHERE localia = 1
+              AND fecha IS NOT NULL
+              AND fecha >= now()
+            ORDER BY fecha
+            """
+        ).fetchall()
+    ]
+    matrix = OccupancyMatrix(recursos, partidos, version)
+    asignaciones = conn.execute(
+        f"""
+        SELECT x.id_partido, x.{spec.columna} AS recurso_id, x.id_cliente, c.nombre AS cliente, x.asignador
+        FROM {spec.asignaciones} x
+        JOIN partidos p ON p.id = x.id_partido
+        JOIN clientes c ON c.id = x.id_cliente
+        WHERE p.localia = 1
+          AND p.fecha >= now()
+        """
+    ).fetchall()
+    for row in asignaciones:
+        matrix.asignar(row["id_partido"], row["recurso_id"], row["id_cliente"], row["cliente"], row["asignador"])
+    return matrix
+
+
+def get_matrix(kind: str) -> OccupancyMatrix:
+    version = cache.cache_version(*_tags(kind))
+    with _lock:
+        matrix = _matrices.get(kind)
+        if matrix is not None and matrix.version == version:
+            return matrix
+    # Como en LRUCache, la versión se toma antes de leer para no dar por buena una carga vieja.
+    matrix = _build(kind, version)
+    with _lock:
+        _matrices[kind] = matrix
+    return matrix
+
+
+def _apply(kind: str, mutate) -> None:
+    # Se llama tras el commit. La actualización incremental solo vale si la única
+    # escritura desde que se construyó la matriz es esta (un único salto de versión en
+    # la tabla de asignaciones); si no, se descarta y se reconstruye en la próxima lectura.
+    with _lock:
+        matrix = _matrices.get(kind)
+        if matrix is None:
+            return
+        version = cache.cache_version(*_tags(kind))
+        expected = (matrix.version[0] + 1,) + matrix.version[1:]
+        if version not in (matrix.version, expected):
+            _matrices.pop(kind, None)
+            return
+        mutate(matrix)
+        matrix.version = version
+
+
+def record_assignments(
+    kind: str,
+    partido_id: int,
+    recurso_ids: Iterable[int],
+    cliente_id: int,
+    cliente: str,
+    asignador: Optional[str],
+) -> None:
+    recurso_ids = list(recurso_ids)
+
+    def mutate(matrix: OccupancyMatrix) -> None:
+        for recurso_id in recurso_ids:
+            matrix.asignar(partido_id, int(recurso_id), int(cliente_id), cliente, asignador)
+
+    _apply(kind, mutate)
+
+
+def record_release(kind: str, partido_id: int, recurso_id: int) -> None:
+    _apply(kind, lambda matrix: matrix.liberar(partido_id, recurso_id))
+
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import logging
+import os
+import secrets
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from flask import Flask
+
+from .. import config, db
+from . import matches
+
+logger = logging.getLogger(__name__)
+
+_JOB = "fixtures"
+
+
+class SyncScheduler:
+    """Sincronización de partidos en un hilo propio; las peticiones nunca esperan por ella.
+
+    Todos los procesos ejecutan el hilo, pero solo sincroniza el que tiene la concesión
+    en ``sync_estado``. Si el líder muere, la concesión caduca y otro la toma en el
+    siguiente latido. La hora de la última pasada también vive en esa fila.
+    """
+
+    def __init__(self):
+        self._app: Optional[Flask] = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.identity = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+    @property
+    def heartbeat(self) -> float:
+        return max(config.SYNC_LEASE_SECONDS / 3, 1.0)
+
+    def init_app(self, app: Flask, start: bool = True) -> None:
+        self._app = app
+        if start:
+            self.start()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="fixtures-sync", daemon=True)
+            self._thread.start()
+
+    def trigger(self, conn: db.DBConnection) -> bool:
+        """Pide una sincronización al líder. Devuelve False si ya hay una en curso."""
+        if self.status(conn)["running"]:
+            return False
+        conn.execute(
+            """
+            INSERT INTO sync_estado (nombre, solicitada) VALUES (?, now())
+            ON CONFLICT (nombre) DO UPDATE SET solicitada = now()
+            """,
+            (_JOB,),
+        )
+        conn.commit()
+        if self._thread is not None:
+            self._wake.set()
+        else:
+            threading.Thread(target=self._tick_safely, name="fixtures-sync-once", daemon=True).start()
+        return True
+
+    def status(self, conn: db.DBConnection) -> Dict[str, Any]:
+        row = conn.execute(
+            """
+            SELECT lider,
+                   en_curso = 1 AND lease_hasta > now() AS running,
+                   solicitada IS NOT NULL AS requested,
+                   ultimo_inicio AS last_started,
+                   ultimo_fin AS last_finished,
+                   duracion AS duration,
+                   items,
+                   ultimo_error AS last_error,
+                   ultimo_inicio + make_interval(mins => ?) AS next_run
+            FROM sync_estado
+            WHERE nombre = ?
+            """,
+            (config.SYNC_INTERVAL_MINUTES, _JOB),
+        ).fetchone()
+        if row is None:
+            return {
+                "lider": None,
+                "running": False,
+                "requested": False,
+                "last_started": None,
+                "last_finished": None,
+                "duration": None,
+                "items": None,
+                "last_error": None,
+                "next_run": None,
+            }
+        return dict(row)
+
+    def _loop(self) -> None:
+        while True:
+            self._tick_safely()
+            self._wake.wait(timeout=self.heartbeat)
+            self._wake.clear()
+
+    def _tick_safely(self) -> None:
+        try:
+            self._tick()
+        except Exception:
+            logger.exception("Fallo en el planificador de sincronización")
+
+    def _acquire(self, conn: db.DBConnection) -> bool:
+        # Toma la concesión si está libre o caducada, o la renueva si ya es nuestra.
+        row = conn.execute(
+            """
+            INSERT INTO sync_estado (nombre, lider, lease_hasta)
+            VALUES (?, ?, now() + make_interval(secs => ?))
+            ON CONFLICT (nombre) DO UPDATE
+            SET lider = excluded.lider, lease_hasta = excluded.lease_hasta
+            WHERE sync_estado.lider = excluded.lider
+               OR sync_estado.lease_hasta IS NULL
+               OR sync_estado.lease_hasta < now()
+            RETURNING lider
+            """,
+            (_JOB, self.identity, float(config.SYNC_LEASE_SECONDS)),
+        ).fetchone()
+        conn.commit()
+        return row is not None
+
+    def _renew_lease(self, done: threading.Event) -> None:
+        while not done.wait(self.heartbeat):
+            try:
+                conn = db.get_connection()
+                try:
+                    renewed = conn.execute(
+                        """
+                        UPDATE sync_estado
+                        SET lease_hasta = now() + make_interval(secs => ?)
+                        WHERE nombre = ?
+                          AND lider = ?
+                        """,
+                        (float(config.SYNC_LEASE_SECONDS), _JOB, self.identity),
+                    )
+                    conn.commit()
+                finally:
+                    conn.close()
+                if not renewed.rowcount:
+                    logger.warning("Concesión de sincronización perdida durante la pasada")
+                    return
+            except Exception:
+                logger.exception("No se pudo renovar la concesión de sincronización")
+
+    def _tick(self) -> None:
+        if self._app is None or self._running:
+            return
+        conn = db.get_connection()
+        try:
+            if not self._acquire(conn):
+                return
+            claimed = conn.execute(
+                """
+                UPDATE sync_estado
+                SET en_curso = 1, ultimo_inicio = now(), solicitada = NULL
+                WHERE nombre = ?
+                  AND lider = ?
+                  AND (
+                      solicitada IS NOT NULL
+                      OR ultimo_inicio IS NULL
+                      OR ultimo_inicio + make_interval(mins => ?) <= now()
+                  )
+                """,
+                (_JOB, self.identity, config.SYNC_INTERVAL_MINUTES),
+            )
+            conn.commit()
+            if not claimed.rowcount:
+                return
+        finally:
+            conn.close()
+
+        # Con reintentos y esperas de cuota la pasada puede durar más que la concesión:
+        # se renueva mientras tanto para que ningún otro proceso la tome a la vez.
+        self._running = True
+        done = threading.Event()
+        renewer = threading.Thread(
+            target=self._renew_lease, args=(done,), name="fixtures-sync-lease", daemon=True
+        )
+        renewer.start()
+        started = time.perf_counter()
+        items = None
+        error = None
+        try:
+            with self._app.app_context():
+                _updated, items = matches.sync_upcoming_matches()
+        except Exception as exc:
+            logger.exception("Fallo sincronizando partidos")
+            error = str(exc)
+        finally:
+            done.set()
+            renewer.join()
+            self._running = False
+
+        conn = db.get_connection()
+        try:
+            conn.execute(
+                """
+                UPDATE sync_estado
+                SET en_curso = 0,
+                    ultimo_fin = now(),
+                    duracion = ?,
+                    items = ?,
+                    ultimo_error = ?,
+                    lease_hasta = now() + make_interval(secs => ?)
+                WHERE nombre = ?
+                  AND lider = ?
+                """,
+                (
+                    time.perf_counter() - started,
+                    items,
+                    error,
+                    float(config.SYNC_LEASE_SECONDS),
+                    _JOB,
+                    self.identity,
+                ),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+scheduler = SyncScheduler()
+
+
+def init_app(app: Flask) -> None:
+    # Con el recargador de Werkzeug solo arranca el hilo en el proceso hijo.
+    start = config.ENABLE_BG_SYNC and (not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true")
+    scheduler.init_app(app, start=start)
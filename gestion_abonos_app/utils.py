@@ -1,11 +1,19 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import unicodedata
 from typing import Any, Dict, Optional, Tuple, Union
+from zoneinfo import ZoneInfo
 
 from . import config
 
+LOCAL_TZ = ZoneInfo(config.APP_TIMEZONE)
+
+# Misma tabla que usa translate() en la clave de orden de clientes (db.CLIENTE_ORDEN_SQL).
+ACCENTED_CHARS = "ÁÀÂÄÃáàâäãÉÈÊËéèêëÍÌÎÏíìîïÓÒÔÖÕóòôöõÚÙÛÜúùûüÑñÇç"
+UNACCENTED_CHARS = "AAAAAaaaaaEEEEeeeeIIIIiiiiOOOOOoooooUUUUuuuuNnCc"
+_UNACCENT = str.maketrans(ACCENTED_CHARS, UNACCENTED_CHARS)
+
 
 def normalize_text(value: Optional[str]) -> str:
     return value.strip() if value else ""
@@ -21,6 +29,10 @@ def normalize_team_name(value: Optional[str]) -> str:
     return without_accents.lower().strip()
 
 
+def search_key(value: Optional[str]) -> str:
+    return (value or "").translate(_UNACCENT).lower()
+
+
 def normalize_datetime_value(value: Optional[str]) -> Optional[str]:
     if not value:
         return None
@@ -39,6 +51,32 @@ def normalize_datetime_value(value: Optional[str]) -> Optional[str]:
         return None
 
 
+def parse_datetime_value(value: Union[str, int, float, datetime, None]) -> Optional[datetime]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, (int, float)) or str(value).strip().isdigit():
+        return datetime.fromtimestamp(int(value), tz=timezone.utc)
+    else:
+        try:
+            dt = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+        except ValueError:
+            normalized = normalize_datetime_value(str(value))
+            if not normalized:
+                return None
+            dt = datetime.fromisoformat(normalized)
+    # Las fechas sin zona se interpretan en hora local (como las introducen los operadores).
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=LOCAL_TZ)
+    return dt
+
+
+def local_datetime(value: Union[str, datetime, None]) -> Optional[datetime]:
+    dt = parse_datetime_value(value)
+    return dt.astimezone(LOCAL_TZ) if dt else None
+
+
 def combine_datetime(
     date_value: Optional[str], time_value: Optional[str]
 ) -> Optional[str]:
@@ -78,23 +116,21 @@ def format_parking(parking: Union[Dict[str, Any], Any, None]) -> str:
     return f"Plaza {nombre}"
 
 
-def human_datetime(value: Optional[str]) -> str:
+def human_datetime(value: Union[str, datetime, None]) -> str:
     if not value:
         return "Sin confirmar"
-    normalized = normalize_datetime_value(value)
-    if not normalized:
+    dt = local_datetime(value)
+    if not dt:
         return value
-    dt = datetime.fromisoformat(normalized)
     return dt.strftime("%d/%m/%Y %H:%M")
 
 
-def simple_human_date(value: Optional[str]) -> str:
+def simple_human_date(value: Union[str, datetime, None]) -> str:
     if not value:
         return "--/--"
-    normalized = normalize_datetime_value(value)
-    if not normalized:
+    dt = local_datetime(value)
+    if not dt:
         return value
-    dt = datetime.fromisoformat(normalized)
     return dt.strftime("%d/%m")
 
 
@@ -93,53 +93,66 @@ document.addEventListener("DOMContentLoaded", () => {
     applyFilter();
   }
 
-  const accordionSearch = document.querySelector("[data-client-search-accordion]");
-  const accordionItems = Array.from(document.querySelectorAll("[data-client-accordion-item]"));
-  const loadMoreBtn = document.querySelector("[data-clients-load-more]");
-  const loadMoreWrap = document.getElementById("clientesLoadMoreWrap");
-  if (accordionItems.length > 0) {
-    const pageSize = 8;
-    let visibleCount = pageSize;
-    const normalize = (value) =>
-      (value || "")
-        .toLowerCase()
-        .normalize("NFD")
-        .replace(/[\u0300-\u036f]/g, "");
-
-    const applyAccordionView = () => {
-      const query = normalize(accordionSearch ? accordionSearch.value.trim() : "");
-      const filtered = accordionItems.filter((item) => {
-        const name = normalize(item.getAttribute("data-client-name") || item.textContent);
-        return !query || name.includes(query);
-      });
-
-      accordionItems.forEach((item) => {
-        item.style.display = "none";
-      });
-      filtered.slice(0, visibleCount).forEach((item) => {
-        item.style.display = "";
-      });
-
+  const clientsList = document.querySelector("[data-clients-list]");
+  if (clientsList) {
+    const accordionSearch = document.querySelector("[data-client-search-accordion]");
+    const loadMoreBtn = document.querySelector("[data-clients-load-more]");
+    const loadMoreWrap = document.getElementById("clientesLoadMoreWrap");
+    const emptyState = document.querySelector("[data-clients-empty]");
+    let nextCursor = clientsList.dataset.nextCursor || "";
+    let requestId = 0;
+    let searchTimer = null;
+
+    const updateControls = () => {
       if (loadMoreWrap) {
-        loadMoreWrap.classList.toggle("d-none", filtered.length <= visibleCount);
+        loadMoreWrap.classList.toggle("d-none", !nextCursor);
+      }
+      if (emptyState) {
+        emptyState.classList.toggle("d-none", clientsList.children.length > 0);
+      }
+    };
+
+    const fetchPage = async (append) => {
+      const params = new URLSearchParams();
+      const query = accordionSearch ? accordionSearch.value.trim() : "";
+      if (query) params.set("q", query);
+      if (append && nextCursor) params.set("cursor", nextCursor);
+      const current = ++requestId;
+      if (loadMoreBtn) loadMoreBtn.disabled = true;
+      try {
+        const response = await fetch(`${clientsList.dataset.pageUrl}?${params}`, {
+          headers: { "X-Requested-With": "fetch" },
+        });
+        if (!response.ok || current !== requestId) return;
+        const html = await response.text();
+        if (append) {
+          clientsList.insertAdjacentHTML("beforeend", html);
+        } else {
+          clientsList.innerHTML = html;
+        }
+        nextCursor = response.headers.get("X-Next-Cursor") || "";
+        updateControls();
+      } finally {
+        if (loadMoreBtn && current === requestId) loadMoreBtn.disabled = false;
       }
     };
 
     if (accordionSearch) {
+      accordionSearch.form?.addEventListener("submit", (event) => {
+        event.preventDefault();
+        fetchPage(false);
+      });
       accordionSearch.addEventListener("input", () => {
-        visibleCount = pageSize;
-        applyAccordionView();
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => fetchPage(false), 250);
       });
     }
 
     if (loadMoreBtn) {
-      loadMoreBtn.addEventListener("click", () => {
-        visibleCount += pageSize;
-        applyAccordionView();
-      });
+      loadMoreBtn.addEventListener("click", () => fetchPage(true));
     }
 
-    applyAccordionView();
+    updateControls();
   }
 
   const setupLoadMore = (itemSelector, buttonSelector, wrapId, pageSize = 8) => {
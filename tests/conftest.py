@@ -0,0 +1,165 @@
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Las pruebas nunca usan DATABASE_URL del entorno: solo una base de pruebas explícita.
+os.environ["DATABASE_URL"] = os.getenv(
+    "TEST_DATABASE_URL", "postgresql+psycopg2://gestion_abonos_test@127.0.0.1:1/gestion_abonos_test"
+)
+os.environ.setdefault("COOKIE_SECURE", "false")
+os.environ.setdefault("SECRET_KEY", "pruebas")
+os.environ["ENABLE_BG_SYNC"] = "false"
+
+# Prefijo de todo lo que siembran las pruebas, para poder borrarlo al terminar.
+PREFIX = "zz-plan-"
+PARKING_BASE = 9_000_000
+ADMIN = f"{PREFIX}admin"
+CSRF_TOKEN = "token-de-pruebas"
+
+
+@pytest.fixture(scope="session")
+def app():
+    from sqlalchemy.exc import OperationalError
+
+    from gestion_abonos_app import create_app
+
+    try:
+        app = create_app()
+    except OperationalError:
+        pytest.skip("PostgreSQL de pruebas no disponible (TEST_DATABASE_URL)")
+    app.config["TESTING"] = True
+    return app
+
+
+@pytest.fixture(scope="session")
+def seeded(app):
+    """300 clientes, 400 abonos, 60 parkings y 20 partidos con asignaciones."""
+    from sqlalchemy import text
+
+    from gestion_abonos_app import db
+    from gestion_abonos_app.services import availability
+
+    now = datetime.now(timezone.utc)
+    with db.engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                INSERT INTO usuarios (username, password_hash, salt, role)
+                VALUES (:u, 'x', 'x', 'admin')
+                ON CONFLICT (username) DO NOTHING
+                """
+            ),
+            {"u": ADMIN},
+        )
+        clientes = conn.execute(
+            text("INSERT INTO clientes (nombre) SELECT :p || g FROM generate_series(1, 300) g RETURNING id"),
+            {"p": PREFIX},
+        ).scalars().all()
+        abonos = conn.execute(
+            text(
+                """
+                INSERT INTO abonos (sector, puerta, fila, asiento, id_propietario)
+                SELECT 900 + g % 7, g % 11, g % 13, g, :cliente
+                FROM generate_series(1, 400) g
+                RETURNING id
+                """
+            ),
+            {"cliente": clientes[0]},
+        ).scalars().all()
+        conn.execute(
+            text(
+                """
+                INSERT INTO parkings (id, nombre, id_propietario)
+                SELECT :base + g, :p || g, :cliente FROM generate_series(1, 60) g
+                """
+            ),
+            {"base": PARKING_BASE, "p": PREFIX, "cliente": clientes[1]},
+        )
+        partidos = [
+            conn.execute(
+                text(
+                    """
+                    INSERT INTO partidos (rival, fecha, localia, competicion, api_id)
+                    VALUES (:rival, :fecha, :localia, 'Liga', :api)
+                    RETURNING id
+                    """
+                ),
+                {
+                    "rival": f"{PREFIX}{i}",
+                    "fecha": now + timedelta(days=i - 5),
+                    "localia": i % 2,
+                    "api": f"{PREFIX}{i}",
+                },
+            ).scalar()
+            for i in range(20)
+        ]
+        for offset, partido_id in enumerate(partidos):
+            conn.execute(
+                text(
+                    """
+                    INSERT INTO asignaciones_abonos (id_cliente, id_partido, abono_id, asignador)
+                    VALUES (:c, :p, :a, :u)
+                    """
+                ),
+                [
+                    {"c": clientes[abono_id % len(clientes)], "p": partido_id, "a": abono_id, "u": ADMIN}
+                    for abono_id in abonos[offset : offset + 40]
+                ],
+            )
+            conn.execute(
+                text(
+                    """
+                    INSERT INTO asignaciones_parkings (id_cliente, id_partido, parking_id, asignador)
+                    VALUES (:c, :p, :k, :u)
+                    """
+                ),
+                {"c": clientes[offset], "p": partido_id, "k": PARKING_BASE + offset + 1, "u": ADMIN},
+            )
+        for table in ("clientes", "abonos", "parkings", "partidos", "asignaciones_abonos", "asignaciones_parkings"):
+            conn.execute(text(f"ANALYZE {table}"))
+    availability.comprobar(reparar=True)
+    yield {"clientes": clientes, "abonos": abonos, "partidos": partidos}
+
+    with db.engine.begin() as conn:
+        for table in ("asignaciones_abonos", "asignaciones_parkings", "disponibilidad_partidos"):
+            conn.execute(text(f"DELETE FROM {table} WHERE id_partido = ANY(:ids)"), {"ids": partidos})
+        conn.execute(text("DELETE FROM partidos WHERE id = ANY(:ids)"), {"ids": partidos})
+        conn.execute(text("DELETE FROM abonos WHERE id = ANY(:ids)"), {"ids": abonos})
+        conn.execute(text("DELETE FROM parkings WHERE id > :base"), {"base": PARKING_BASE})
+        conn.execute(text("DELETE FROM clientes WHERE nombre LIKE :p"), {"p": f"{PREFIX}%"})
+        conn.execute(text("DELETE FROM usuarios WHERE username = :u"), {"u": ADMIN})
+    availability.comprobar(reparar=True)
+
+
+@pytest.fixture
+def admin_client(app, seeded):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["username"] = ADMIN
+        session["role"] = "admin"
+        session["login_ts"] = int(time.time())
+        session["server_instance"] = app.config["SERVER_INSTANCE_ID"]
+        session["csrf_token"] = CSRF_TOKEN
+    return client
+
+
+@pytest.fixture
+def query_budget():
+    """``with query_budget(n): client.get(...)`` falla si la petición lanza más de n consultas."""
+    from gestion_abonos_app import instrumentation
+
+    @contextmanager
+    def budget(max_queries):
+        with instrumentation.collect_queries() as collector:
+            yield collector
+        assert collector.count <= max_queries, collector.summary()
+
+    return budget
+
+
+@pytest.fixture
+def csrf_token():
+    return CSRF_TOKEN
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+from flask import session
+
+from gestion_abonos_app import cache, config, db
+from gestion_abonos_app.auth import routes
+
+ADMIN = "zz-plan-admin"
+
+
+@pytest.fixture
+def client(admin_client, monkeypatch):
+    monkeypatch.setattr(config, "ETAGS_ENABLED", False)
+    for lru in cache.caches().values():
+        lru.clear()
+    return admin_client
+
+
+def _user_queries(collector):
+    return sum(count for statement, (count, _ms) in collector.by_statement.items() if "FROM usuarios" in statement)
+
+
+def test_session_user_is_served_from_memory(client, query_budget):
+    with query_budget(2) as collector:
+        client.get("/")
+    assert _user_queries(collector) == 1
+    hits = routes._USER_CACHE.hits
+    # Página y usuario en caché: la petición no toca la base de datos.
+    with query_budget(0):
+        assert client.get("/").status_code == 200
+    assert routes._USER_CACHE.hits == hits + 1
+
+
+def test_user_write_invalidates_the_cached_user(client, query_budget):
+    client.get("/")
+    conn = db.get_connection()
+    try:
+        conn.execute("UPDATE usuarios SET role = ? WHERE username = ?", ("admin", ADMIN))
+        conn.commit()
+    finally:
+        conn.close()
+    with query_budget(1) as collector:
+        client.get("/")
+    assert _user_queries(collector) == 1
+
+
+def test_benchmark_session_user_lookup(app, seeded):
+    rounds = 200
+
+    def lookups(clear):
+        routes._USER_CACHE.clear()
+        start = time.perf_counter()
+        for _ in range(rounds):
+            if clear:
+                routes._USER_CACHE.clear()
+            assert routes._load_session_user()["username"] == ADMIN
+        return (time.perf_counter() - start) / rounds * 1e6
+
+    with app.test_request_context():
+        session.update(username=ADMIN, role="admin", server_instance=app.config["SERVER_INSTANCE_ID"])
+        misses = lookups(clear=True)
+        hits_before = routes._USER_CACHE.hits
+        cached = lookups(clear=False)
+        hit_rate = (routes._USER_CACHE.hits - hits_before) / rounds
+        db.close_db()
+    print(f"\nusuario de la sesión: {misses:.0f} µs sin caché, {cached:.0f} µs con caché, aciertos {hit_rate:.1%}")
+    assert hit_rate >= (rounds - 1) / rounds
+    assert cached * 5 < misses
+
+
+def test_static_requests_skip_session_and_database(app, client, query_budget):
+    for test_client in (app.test_client(), client):
+        with query_budget(0):
+            response = test_client.get("/static/css/main.css")
+        assert response.status_code == 200
+        assert "Set-Cookie" not in response.headers
+        response.close()
+
+
+def test_unchanged_session_is_not_resent(client):
+    client.get("/")
+    response = client.get("/")
+    assert response.status_code == 200
+    assert "Set-Cookie" not in response.headers
+
+
+def test_benchmark_before_request_chain(app, client):
+    # Solo los hooks: el resto de la petición es igual antes y después del middleware.
+    client.get("/")
+    cookie = client.get_cookie(app.config.get("SESSION_COOKIE_NAME", "session")).value
+    headers = {"Cookie": f"session={cookie}"}
+    rates = {}
+    for nombre, url in (("estático", "/static/css/login.css"), ("página en caché", "/")):
+        rounds = 2000
+        with app.test_request_context(url, headers=headers):
+            app.preprocess_request()
+            start = time.perf_counter()
+            for _ in range(rounds):
+                app.preprocess_request()
+            rates[nombre] = (time.perf_counter() - start) / rounds * 1e6
+    print("\nbefore_request: " + ", ".join(f"{k} {v:.1f} µs" for k, v in rates.items()))
+    assert rates["estático"] < rates["página en caché"]
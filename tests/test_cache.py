@@ -0,0 +1,158 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from gestion_abonos_app import cache
+
+_fork = pytest.mark.skipif(not hasattr(os, "fork"), reason="requiere fork")
+
+
+def _bump_many(backend, tag, times, start=None):
+    if start is not None:
+        start.wait()
+    for _ in range(times):
+        backend.bump((tag,))
+
+
+def _bump_and_watch(backend, workers, seen, start):
+    # Cada worker anota su versión inicial, escribe y espera a ver las escrituras de los demás.
+    start.wait()
+    backend.bump((f"worker:{os.getpid()}", "partidos"))
+    deadline = time.monotonic() + 5
+    while backend.versions(("partidos",))[0] < workers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    seen.put(backend.versions(("partidos",))[0])
+
+
+@_fork
+def test_mmap_versions_are_visible_across_processes(tmp_path):
+    # Creado antes del fork, como con gunicorn --preload.
+    backend = cache.MmapVersionBackend(tmp_path / "versions.bin", slots=64)
+    ctx = multiprocessing.get_context("fork")
+    child = ctx.Process(target=_bump_many, args=(backend, "partidos:7", 1))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+    assert backend.versions(("partidos:7",)) == (1,)
+    assert backend.versions((cache._GLOBAL_TAG,)) == (1,)
+
+
+@_fork
+def test_every_worker_sees_every_write_within_a_bounded_delay(tmp_path):
+    backend = cache.MmapVersionBackend(tmp_path / "versions.bin", slots=64)
+    ctx = multiprocessing.get_context("fork")
+    workers = 4
+    seen = ctx.Queue()
+    start = ctx.Event()
+    procs = [ctx.Process(target=_bump_and_watch, args=(backend, workers, seen, start)) for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    start.set()
+    results = [seen.get(timeout=10) for _ in procs]
+    for proc in procs:
+        proc.join(10)
+    assert results == [workers] * workers
+
+
+@_fork
+def test_concurrent_bumps_from_forked_workers_are_not_lost(tmp_path):
+    backend = cache.MmapVersionBackend(tmp_path / "versions.bin", slots=64)
+    ctx = multiprocessing.get_context("fork")
+    start = ctx.Event()
+    procs = [
+        ctx.Process(target=_bump_many, args=(backend, "asignaciones_abonos", 20000, start)) for _ in range(4)
+    ]
+    for proc in procs:
+        proc.start()
+    start.set()
+    for proc in procs:
+        proc.join(30)
+        assert proc.exitcode == 0
+    assert backend.versions(("asignaciones_abonos", cache._GLOBAL_TAG)) == (80000, 80000)
+
+
+@pytest.fixture
+def local_versions(monkeypatch):
+    monkeypatch.setattr(cache, "_backend", cache.LocalVersionBackend())
+
+
+def test_expand_tags_adds_the_table_wildcard():
+    assert cache._expand_tags(("partidos:7", "abonos")) == ("partidos:*", "partidos:7", "abonos")
+
+
+def test_keyed_write_only_invalidates_that_key(local_versions):
+    lru = cache.LRUCache("pruebas-claves")
+    lru.set("7", "partido 7", tags=["partidos:7"])
+    lru.set("8", "partido 8", tags=["partidos:8"])
+    cache.invalidate(["partidos"], keys=[7])
+    assert lru.get("7") is None
+    assert lru.get("8") == "partido 8"
+    cache.invalidate(["partidos"])
+    assert lru.get("8") is None
+
+
+def test_lru_evicts_by_entries_and_bytes(local_versions):
+    lru = cache.LRUCache("pruebas-lru", max_entries=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+    assert (lru.get("a"), lru.get("b"), lru.get("c")) == (1, None, 3)
+    small = cache.LRUCache("pruebas-bytes", max_bytes=cache._approx_size("x" * 100) * 2)
+    small.set("a", "x" * 100)
+    small.set("b", "y" * 100)
+    small.set("c", "z" * 100)
+    assert small.get("a") is None and small.get("c") == "z" * 100
+    small.set("grande", "x" * 1000)
+    assert small.get("grande") is None
+
+
+def test_expired_entry_is_a_miss(local_versions):
+    lru = cache.LRUCache("pruebas-ttl", ttl=0.01)
+    lru.set("a", 1)
+    time.sleep(0.02)
+    assert lru.get("a") is None
+    assert lru.stats()["misses"] == 1
+
+
+def test_concurrent_loads_are_coalesced(local_versions):
+    lru = cache.LRUCache("pruebas-vuelo")
+    calls = []
+    started = threading.Event()
+
+    def loader():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return "valor"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(lru.get_or_set("k", loader))) for _ in range(4)]
+    threads[0].start()
+    started.wait(1)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["valor"] * 4
+    assert len(calls) == 1
+    assert lru.coalesced == 3
+
+
+def test_versions_are_read_outside_the_lock(local_versions, monkeypatch):
+    lru = cache.LRUCache("pruebas-lock")
+    lru.set("k", "v", tags=["partidos:1"])
+    real = cache.cache_version
+    held = []
+
+    def spy(*tags):
+        held.append(lru._lock._is_owned())
+        return real(*tags)
+
+    monkeypatch.setattr(cache, "cache_version", spy)
+    assert lru.get("k") == "v"
+    assert lru.get_or_set("k", lambda: "otro", tags=["partidos:1"]) == "v"
+    assert held and not any(held)
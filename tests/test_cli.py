@@ -0,0 +1,43 @@
+from sqlalchemy import text
+
+from gestion_abonos_app import db
+
+
+def test_verificar_disponibilidad_reports_and_repairs(app, seeded):
+    partido_id = seeded["partidos"][0]
+    with db.engine.begin() as conn:
+        conn.execute(
+            text("UPDATE disponibilidad_partidos SET abonos_asignados = 999 WHERE id_partido = :id"),
+            {"id": partido_id},
+        )
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=["verificar-disponibilidad"])
+    assert result.exit_code == 1
+    assert "999" in result.output
+
+    result = runner.invoke(args=["verificar-disponibilidad", "--reparar"])
+    assert result.exit_code == 0
+    assert runner.invoke(args=["verificar-disponibilidad"]).output.strip() == "Los contadores cuadran."
+
+
+def test_crear_indices_is_idempotent(app):
+    with db.engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS idx_parkings_nombre"))
+    runner = app.test_cli_runner()
+    assert "idx_parkings_nombre" in runner.invoke(args=["crear-indices"]).output
+    assert runner.invoke(args=["crear-indices"]).output.strip() == "No faltaba ningún índice."
+
+
+def test_init_db_seeds_empty_availability_counters(app, seeded):
+    from gestion_abonos_app.services import availability
+
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM disponibilidad_partidos"))
+        conn.execute(text("DELETE FROM totales_recursos"))
+    db.init_db()
+    conn = db.get_connection()
+    try:
+        assert availability.verificar(conn) == []
+    finally:
+        conn.close()
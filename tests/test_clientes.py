@@ -0,0 +1,179 @@
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event, text
+
+from gestion_abonos_app import cache, config, db
+from gestion_abonos_app.blueprints import resources
+
+PREFIX = "zz-plan-"
+BENCH = "zz-bench-"
+
+
+def test_cursor_round_trip():
+    cursor = resources._encode_cursor("martín pérez", 42)
+    assert resources._decode_cursor(cursor) == ("martín pérez", 42)
+
+
+@pytest.mark.parametrize("cursor", [None, "", "no-es-base64!", "bnVsbA==", "WzFd", "WyJhIiwgImIiXQ=="])
+def test_decode_cursor_rejects_garbage(cursor):
+    assert resources._decode_cursor(cursor) is None
+
+
+@pytest.fixture
+def request_ctx(app, seeded, monkeypatch):
+    monkeypatch.setattr(config, "ETAGS_ENABLED", False)
+    with app.test_request_context():
+        yield
+
+
+def _todas_las_paginas(busqueda):
+    clientes, cursor = resources._clientes_pagina(busqueda, None)
+    while cursor:
+        pagina, cursor = resources._clientes_pagina(busqueda, cursor)
+        clientes.extend(pagina)
+    return clientes
+
+
+def test_keyset_pages_cover_every_client_once(request_ctx, seeded):
+    clientes = _todas_las_paginas(PREFIX)
+    assert sorted(c["id"] for c in clientes) == sorted(seeded["clientes"])
+    ordenes = [(c["orden"], c["id"]) for c in clientes]
+    assert ordenes == sorted(ordenes)
+
+
+def test_page_aggregates_upcoming_assignments(request_ctx, seeded):
+    with db.engine.connect() as conn:
+        esperado = {}
+        for cliente, partido, tipo, recurso in conn.execute(
+            text(
+                """
+                SELECT aa.id_cliente, aa.id_partido, 'abono', aa.abono_id
+                FROM asignaciones_abonos aa JOIN partidos p ON p.id = aa.id_partido
+                WHERE p.fecha >= now() AND aa.id_partido = ANY(:ids)
+                UNION ALL
+                SELECT ap.id_cliente, ap.id_partido, 'parking', ap.parking_id
+                FROM asignaciones_parkings ap JOIN partidos p ON p.id = ap.id_partido
+                WHERE p.fecha >= now() AND ap.id_partido = ANY(:ids)
+                """
+            ),
+            {"ids": seeded["partidos"]},
+        ):
+            esperado.setdefault(cliente, {}).setdefault(partido, {"abono": 0, "parking": 0})[tipo] += 1
+
+    obtenido = {}
+    for cliente in _todas_las_paginas(PREFIX):
+        fechas = [partido["fecha"] for partido in cliente["partidos"]]
+        assert fechas == sorted(fechas)
+        for partido in cliente["partidos"]:
+            obtenido.setdefault(cliente["id"], {})[partido["id"]] = {
+                "abono": len(partido["abonos"]),
+                "parking": len(partido["parkings"]),
+            }
+    assert obtenido == esperado
+
+
+@pytest.fixture(scope="module")
+def bench_clientes(seeded):
+    """5000 clientes con un abono cada uno en 20 partidos futuros."""
+    from gestion_abonos_app.services import availability
+
+    now = datetime.now(timezone.utc)
+    with db.engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO clientes (nombre) SELECT :p || g FROM generate_series(1, 5000) g"),
+            {"p": BENCH},
+        )
+        conn.execute(
+            text(
+                """
+                INSERT INTO abonos (sector, puerta, fila, asiento, id_propietario)
+                SELECT 800, 0, 0, c.id, c.id FROM clientes c WHERE c.nombre LIKE :p
+                """
+            ),
+            {"p": f"{BENCH}%"},
+        )
+        partidos = conn.execute(
+            text(
+                """
+                INSERT INTO partidos (rival, fecha, localia, competicion, api_id)
+                SELECT :p || g, :now + g * interval '1 day', 1, 'Liga', :p || g
+                FROM generate_series(1, 20) g
+                RETURNING id
+                """
+            ),
+            {"p": BENCH, "now": now},
+        ).scalars().all()
+        conn.execute(
+            text(
+                """
+                INSERT INTO asignaciones_abonos (id_cliente, id_partido, abono_id, asignador)
+                SELECT a.id_propietario, p.id, a.id, :u
+                FROM abonos a CROSS JOIN unnest(CAST(:ids AS integer[])) AS p(id)
+                WHERE a.sector = 800
+                """
+            ),
+            {"ids": partidos, "u": f"{PREFIX}admin"},
+        )
+        for table in ("clientes", "abonos", "partidos", "asignaciones_abonos"):
+            conn.execute(text(f"ANALYZE {table}"))
+    availability.comprobar(reparar=True)
+    yield partidos
+
+    with db.engine.begin() as conn:
+        for table in ("asignaciones_abonos", "disponibilidad_partidos"):
+            conn.execute(text(f"DELETE FROM {table} WHERE id_partido = ANY(:ids)"), {"ids": partidos})
+        conn.execute(text("DELETE FROM partidos WHERE id = ANY(:ids)"), {"ids": partidos})
+        conn.execute(text("DELETE FROM abonos WHERE sector = 800"))
+        conn.execute(text("DELETE FROM clientes WHERE nombre LIKE :p"), {"p": f"{BENCH}%"})
+    availability.comprobar(reparar=True)
+
+
+def test_benchmark_clientes_page_5k_clients_20_matches(admin_client, bench_clientes, monkeypatch):
+    monkeypatch.setattr(config, "ETAGS_ENABLED", False)
+    with admin_client.application.test_request_context():
+        _rows, cursor = resources._clientes_pagina(BENCH + "25", None)
+    tiempos = {}
+    for nombre, url in (
+        ("primera", f"/clientes?q={BENCH}"),
+        ("búsqueda", f"/clientes?q={BENCH}25"),
+        ("cursor", f"/clientes/pagina?q={BENCH}25&cursor={cursor}"),
+    ):
+        muestras = []
+        for _ in range(5):
+            for lru in cache.caches().values():
+                lru.clear()
+            start = time.perf_counter()
+            response = admin_client.get(url)
+            muestras.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+        tiempos[nombre] = statistics.median(muestras)
+    print("\n/clientes con 5000 clientes x 20 partidos: " + ", ".join(f"{k} {v:.1f} ms" for k, v in tiempos.items()))
+    # Una página son 8 clientes x 20 partidos: no debe depender del total de clientes.
+    assert max(tiempos.values()) < 500
+
+    # Con estadísticas reales el planificador tampoco recorre las tablas grandes.
+    statements = []
+
+    def record(_conn, _cursor, statement, parameters, _context, _executemany):
+        if "WITH pagina" in statement:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        admin_client.get(f"/clientes/pagina?q={BENCH}25&cursor={cursor}")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    (statement, parameters), = statements
+    with db.engine.connect() as conn:
+        plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    scans = {node["Relation Name"] for node in _nodes(plan[0]["Plan"]) if node["Node Type"] == "Seq Scan"}
+    assert not scans & {"clientes", "asignaciones_abonos", "abonos"}, scans
+
+
+def _nodes(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _nodes(child)
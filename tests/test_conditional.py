@@ -0,0 +1,61 @@
+import time
+
+import pytest
+from flask import Flask
+
+from gestion_abonos_app import cache, conditional, config
+
+_pages = cache.LRUCache("pruebas-etag", ttl=0.3)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(config, "ETAGS_ENABLED", True)
+    _pages.clear()
+    renders = []
+
+    app = Flask(__name__)
+    app.secret_key = "pruebas"
+
+    @app.route("/pagina")
+    @conditional.etag("pagina", ("pruebas_etag",))
+    def pagina():
+        def load():
+            renders.append(time.monotonic())
+            return f"render {len(renders)}"
+
+        return _pages.get_or_set("pagina", load, tags=("pruebas_etag",), stale_while_revalidate=True)
+
+    client = app.test_client()
+    client.renders = renders
+    return client
+
+
+def test_matching_etag_answers_304_without_running_the_view(client):
+    first = client.get("/pagina")
+    assert first.headers["ETag"].startswith('W/"')
+    again = client.get("/pagina", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert len(client.renders) == 1
+
+
+def test_write_changes_the_etag(client):
+    first = client.get("/pagina").headers["ETag"]
+    cache.invalidate(["pruebas_etag"])
+    response = client.get("/pagina", headers={"If-None-Match": first})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != first
+
+
+def test_stale_entry_is_served_without_etag(client):
+    assert client.get("/pagina").get_data(as_text=True) == "render 1"
+    time.sleep(0.35)
+    stale = client.get("/pagina")
+    assert stale.get_data(as_text=True) == "render 1"
+    assert "ETag" not in stale.headers
+    deadline = time.monotonic() + 2
+    while (len(client.renders) < 2 or _pages._flights) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    fresh = client.get("/pagina")
+    assert fresh.get_data(as_text=True) == "render 2"
+    assert "ETag" in fresh.headers
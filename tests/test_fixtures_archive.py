@@ -0,0 +1,38 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from gestion_abonos_app import config
+from gestion_abonos_app.services import fixtures_archive
+
+
+def _archive(directory, count, size=0):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    payload = {"relleno": os.urandom(size).hex()} if size else {"response": []}
+    return [fixtures_archive._write(directory, payload, start + timedelta(minutes=i)) for i in range(count)]
+
+
+def test_rotate_keeps_the_newest_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "FIXTURES_ARCHIVE_MAX_FILES", 3)
+    paths = _archive(tmp_path, 5)
+    fixtures_archive._rotate(tmp_path)
+    assert fixtures_archive.archived_files(tmp_path) == paths[-3:]
+
+
+def test_rotate_enforces_the_byte_budget(tmp_path, monkeypatch):
+    paths = _archive(tmp_path, 5, size=4096)
+    size = paths[0].stat().st_size
+    monkeypatch.setattr(config, "FIXTURES_ARCHIVE_MAX_BYTES", size * 2 + size // 2)
+    fixtures_archive._rotate(tmp_path)
+    assert fixtures_archive.archived_files(tmp_path) == paths[-2:]
+
+
+def test_rotate_never_deletes_the_newest_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "FIXTURES_ARCHIVE_MAX_BYTES", 1)
+    paths = _archive(tmp_path, 3)
+    old = time.time() - (config.FIXTURES_ARCHIVE_MAX_AGE_DAYS + 1) * 86400
+    for path in paths:
+        os.utime(path, (old, old))
+    fixtures_archive._rotate(tmp_path)
+    assert fixtures_archive.archived_files(tmp_path) == paths[-1:]
+    assert fixtures_archive.load(tmp_path) == {"response": []}
@@ -0,0 +1,115 @@
+import json
+import threading
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from gestion_abonos_app.services.fixtures_client import FixturesAPIError, FixturesClient
+
+
+class _StubAPI(BaseHTTPRequestHandler):
+    # Cada prueba encola respuestas (estado, cabeceras, cuerpo); se registran las peticiones.
+    responses = []
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append((self.path, dict(self.headers)))
+        status, headers, body = type(self).responses.pop(0)
+        payload = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *_args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    _StubAPI.responses = []
+    _StubAPI.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubAPI)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield _StubAPI, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps():
+    return []
+
+
+@pytest.fixture
+def client(stub, sleeps):
+    _handler, base_url = stub
+    return FixturesClient(base_url, "clave", max_retries=2, backoff_max=8, sleep=sleeps.append)
+
+
+def test_429_honours_the_full_retry_after(stub, client, sleeps):
+    handler, _url = stub
+    handler.responses = [(429, {"Retry-After": "30"}, {}), (200, {}, {"response": [1]})]
+    assert client.get("fixtures", team=530) == {"response": [1]}
+    assert sleeps == [30.0]
+    assert handler.requests[0][1]["x-apisports-key"] == "clave"
+
+
+def test_retry_after_accepts_http_dates(stub, client, sleeps):
+    handler, _url = stub
+    when = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=20), usegmt=True)
+    handler.responses = [(503, {"Retry-After": when}, {}), (200, {}, {"response": []})]
+    client.get("fixtures")
+    assert 15 <= sleeps[0] <= 20
+
+
+def test_retry_after_beyond_the_cap_gives_up(stub, client, sleeps):
+    handler, _url = stub
+    client.retry_after_max = 60
+    handler.responses = [(429, {"Retry-After": "3600"}, {})]
+    with pytest.raises(FixturesAPIError, match="3600"):
+        client.get("fixtures")
+    assert sleeps == [] and len(handler.requests) == 1
+
+
+def test_retry_after_beyond_the_time_budget_gives_up(stub, client, sleeps):
+    handler, _url = stub
+    client.max_total_seconds = 10
+    handler.responses = [(429, {"Retry-After": "30"}, {})]
+    with pytest.raises(FixturesAPIError, match="tiempo máximo"):
+        client.get("fixtures")
+    assert sleeps == []
+
+
+def test_etag_turns_repeat_requests_into_304s(stub, client):
+    handler, _url = stub
+    handler.responses = [(200, {"ETag": '"v1"'}, {"response": ["a"]}), (304, {"ETag": '"v1"'}, None)]
+    assert client.get("fixtures", next=10) == {"response": ["a"]}
+    assert client.get("fixtures", next=10) == {"response": ["a"]}
+    assert handler.requests[1][1]["If-None-Match"] == '"v1"'
+
+
+def test_exhausted_daily_quota_stops_further_calls(stub, client):
+    handler, _url = stub
+    handler.responses = [(200, {"x-ratelimit-requests-remaining": "0"}, {"response": []})]
+    client.get("fixtures")
+    with pytest.raises(FixturesAPIError, match="Cuota diaria"):
+        client.get("fixtures")
+    assert len(handler.requests) == 1
+
+
+def test_exhausted_minute_quota_waits_before_the_next_call(stub, client, sleeps):
+    handler, _url = stub
+    handler.responses = [
+        (200, {"X-RateLimit-Remaining": "0"}, {"response": []}),
+        (200, {"X-RateLimit-Remaining": "9"}, {"response": []}),
+    ]
+    client.get("fixtures")
+    client.get("fixtures")
+    assert len(sleeps) == 1 and 55 < sleeps[0] <= 60
@@ -0,0 +1,11 @@
+from gestion_abonos_app import config
+
+
+def test_server_timing_only_for_admins(app, admin_client, monkeypatch):
+    monkeypatch.setattr(config, "ENABLE_SERVER_TIMING", True)
+    assert "Server-Timing" not in app.test_client().get("/login").headers
+    assert admin_client.get("/").headers["Server-Timing"].startswith("db;dur=")
+
+
+def test_server_timing_is_off_by_default(admin_client):
+    assert "Server-Timing" not in admin_client.get("/").headers
@@ -0,0 +1,91 @@
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from gestion_abonos_app import config, metrics
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "METRICS_DIR", tmp_path)
+    registry = metrics.Registry()
+    registry.counter("peticiones_total", "Peticiones")
+    registry.gauge("en_uso", "Conexiones en uso")
+    return registry
+
+
+def _write(directory, pid, started, requests, in_use, age=0.0):
+    path = directory / f"metrics-{pid}-{int(started * 1000)}.json"
+    path.write_text(
+        json.dumps(
+            {
+                "pid": pid,
+                "started": started,
+                "metrics": {
+                    "peticiones_total": {"type": "counter", "help": "Peticiones", "samples": [[[], requests]]},
+                    "en_uso": {"type": "gauge", "help": "Conexiones en uso", "samples": [[[], in_use]]},
+                },
+            }
+        ),
+        encoding="utf-8",
+    )
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+    return path
+
+
+def _value(exposition, name):
+    line = next(line for line in exposition.splitlines() if line.startswith(name + " "))
+    return float(line.split()[1])
+
+
+def test_default_config_aggregates_through_instance_dir():
+    assert config.METRICS_DIR is not None
+
+
+def test_counters_of_dead_workers_are_kept_but_not_their_gauges(registry, tmp_path):
+    _write(tmp_path, 2**22 + 1, 1.0, 5, 3)  # PID que no existe
+    registry._metrics["peticiones_total"].inc(2)
+    registry._metrics["en_uso"].set(1)
+    exposition = registry.exposition()
+    assert _value(exposition, "peticiones_total") == 7
+    assert _value(exposition, "en_uso") == 1
+
+
+def test_recycled_pid_does_not_overwrite_the_dead_workers_file(registry, tmp_path):
+    pid = os.getppid()  # vivo, pero con otro arranque
+    _write(tmp_path, pid, 1.0, 5, 4)
+    _write(tmp_path, pid, 2.0, 3, 2)
+    exposition = registry.exposition()
+    assert _value(exposition, "peticiones_total") == 8
+    assert _value(exposition, "en_uso") == 2
+
+
+def test_stale_files_of_dead_workers_are_removed(registry, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "METRICS_STALE_SECONDS", 60)
+    stale = _write(tmp_path, 2**22 + 1, 1.0, 5, 3, age=120)
+    recent = _write(tmp_path, 2**22 + 2, 1.0, 1, 3)
+    assert _value(registry.exposition(), "peticiones_total") == 1
+    assert not stale.exists() and recent.exists()
+
+
+def _child(registry):
+    registry._metrics["peticiones_total"].inc(4)
+    registry.flush(force=True)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requiere fork")
+def test_forked_worker_snapshots_are_summed(registry):
+    registry._metrics["peticiones_total"].inc(1)
+    registry.identity()
+    ctx = multiprocessing.get_context("fork")
+    child = ctx.Process(target=_child, args=(registry,))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+    # El hijo no arrastra el contador heredado del padre.
+    assert _value(registry.exposition(), "peticiones_total") == 5
@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from gestion_abonos_app import db
+
+
+def test_partidos_fecha_keeps_the_instant_of_each_writer(app):
+    # La tabla temporal tapa a la real dentro de la conexión y se descarta al terminar.
+    with db.engine.connect() as conn:
+        conn.execute(text("CREATE TEMP TABLE partidos (id INTEGER, fecha TEXT, api_id TEXT)"))
+        conn.execute(
+            text(
+                """
+                INSERT INTO partidos (id, fecha, api_id) VALUES
+                    (1, '2025-08-17 22:30:00', '1001'),
+                    (2, '2025-01-12 22:30:00', '1002'),
+                    (3, '2025-08-17 21:00:00', NULL),
+                    (4, '2025-01-12 21:00:00', NULL),
+                    (5, '', NULL)
+                """
+            )
+        )
+        db._migrate_partidos_fecha(conn)
+        fechas = dict(conn.execute(text("SELECT id, fecha FROM partidos")).all())
+        conn.rollback()
+
+    def utc(*args):
+        return datetime(*args, tzinfo=timezone.utc)
+
+    # Importados: UTC + 1 h fija, también en verano.
+    assert fechas[1] == utc(2025, 8, 17, 21, 30)
+    assert fechas[2] == utc(2025, 1, 12, 21, 30)
+    # Manuales: hora local de Madrid.
+    assert fechas[3] == utc(2025, 8, 17, 19, 0)
+    assert fechas[4] == utc(2025, 1, 12, 20, 0)
+    assert fechas[5] is None
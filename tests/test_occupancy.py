@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta, timezone
+
+from gestion_abonos_app.services.occupancy import OccupancyMatrix, Slot
+
+AHORA = datetime.now(timezone.utc)
+
+
+def _matrix():
+    # Recursos 10, 20 y 30; el partido 1 ya se jugó, el 2 y el 3 están pendientes.
+    partidos = [(1, AHORA - timedelta(days=1)), (2, AHORA + timedelta(days=1)), (3, AHORA + timedelta(days=8))]
+    return OccupancyMatrix([10, 20, 30], partidos, version=(1,))
+
+
+def test_assign_and_release_slots():
+    matrix = _matrix()
+    matrix.asignar(2, 10, 5, "Ana", "admin")
+    matrix.asignar(2, 10, 6, "Luis", "admin")
+    matrix.asignar(2, 20, 5, "Ana", None)
+    assert matrix.slot(10, 2) == Slot(6, "Luis", "admin")
+    assert matrix.slot(20, 2) == Slot(5, "Ana", None)
+    assert matrix.slot(30, 2) is None
+    matrix.liberar(2, 10)
+    matrix.liberar(2, 10)
+    assert matrix.slot(10, 2) is None
+    assert matrix.slot(20, 2) == Slot(5, "Ana", None)
+
+
+def test_unknown_resources_and_matches_are_ignored():
+    matrix = _matrix()
+    matrix.asignar(99, 10, 5, "Ana", "admin")
+    matrix.asignar(2, 99, 5, "Ana", "admin")
+    matrix.liberar(99, 10)
+    assert matrix.slot(10, 2) is None
+    assert matrix.slot(99, 2) is None
+    assert matrix.slot(10, 99) is None
+    assert matrix.uso(99) == 0
+
+
+def test_uso_counts_only_pending_matches():
+    matrix = _matrix()
+    for partido_id in (1, 2, 3):
+        matrix.asignar(partido_id, 30, 5, "Ana", "admin")
+    assert matrix.uso(30) == 2
+    assert matrix.uso(10) == 0
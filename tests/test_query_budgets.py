@@ -0,0 +1,52 @@
+"""Presupuestos de consultas por endpoint: fallan si una página empieza a hacer N+1."""
+import pytest
+
+from gestion_abonos_app import cache, config, db
+
+
+@pytest.fixture
+def client(admin_client, monkeypatch):
+    monkeypatch.setattr(config, "ETAGS_ENABLED", False)
+    for lru in cache.caches().values():
+        lru.clear()
+    return admin_client
+
+
+def test_home_page(client, query_budget):
+    # Usuario de la sesión y la consulta de partidos con sus contadores.
+    with query_budget(2):
+        assert client.get("/").status_code == 200
+    with query_budget(0):
+        assert client.get("/").status_code == 200
+
+
+def test_listar_clientes(client, query_budget):
+    with query_budget(2):
+        assert client.get("/clientes").status_code == 200
+    with query_budget(1):
+        assert client.get("/clientes?q=zz-plan-1").status_code == 200
+
+
+def test_asignar_multiples(client, seeded, query_budget, csrf_token):
+    partido_id = seeded["partidos"][-1]
+    abono_ids = seeded["abonos"][-5:]
+    data = {
+        "_csrf_token": csrf_token,
+        "cliente_id": seeded["clientes"][5],
+        "abono_ids": [str(abono_id) for abono_id in abono_ids],
+        "parking_ids": [str(9_000_050), str(9_000_051)],
+    }
+    # Partido, cliente, dos inserciones en bloque y los contadores: nada por recurso.
+    with query_budget(7):
+        response = client.post(f"/partidos/{partido_id}/asignar", data=data)
+    assert response.status_code == 302
+
+    conn = db.get_connection()
+    try:
+        asignados = conn.execute(
+            "SELECT COUNT(*) AS n FROM asignaciones_abonos WHERE id_partido = ? AND abono_id = ANY(?)",
+            (partido_id, abono_ids),
+        ).fetchone()["n"]
+    finally:
+        conn.close()
+    assert asignados == len(abono_ids)
@@ -0,0 +1,132 @@
+"""EXPLAIN de las consultas que lanzan las páginas más visitadas.
+
+Con ``enable_seqscan = off`` el planificador solo recurre a un Seq Scan si ningún
+índice sirve para la consulta, así que los datos de prueba pueden ser pequeños: un
+Seq Scan en el plan significa que falta (o ya no se usa) un índice.
+"""
+import pytest
+from sqlalchemy import event, text
+
+from gestion_abonos_app import cache, config, db
+from gestion_abonos_app.blueprints import resources
+
+# Tablas de pocas filas que se leen enteras a propósito.
+_FULL_SCAN_OK = {"totales_recursos"}
+
+
+@pytest.fixture
+def client(admin_client, monkeypatch):
+    monkeypatch.setattr(config, "ETAGS_ENABLED", False)
+    for lru in cache.caches().values():
+        lru.clear()
+    return admin_client
+
+
+def _capture(client, url):
+    statements = []
+
+    def record(_conn, _cursor, statement, parameters, _context, _executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    assert response.status_code == 200, url
+    assert statements, url
+    return statements
+
+
+def _nodes(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _nodes(child)
+
+
+def _plans(statements):
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        for statement, parameters in statements:
+            result = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+            yield statement, list(_nodes(result[0]["Plan"]))
+        conn.rollback()
+
+
+def _seq_scans(statements):
+    return [
+        (node["Relation Name"], " ".join(statement.split())[:160])
+        for statement, nodes in _plans(statements)
+        for node in nodes
+        if node["Node Type"] == "Seq Scan" and node["Relation Name"] not in _FULL_SCAN_OK
+    ]
+
+
+def _index_names(statements):
+    return {node.get("Index Name") for _statement, nodes in _plans(statements) for node in nodes} - {None}
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/",
+        "/abonos",
+        "/parkings",
+        "/partidos",
+        "/clientes",
+        "/clientes?q=zz-plan-1",
+    ],
+)
+def test_listing_queries_use_indexes(client, url):
+    assert _seq_scans(_capture(client, url)) == []
+
+
+@pytest.mark.parametrize(
+    "url, index",
+    [("/abonos", "idx_abonos_orden"), ("/parkings", "idx_parkings_nombre")],
+)
+def test_resource_listings_are_read_in_index_order(client, url, index):
+    assert index in _index_names(_capture(client, url))
+
+
+def test_partido_detalle_uses_anti_join_on_primary_keys(client, seeded):
+    statements = _capture(client, f"/partidos/{seeded['partidos'][-1]}")
+    assert _seq_scans(statements) == []
+    indexes = _index_names(statements)
+    assert {"asignaciones_abonos_pkey", "asignaciones_parkings_pkey"} <= indexes
+    assert any(node.get("Join Type") == "Anti" for _statement, nodes in _plans(statements) for node in nodes)
+
+
+def test_clientes_keyset_page_uses_orden_index(client):
+    with client.application.test_request_context():
+        _rows, cursor = resources._clientes_pagina("zz-plan", None)
+    assert cursor
+    statements = _capture(client, f"/clientes/pagina?q=zz-plan&cursor={cursor}")
+    assert _seq_scans(statements) == []
+    assert "idx_clientes_orden" in _index_names(statements)
+
+
+def test_upcoming_matches_range_uses_fecha_index(seeded):
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        plan = conn.execute(
+            text("EXPLAIN (FORMAT JSON) SELECT id FROM partidos WHERE fecha >= now() ORDER BY fecha")
+        ).scalar()
+        conn.rollback()
+    nodes = list(_nodes(plan[0]["Plan"]))
+    assert not any(node["Node Type"] == "Sort" for node in nodes)
+    assert {node.get("Index Name") for node in nodes} & {"idx_partidos_fecha", "idx_partidos_localia_fecha"}
+
+
+@pytest.mark.parametrize(
+    "statement, index",
+    [
+        ("DELETE FROM asignaciones_abonos WHERE abono_id = 1", "idx_asignaciones_abonos_abono"),
+        ("DELETE FROM asignaciones_parkings WHERE parking_id = 1", "idx_asignaciones_parkings_parking"),
+        ("DELETE FROM asignaciones_abonos WHERE id_cliente = 1", "idx_asignaciones_abonos_cliente"),
+        ("DELETE FROM asignaciones_parkings WHERE id_cliente = 1", "idx_asignaciones_parkings_cliente"),
+    ],
+)
+def test_release_paths_use_resource_and_client_indexes(seeded, statement, index):
+    assert index in _index_names([(statement, {})])
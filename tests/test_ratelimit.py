@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+
+import pytest
+
+from gestion_abonos_app import ratelimit
+
+
+def test_slide_allows_up_to_the_limit_then_reports_the_wait():
+    state = None
+    for _ in range(3):
+        state, allowed, wait = ratelimit._slide(state, 100.0, 60, 3)
+        assert allowed and wait is None
+    state, allowed, wait = ratelimit._slide(state, 100.0, 60, 3)
+    assert not allowed
+    assert wait == 20  # la ventana [60, 120) termina en 120
+
+
+def test_slide_weights_the_previous_window():
+    # Al 25 % de la ventana 2, las 4 peticiones de la anterior pesan 3.
+    state = ratelimit._State(window=1, current=4, previous=0)
+    state, allowed, wait = ratelimit._slide(state, 225.0, 100, 2)
+    assert not allowed and state == ratelimit._State(2, 0, 4)
+    # Pesan menos de 2 cuando queda menos de media ventana.
+    assert wait == 25
+    state, allowed, _wait = ratelimit._slide(state, 251.0, 100, 2)
+    assert allowed and state == ratelimit._State(2, 1, 4)
+
+
+def test_slide_forgets_windows_older_than_the_previous_one():
+    state = ratelimit._State(window=1, current=9, previous=9)
+    state, allowed, _wait = ratelimit._slide(state, 500.0, 100, 1)
+    assert allowed and state == ratelimit._State(5, 1, 0)
+
+
+def test_local_backend_sweeps_idle_keys():
+    backend = ratelimit.LocalBackend(sweep_seconds=10)
+    backend.hit("a", 60, 5, 0.0)
+    backend.hit("b", 60, 5, 0.0)
+    assert len(backend) == 2
+    backend.hit("c", 60, 5, 1000.0)
+    assert len(backend) == 1
+
+
+def _hit_many(backend, times, results, start):
+    start.wait()
+    allowed = sum(backend.hit("login:1.2.3.4", 3600, 50, 1000.0)[0] for _ in range(times))
+    results.put(allowed)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requiere fork")
+def test_mmap_backend_enforces_one_limit_across_forked_workers(tmp_path):
+    backend = ratelimit.MmapBackend(tmp_path / "limits.bin", slots=16)
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    start = ctx.Event()
+    procs = [ctx.Process(target=_hit_many, args=(backend, 40, results, start)) for _ in range(4)]
+    for proc in procs:
+        proc.start()
+    start.set()
+    allowed = sum(results.get(timeout=10) for _ in procs)
+    for proc in procs:
+        proc.join(10)
+    assert allowed == 50
+
+
+class _BrokenBackend:
+    def hit(self, *_args):
+        raise OSError("almacén caído")
+
+
+def test_store_errors_fall_back_to_local_counters(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_backend", _BrokenBackend())
+    monkeypatch.setattr(ratelimit, "_fallback", ratelimit.LocalBackend())
+    limiter = ratelimit.RateLimiter("login", 2, 60)
+    assert limiter.hit("1.2.3.4")[0]
+    assert limiter.hit("1.2.3.4")[0]
+    allowed, wait = limiter.hit("1.2.3.4")
+    assert not allowed and wait >= 1
+
+
+def test_database_backend_shares_counters(app):
+    from gestion_abonos_app import db
+
+    backend = ratelimit.DatabaseBackend(db.engine)
+    key = f"pruebas:{os.getpid()}"
+    try:
+        assert [backend.hit(key, 60, 2, 30.0)[0] for _ in range(3)] == [True, True, False]
+        assert ratelimit.DatabaseBackend(db.engine).hit(key, 60, 2, 30.0)[0] is False
+    finally:
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("DELETE FROM rate_limits WHERE clave = %(k)s", {"k": key})
@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+
+from gestion_abonos_app import config, db
+from gestion_abonos_app.services import matches, scheduler as scheduler_module
+from gestion_abonos_app.services.scheduler import SyncScheduler
+
+
+@pytest.fixture
+def sync_row(app):
+    def clear():
+        conn = db.get_connection()
+        conn.execute("DELETE FROM sync_estado WHERE nombre = ?", (scheduler_module._JOB,))
+        conn.commit()
+        conn.close()
+
+    clear()
+    yield
+    clear()
+
+
+def test_lease_is_renewed_while_a_slow_sync_runs(app, sync_row, monkeypatch):
+    monkeypatch.setattr(config, "SYNC_LEASE_SECONDS", 3)
+    in_sync = threading.Event()
+
+    def slow_sync():
+        in_sync.set()
+        time.sleep(5)
+        return True, 7
+
+    monkeypatch.setattr(matches, "sync_upcoming_matches", slow_sync)
+    leader = SyncScheduler()
+    leader.init_app(app, start=False)
+    other = SyncScheduler()
+    other.init_app(app, start=False)
+
+    worker = threading.Thread(target=leader._tick)
+    worker.start()
+    assert in_sync.wait(5)
+    time.sleep(4)  # más que la concesión original
+
+    conn = db.get_connection()
+    try:
+        assert not other._acquire(conn)
+        assert leader.status(conn)["running"]
+    finally:
+        conn.close()
+
+    worker.join()
+    conn = db.get_connection()
+    try:
+        status = leader.status(conn)
+    finally:
+        conn.close()
+    assert status["lider"] == leader.identity
+    assert status["items"] == 7
+    assert not status["running"]
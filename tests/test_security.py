@@ -0,0 +1,148 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from gestion_abonos_app import config
+from gestion_abonos_app.auth import security
+
+
+def test_parse_versioned_and_legacy_hashes():
+    assert security._parse("pbkdf2_sha256$1000$abc=") == (1000, "abc=")
+    assert security._parse("abc=") == (security.LEGACY_ITERATIONS, "abc=")
+
+
+def test_needs_rehash():
+    current = f"pbkdf2_sha256${security.PBKDF2_ITERATIONS}$abc="
+    assert not security.needs_rehash(current)
+    assert security.needs_rehash("abc=")
+    assert security.needs_rehash(f"pbkdf2_sha256${security.PBKDF2_ITERATIONS + 1}$abc=")
+    assert security.needs_rehash("pbkdf2_sha256$muchas$abc=")
+
+
+def test_hash_and_verify_inline(monkeypatch):
+    monkeypatch.setattr(config, "PASSWORD_HASH_WORKERS", 0)
+    monkeypatch.setattr(security, "PBKDF2_ITERATIONS", 1000)
+    password_hash, salt = security.hash_password("secreta")
+    assert password_hash.startswith("pbkdf2_sha256$1000$")
+    assert security.verify_password("secreta", password_hash, salt)
+    assert not security.verify_password("otra", password_hash, salt)
+    assert not security.verify_password("secreta", "pbkdf2_sha256$x$y", salt)
+
+
+def test_timed_out_work_keeps_its_slot_until_it_finishes(monkeypatch):
+    monkeypatch.setattr(security, "_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(config, "PASSWORD_HASH_TIMEOUT_SECONDS", 0.05)
+    salt = b"0" * 16
+    security._get_pool().submit(security._derive, "calentar", salt, 1).result(timeout=30)
+
+    with pytest.raises(security.HasherBusy, match="tardado"):
+        security._run_derive("lenta", salt, 3_000_000)
+    # El PBKDF2 abandonado sigue en marcha: no debe admitirse otro trabajo todavía.
+    with pytest.raises(security.HasherBusy, match="Demasiadas"):
+        security._run_derive("otra", salt, 1)
+
+    deadline = time.monotonic() + 30
+    while not security._slots.acquire(blocking=False):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    security._slots.release()
+
+
+
+def _kill_workers(pool):
+    for pid in list(pool._processes):
+        os.kill(pid, signal.SIGKILL)
+
+
+def test_dead_worker_is_replaced_by_a_new_pool(monkeypatch):
+    monkeypatch.setattr(config, "PASSWORD_HASH_WORKERS", 1)
+    salt = b"0" * 16
+    expected = security._derive("secreta", salt, 1000)
+    pool = security._get_pool()
+    assert security._run_derive("secreta", salt, 1000) == expected
+    _kill_workers(pool)
+    time.sleep(0.2)
+    assert security._run_derive("secreta", salt, 1000) == expected
+    assert security._get_pool() is not pool
+
+
+def test_worker_killed_mid_hash_is_retried(monkeypatch):
+    monkeypatch.setattr(config, "PASSWORD_HASH_WORKERS", 1)
+    salt = b"0" * 16
+    pool = security._get_pool()
+    pool.submit(security._derive, "calentar", salt, 1).result(timeout=30)
+    result = []
+    worker = threading.Thread(target=lambda: result.append(security._run_derive("lenta", salt, 2_000_000)))
+    worker.start()
+    time.sleep(0.2)
+    _kill_workers(pool)
+    worker.join(30)
+    assert security._get_pool() is not pool
+    assert result == [security._derive("lenta", salt, 2_000_000)]
+
+
+
+
+def test_benchmark_concurrent_logins(monkeypatch):
+    iterations = 50_000
+    monkeypatch.setattr(config, "PASSWORD_HASH_WORKERS", 0)
+    monkeypatch.setattr(security, "PBKDF2_ITERATIONS", iterations)
+    password_hash, salt = security.hash_password("secreta")
+    hilos, por_hilo = 4, 10
+
+    def logins_por_segundo(workers):
+        monkeypatch.setattr(config, "PASSWORD_HASH_WORKERS", workers)
+        monkeypatch.setattr(security, "_slots", threading.BoundedSemaphore(hilos))
+        if workers:
+            security._get_pool().submit(security._derive, "calentar", b"0" * 16, 1).result(timeout=30)
+        barrier = threading.Barrier(hilos + 1)
+        fallos = []
+
+        def login():
+            barrier.wait()
+            for _ in range(por_hilo):
+                if not security.verify_password("secreta", password_hash, salt):
+                    fallos.append(1)
+
+        threads = [threading.Thread(target=login) for _ in range(hilos)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        assert not fallos
+        return hilos * por_hilo / (time.perf_counter() - start)
+
+    inline = logins_por_segundo(0)
+    pool = logins_por_segundo(config.PASSWORD_HASH_WORKERS or 2)
+    print(f"\nlogins por segundo ({hilos} hilos, {iterations} iteraciones): en línea {inline:.0f}, pool {pool:.0f}")
+    assert inline > 0 and pool > 0
+
+
+def test_saturated_pool_rejects_instead_of_blocking(monkeypatch):
+    monkeypatch.setattr(config, "PASSWORD_HASH_WORKERS", 1)
+    monkeypatch.setattr(security, "_slots", threading.BoundedSemaphore(2))
+    salt = b"0" * 16
+    security._get_pool().submit(security._derive, "calentar", salt, 1).result(timeout=30)
+    barrier = threading.Barrier(8)
+    rechazos = []
+
+    def login():
+        barrier.wait()
+        start = time.perf_counter()
+        try:
+            security._run_derive("secreta", salt, 300_000)
+        except security.HasherBusy:
+            rechazos.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=login) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    assert len(rechazos) == 6
+    assert max(rechazos) < 0.1
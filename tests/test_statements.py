@@ -0,0 +1,48 @@
+import timeit
+
+from gestion_abonos_app import db
+
+_SELECT = "SELECT id, nombre FROM clientes WHERE nombre ILIKE ? AND id > ? ORDER BY id LIMIT ?"
+_UPDATE = "UPDATE asignaciones_abonos SET id_cliente = ? WHERE id_partido = ? AND abono_id = ?"
+
+
+def test_compiled_statement_is_reused():
+    first = db._compile_statement(_SELECT)
+    assert db._compile_statement(_SELECT) is first
+    assert first.param_names == ("p1", "p2", "p3")
+    assert str(first.clause) == (
+        "SELECT id, nombre FROM clientes WHERE nombre ILIKE :p1 AND id > :p2 ORDER BY id LIMIT :p3"
+    )
+    assert not first.is_write and first.write_target is None
+
+
+def test_write_target_is_precomputed():
+    compiled = db._compile_statement(_UPDATE)
+    assert compiled.is_write
+    assert compiled.write_target == ("asignaciones_abonos", (1,))
+    insert = db._compile_statement("INSERT INTO partidos (id, rival) VALUES (?, ?), (?, ?)")
+    assert insert.write_target == ("partidos", (0, 2))
+
+
+def test_bind_only_zips_parameters():
+    clause, bound = db._prepare_statement(_UPDATE, (7, 3, 11))
+    assert clause is db._compile_statement(_UPDATE).clause
+    assert bound == {"p1": 7, "p2": 3, "p3": 11}
+
+
+def test_cached_prepare_is_cheaper_than_recompiling():
+    # Micro-benchmark: preparar con el registro frente a recompilar en cada llamada.
+    compile_uncached = db._compile_statement.__wrapped__
+    params = (7, 3, 11)
+
+    def uncached():
+        db._bind(compile_uncached(_UPDATE), _UPDATE, params)
+
+    def cached():
+        db._prepare_statement(_UPDATE, params)
+
+    number = 2000
+    before = min(timeit.repeat(uncached, number=number, repeat=5))
+    after = min(timeit.repeat(cached, number=number, repeat=5))
+    print(f"\nprepare: {before / number * 1e6:.1f} µs -> {after / number * 1e6:.1f} µs por llamada")
+    assert after * 3 < before